@@ -0,0 +1,73 @@
+"""
+Compare two benchmark result files written by benchmarks.run, metric by metric.
+Run from the src/ directory:
+
+    python -m benchmarks.compare ../bench-old.json ../bench-new.json
+"""
+import json
+import argparse
+from typing import Dict, List, Optional
+
+# Metrics where a larger value is better; for all others (times, latencies) smaller is better
+HIGHER_IS_BETTER = ("_per_s", "qps")
+
+def flatten(results: Dict, prefix: str = "") -> Dict[str, float]:
+    """
+    Flatten nested results into "benchmark.row.metric" keys. Rows of a list
+    are keyed by their "name".
+    """
+    flat: Dict[str, float] = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, path + "."))
+        elif isinstance(value, list):
+            for row in value:
+                if isinstance(row, dict) and "name" in row:
+                    flat.update(flatten({k: v for k, v in row.items() if k != "name"}, f"{path}.{row['name']}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = float(value)
+    return flat
+
+def compare(old: Dict, new: Dict) -> List[Dict]:
+    """
+    Return one row per metric present in both reports, with the relative
+    change and whether it is an improvement.
+    """
+    before, after = flatten(old["results"]), flatten(new["results"])
+    rows = []
+    for key in sorted(before.keys() & after.keys()):
+        a, b = before[key], after[key]
+        change = (b - a) / a if a else 0.0
+        higher_better = key.endswith(HIGHER_IS_BETTER)
+        rows.append({
+            "metric": key,
+            "old": a,
+            "new": b,
+            "change": round(change, 4),
+            "better": change > 0 if higher_better else change < 0,
+        })
+    return rows
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("old", help="Baseline results file")
+    parser.add_argument("new", help="Results file to compare against the baseline")
+    parser.add_argument("--threshold", type=float, default=0.05,
+                        help="Only show metrics that changed by at least this fraction")
+    args = parser.parse_args(argv)
+
+    with open(args.old, "r", encoding="utf-8") as f:
+        old = json.load(f)
+    with open(args.new, "r", encoding="utf-8") as f:
+        new = json.load(f)
+
+    print(f"{(old.get('commit') or '?')[:10]} -> {(new.get('commit') or '?')[:10]}")
+    for row in compare(old, new):
+        if abs(row["change"]) < args.threshold:
+            continue
+        verdict = "better" if row["better"] else "worse"
+        print(f"{row['metric']:<55} {row['old']:>12.3f} {row['new']:>12.3f} {row['change']:>+8.1%}  {verdict}")
+
+if __name__ == "__main__":
+    main()
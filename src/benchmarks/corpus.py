@@ -0,0 +1,93 @@
+"""
+Synthetic corpus generator: scales noterms.md-style markdown to any number of sections.
+
+Titles and sentences are drawn from a template document, so sections look like
+the real terms (a '**Title**' line followed by paragraphs and bullet points),
+and each section gets a clause number so that no two sections are identical.
+Run from the src/ directory:
+
+    python -m benchmarks.corpus --sections 100000 --out /tmp/corpus.md
+"""
+import os
+import re
+import random
+import argparse
+from typing import Iterator, List, Optional, Tuple
+
+DEFAULT_TEMPLATE = os.path.join(os.path.dirname(__file__), "..", "..", "noterms.md")
+
+def load_template(path: str = DEFAULT_TEMPLATE) -> Tuple[List[str], List[str]]:
+    """
+    Read the titles and the sentences of a markdown document.
+
+    Returns:
+        The '**Title**' lines (without the asterisks), and the sentences of all other lines
+    """
+    titles, sentences = [], []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("**") and line.endswith("**"):
+                titles.append(line.replace("**", ""))
+            else:
+                line = line.lstrip("* ").strip()
+                sentences.extend(s for s in re.split(r"(?<=[.;])\s+", line) if len(s) > 20)
+    if not titles:
+        titles = ["Introduction"]
+    if not sentences:
+        raise ValueError(f"No sentences found in {path}")
+    return titles, sentences
+
+def generate_lines(num_sections: int,
+                   template_path: str = DEFAULT_TEMPLATE,
+                   sections_per_title: int = 8,
+                   seed: int = 0) -> Iterator[str]:
+    """
+    Yield the lines of a markdown document with `num_sections` sections (as
+    split by TermsSearchEngine: one per non-empty, non-title line).
+
+    Args:
+        num_sections: Number of sections to generate
+        template_path: Document to draw titles and sentences from
+        sections_per_title: Sections under each '**Title**' line
+        seed: Random seed, so a corpus can be regenerated exactly
+    """
+    titles, sentences = load_template(template_path)
+    rng = random.Random(seed)
+    for i in range(num_sections):
+        if i % sections_per_title == 0:
+            if i:
+                yield ""
+            yield f"**{rng.choice(titles)} ({i // sections_per_title + 1})**"
+            yield ""
+        body = " ".join(rng.sample(sentences, k=min(len(sentences), rng.randint(1, 3))))
+        prefix = "*   " if rng.random() < 0.3 else ""
+        yield f"{prefix}Clause {i + 1}: {body}"
+
+def generate_markdown(num_sections: int, **kwargs) -> str:
+    """
+    Return a generated document as one string (see generate_lines).
+    """
+    return "\n".join(generate_lines(num_sections, **kwargs)) + "\n"
+
+def write_corpus(path: str, num_sections: int, **kwargs) -> None:
+    """
+    Stream a generated document to `path` (see generate_lines).
+    """
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        for line in generate_lines(num_sections, **kwargs):
+            f.write(line + "\n")
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sections", type=int, default=10000, help="Number of sections")
+    parser.add_argument("--out", required=True, help="Output markdown file")
+    parser.add_argument("--template", default=DEFAULT_TEMPLATE, help="Document to draw titles and sentences from")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args(argv)
+    write_corpus(args.out, args.sections, template_path=args.template, seed=args.seed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Local stand-in for the llama.cpp server's /embedding and /health API, with
+configurable latency, for benchmarking without a model. Run from the src/ directory:
+
+    python -m benchmarks.fake_llama --port 8081 --latency-ms 5 --per-text-ms 0.2 --slots 4
+
+Then point the server at it with EMBEDDING_API_URL=http://127.0.0.1:8081.
+"""
+import time
+import asyncio
+import hashlib
+import argparse
+import threading
+import numpy as np
+import uvicorn
+from typing import List, Optional
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+def embed(texts: List[str], dimension: int) -> np.ndarray:
+    """
+    Deterministic unit vectors seeded by a hash of each text.
+    """
+    vectors = np.empty((len(texts), dimension), dtype=np.float32)
+    for i, text in enumerate(texts):
+        seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+        vectors[i] = np.random.default_rng(seed).standard_normal(dimension)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+def create_app(dimension: int = 384,
+               latency_ms: float = 5.0,
+               per_text_ms: float = 0.0,
+               slots: int = 4) -> FastAPI:
+    """
+    Create the stand-in server.
+
+    Args:
+        dimension: Embedding dimension
+        latency_ms: Fixed time each /embedding request takes
+        per_text_ms: Additional time per text in the request
+        slots: Requests processed at once, like llama.cpp's parallel slots (0 for no limit)
+    """
+    app = FastAPI(title="llama.cpp embedding stand-in")
+    semaphore = asyncio.Semaphore(slots) if slots > 0 else None
+    app.state.requests = 0
+    app.state.texts = 0
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    @app.post("/embedding")
+    async def embedding(request: Request):
+        """
+        Answer a single text with {"embedding": [...]}, and a list of texts with
+        one {"index": i, "embedding": [...]} entry per text, like llama.cpp.
+        """
+        data = await request.json()
+        content = data.get("content")
+        texts = content if isinstance(content, list) else [content]
+        if not texts or not all(isinstance(t, str) for t in texts):
+            return JSONResponse(status_code=400, content={"error": "content must be a string or a list of strings"})
+
+        app.state.requests += 1
+        app.state.texts += len(texts)
+        delay = (latency_ms + per_text_ms * len(texts)) / 1000
+        if semaphore is not None:
+            async with semaphore:
+                await asyncio.sleep(delay)
+        else:
+            await asyncio.sleep(delay)
+
+        vectors = embed(texts, dimension).tolist()
+        if not isinstance(content, list):
+            return {"embedding": vectors[0]}
+        return [{"index": i, "embedding": vec} for i, vec in enumerate(vectors)]
+
+    return app
+
+class BackgroundServer:
+    """
+    Runs the stand-in on a background thread of the current process.
+    """
+    def __init__(self, port: int, host: str = "127.0.0.1", **kwargs):
+        """
+        Args:
+            port: Port to listen on
+            host: Interface to listen on
+            kwargs: Passed to create_app
+        """
+        self.app = create_app(**kwargs)
+        self.url = f"http://{host}:{port}"
+        self._server = uvicorn.Server(uvicorn.Config(self.app, host=host, port=port, log_level="warning"))
+        self._thread = threading.Thread(target=self._server.run, name="fake-llama", daemon=True)
+
+    def start(self, timeout: float = 10.0) -> "BackgroundServer":
+        self._thread.start()
+        deadline = time.monotonic() + timeout
+        while not self._server.started:
+            if time.monotonic() > deadline or not self._thread.is_alive():
+                raise RuntimeError(f"Embedding stand-in did not start on {self.url}")
+            time.sleep(0.05)
+        return self
+
+    def stop(self) -> None:
+        self._server.should_exit = True
+        self._thread.join()
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=8081, help="Port to listen on")
+    parser.add_argument("--dimension", type=int, default=384, help="Embedding dimension")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Fixed time per request")
+    parser.add_argument("--per-text-ms", type=float, default=0.0, help="Additional time per text")
+    parser.add_argument("--slots", type=int, default=4, help="Requests processed at once (0 for no limit)")
+    args = parser.parse_args(argv)
+
+    app = create_app(args.dimension, args.latency_ms, args.per_text_ms, args.slots)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+"""
+Benchmark suite: section splitting, embedding providers, index creation,
+multi-file ingestion, search QPS and end-to-end /search latency under
+concurrent load.
+
+Embeddings come from FakeEmbeddings and from a local stand-in for the
+llama.cpp server (benchmarks.fake_llama), so no model is needed. Results are
+written as JSON, with the git commit they were measured at; compare two runs
+with benchmarks.compare. Run from the src/ directory:
+
+    python -m benchmarks.run --out ../bench-$(git rev-parse --short HEAD).json
+    python -m benchmarks.run --only split,search --sections 50000
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+import threading
+import httpx
+import numpy as np
+from typing import Callable, Dict, List, Optional, Sequence
+
+from benchmarks.corpus import generate_markdown, load_template, write_corpus
+from benchmarks.fake_llama import BackgroundServer
+from embeddings.base import EmbeddingsBase
+from embeddings.batching import MicroBatchingEmbeddings
+from embeddings.cache import CachedEmbeddings
+from embeddings.fake import FakeEmbeddings
+from embeddings.llama import LlamaEmbeddings
+from search.index_report import synthetic_embeddings
+from search.terms_search_engine import TermsSearchEngine
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+BENCHMARKS = ("split", "encode", "create_index", "ingest", "search", "e2e")
+
+def latency_stats(latencies_s: Sequence[float]) -> Dict[str, float]:
+    """
+    p50/p90/p99 and mean of a list of durations in seconds, in milliseconds.
+    """
+    ms = np.asarray(latencies_s, dtype=np.float64) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p90_ms": round(float(np.percentile(ms, 90)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+    }
+
+def make_queries(num_queries: int, seed: int = 1) -> List[str]:
+    """
+    Short phrases cut from the template document's sentences.
+    """
+    _, sentences = load_template()
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(num_queries):
+        words = rng.choice(sentences).split()
+        size = min(len(words), rng.randint(3, 8))
+        start = rng.randint(0, len(words) - size)
+        queries.append(" ".join(words[start:start + size]))
+    return queries
+
+def new_engine(cache_dir: str, dimension: int, **kwargs) -> TermsSearchEngine:
+    """
+    An engine over FakeEmbeddings, without embedding or query caches.
+    """
+    return TermsSearchEngine(
+        cache_dir=cache_dir,
+        embedding_model=FakeEmbeddings(dimension),
+        embedding_cache=False,
+        query_cache_size=0,
+        **kwargs
+    )
+
+def bench_split(text: str, cache_dir: str, dimension: int, repeat: int = 5) -> Dict:
+    """
+    Time TermsSearchEngine._split_into_sections over the corpus (best of `repeat`).
+    """
+    engine = new_engine(cache_dir, dimension)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        sections = engine._split_into_sections(text)
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    return {
+        "sections": len(sections),
+        "seconds": round(best, 4),
+        "sections_per_s": round(len(sections) / best, 1),
+        "mb_per_s": round(len(text.encode("utf-8")) / best / 1e6, 2),
+    }
+
+def _encode_row(name: str, model: EmbeddingsBase, texts: List[str]) -> Dict:
+    start = time.perf_counter()
+    model.encode(texts)
+    seconds = time.perf_counter() - start
+    return {"name": name, "texts": len(texts), "seconds": round(seconds, 4), "texts_per_s": round(len(texts) / seconds, 1)}
+
+def _concurrent_row(name: str, model: EmbeddingsBase, queries: List[str], threads: int) -> Dict:
+    """
+    Encode one query per call from `threads` threads at once, as concurrent searches do.
+    """
+    latencies: List[float] = []
+    lock = threading.Lock()
+    shares = [queries[i::threads] for i in range(threads)]
+
+    def worker(share: List[str]) -> None:
+        for query in share:
+            start = time.perf_counter()
+            model.encode([query])
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    workers = [threading.Thread(target=worker, args=(share,)) for share in shares]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    seconds = time.perf_counter() - start
+    return {"name": name, "calls": len(queries), "threads": threads,
+            "calls_per_s": round(len(queries) / seconds, 1), **latency_stats(latencies)}
+
+def bench_encode(texts: List[str], queries: List[str], llama_url: str, cache_dir: str,
+                 dimension: int, threads: int = 32) -> List[Dict]:
+    """
+    Bulk encode throughput of each provider, and single-query encode latency,
+    sequential and from concurrent threads (with and without micro-batching).
+    """
+    rows = [_encode_row("fake.bulk", FakeEmbeddings(dimension), texts)]
+
+    llama = LlamaEmbeddings(llama_url, batch_size=32, max_concurrency=4)
+    rows.append(_encode_row("llama.bulk", llama, texts))
+
+    cached = CachedEmbeddings(FakeEmbeddings(dimension), cache_dir=cache_dir, dimension=dimension,
+                              max_memory_entries=len(texts), persist=False)
+    cached.encode(texts)
+    rows.append(_encode_row("cached.bulk_warm", cached, texts))
+
+    latencies = []
+    for query in queries[:200]:
+        start = time.perf_counter()
+        llama.encode([query])
+        latencies.append(time.perf_counter() - start)
+    rows.append({"name": "llama.single", "calls": len(latencies), **latency_stats(latencies)})
+
+    rows.append(_concurrent_row("llama.concurrent", llama, queries, threads))
+    batching = MicroBatchingEmbeddings(llama, max_wait=0.002, max_batch_size=64, max_concurrency=4)
+    rows.append(_concurrent_row("llama.concurrent_microbatched", batching, queries, threads))
+    batching.close()
+    return rows
+
+def bench_create_index(num_sections: int, cache_dir: str, dimension: int, index_types: Sequence[str]) -> List[Dict]:
+    """
+    Time TermsSearchEngine._create_index (train and add) for each index type.
+    """
+    vectors = synthetic_embeddings(num_sections, dimension)
+    ids = list(range(num_sections))
+    rows = []
+    for index_type in index_types:
+        engine = new_engine(cache_dir, dimension, index_type=index_type)
+        start = time.perf_counter()
+        engine._create_index(vectors.copy(), ids)
+        seconds = time.perf_counter() - start
+        rows.append({"name": index_type, "sections": num_sections, "seconds": round(seconds, 4),
+                     "sections_per_s": round(num_sections / seconds, 1)})
+    return rows
+
+def bench_ingest(num_sections: int, num_files: int, cache_dir: str, dimension: int) -> List[Dict]:
+    """
+    Time saved-index builds of a corpus split over `num_files` files: build_index
+    over all of them concatenated, and build_corpus over the files with one
+    worker process and with one per CPU.
+    """
+    corpus_dir = tempfile.mkdtemp(prefix="rag-bench-corpus-")
+    try:
+        paths = [os.path.join(corpus_dir, f"doc{i:04d}.md") for i in range(num_files)]
+        for i, path in enumerate(paths):
+            write_corpus(path, num_sections // num_files, seed=i)
+        combined = os.path.join(corpus_dir, "combined.md")
+        with open(combined, "w", encoding="utf-8", newline="\n") as out:
+            for path in paths:
+                with open(path, "r", encoding="utf-8", newline="\n") as f:
+                    shutil.copyfileobj(f, out)
+
+        builds = [
+            ("build_index", lambda engine: engine.build_index(combined)),
+            ("build_corpus.1proc", lambda engine: engine.build_corpus(paths, processes=1)),
+            ("build_corpus", lambda engine: engine.build_corpus(paths)),
+        ]
+        rows = []
+        for name, build in builds:
+            engine = new_engine(os.path.join(cache_dir, f"ingest-{name}"), dimension, index_type="flat")
+            start = time.perf_counter()
+            build(engine)
+            seconds = time.perf_counter() - start
+            rows.append({"name": name, "files": num_files, "sections": len(engine.sections),
+                         "seconds": round(seconds, 4), "sections_per_s": round(len(engine.sections) / seconds, 1)})
+        return rows
+    finally:
+        shutil.rmtree(corpus_dir, ignore_errors=True)
+
+def bench_search(text: str, queries: List[str], cache_dir: str, dimension: int,
+                 index_types: Sequence[str], k: int = 5, batch_size: int = 32) -> List[Dict]:
+    """
+    Search QPS over the corpus for each index type: one query per search call,
+    and `batch_size` queries per search_many call. Query caches are off.
+    """
+    rows = []
+    for index_type in index_types:
+        engine = new_engine(cache_dir, dimension, index_type=index_type)
+        engine.process_text(text)
+
+        latencies = []
+        start = time.perf_counter()
+        for query in queries:
+            query_start = time.perf_counter()
+            engine.search(query, k=k)
+            latencies.append(time.perf_counter() - query_start)
+        single_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for i in range(0, len(queries), batch_size):
+            engine.search_many(queries[i:i + batch_size], k=k)
+        batch_s = time.perf_counter() - start
+
+        rows.append({
+            "name": index_type,
+            "sections": len(engine.sections),
+            "queries": len(queries),
+            "qps": round(len(queries) / single_s, 1),
+            "batch_qps": round(len(queries) / batch_s, 1),
+            **latency_stats(latencies),
+        })
+    return rows
+
+async def _load(url: str, queries: List[str], concurrency: int) -> Dict:
+    """
+    POST every query to /search from `concurrency` concurrent clients.
+    """
+    latencies: List[float] = []
+    errors = 0
+    pending = iter(queries)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+        async def client_loop() -> None:
+            nonlocal errors
+            for query in pending:
+                start = time.perf_counter()
+                try:
+                    response = await client.post("/search", json={"query": query})
+                    ok = response.status_code == 200 and response.json().get("success")
+                except httpx.HTTPError:
+                    ok = False
+                latencies.append(time.perf_counter() - start)
+                errors += 0 if ok else 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+        seconds = time.perf_counter() - start
+
+    return {"requests": len(queries), "concurrency": concurrency, "errors": errors,
+            "qps": round(len(queries) / seconds, 1), **latency_stats(latencies)}
+
+def bench_e2e(num_sections: int, queries: List[str], llama_url: str, concurrency: int,
+              workers: int = 1, port: int = 8790, timeout: float = 300.0) -> Dict:
+    """
+    Start the server (src/main.py) on a generated corpus with the llama.cpp
+    stand-in, wait until /readyz, then measure /search under concurrent load.
+    The server runs in a scratch directory, so the repository's cache/ is untouched.
+    """
+    workdir = tempfile.mkdtemp(prefix="rag-bench-")
+    try:
+        for name in ("src", "static", "examples"):
+            os.symlink(os.path.join(REPO_ROOT, name), os.path.join(workdir, name))
+        write_corpus(os.path.join(workdir, "noterms.md"), num_sections)
+
+        env = dict(os.environ,
+                   HOST="127.0.0.1",
+                   PORT=str(port),
+                   WORKERS=str(workers),
+                   EMBEDDING_PROVIDER="llama",
+                   EMBEDDING_API_URL=llama_url,
+                   TRANSCRIBER="fake",
+                   LOG_LEVEL="WARNING")
+        url = f"http://127.0.0.1:{port}"
+        with open(os.path.join(workdir, "server.log"), "wb") as log:
+            server = subprocess.Popen([sys.executable, os.path.join("src", "main.py")], cwd=workdir, env=env,
+                                      stdout=log, stderr=subprocess.STDOUT)
+        try:
+            start = time.perf_counter()
+            while True:
+                if server.poll() is not None:
+                    raise RuntimeError(f"Server exited with code {server.returncode}, see {workdir}/server.log")
+                if time.perf_counter() - start > timeout:
+                    raise RuntimeError(f"Server not ready after {timeout}s")
+                try:
+                    if httpx.get(f"{url}/readyz", timeout=2).status_code == 200:
+                        break
+                except httpx.HTTPError:
+                    pass
+                time.sleep(0.2)
+            ready_s = time.perf_counter() - start
+
+            # Warm up connections and code paths with queries outside the measured set
+            asyncio.run(_load(url, [f"warm up {i}" for i in range(concurrency)], concurrency))
+            result = asyncio.run(_load(url, queries, concurrency))
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+        return {"sections": num_sections, "workers": workers, "ready_s": round(ready_s, 2), **result}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def git_commit() -> Dict[str, Optional[str]]:
+    """
+    The commit being measured, and whether the working tree had changes.
+    """
+    def git(*args: str) -> Optional[str]:
+        try:
+            return subprocess.run(["git", *args], cwd=REPO_ROOT, capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    status = git("status", "--porcelain", "--untracked-files=no")
+    return {"commit": git("rev-parse", "HEAD"), "dirty": None if status is None else bool(status)}
+
+def run(args: argparse.Namespace) -> Dict:
+    """
+    Run the selected benchmarks and return the results document.
+    """
+    only = args.only.split(",")
+    unknown = set(only) - set(BENCHMARKS)
+    if unknown:
+        raise SystemExit(f"Unknown benchmarks: {', '.join(sorted(unknown))}; expected {', '.join(BENCHMARKS)}")
+    index_types = args.types.split(",")
+
+    text = generate_markdown(args.sections)
+    queries = make_queries(args.queries)
+    results: Dict[str, object] = {}
+    cache_dir = tempfile.mkdtemp(prefix="rag-bench-cache-")
+    llama = BackgroundServer(args.llama_port, dimension=args.dimension, latency_ms=args.llama_latency_ms,
+                             per_text_ms=args.llama_per_text_ms, slots=args.llama_slots)
+    needs_llama = "encode" in only or "e2e" in only
+    if needs_llama:
+        llama.start()
+    try:
+        steps: Dict[str, Callable[[], object]] = {
+            "split": lambda: bench_split(text, cache_dir, args.dimension),
+            "encode": lambda: bench_encode(text.splitlines()[:args.encode_texts], queries, llama.url, cache_dir,
+                                           args.dimension, threads=args.concurrency),
+            "create_index": lambda: bench_create_index(args.sections, cache_dir, args.dimension, index_types),
+            "ingest": lambda: bench_ingest(args.sections, args.ingest_files, cache_dir, args.dimension),
+            "search": lambda: bench_search(text, queries, cache_dir, args.dimension, index_types, k=args.k),
+            "e2e": lambda: bench_e2e(args.e2e_sections, queries, llama.url, args.concurrency,
+                                     workers=args.workers, port=args.port),
+        }
+        for name in BENCHMARKS:
+            if name in only:
+                print(f"Running {name}...", file=sys.stderr)
+                results[name] = steps[name]()
+    finally:
+        if needs_llama:
+            llama.stop()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    return {
+        **git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": vars(args),
+        "results": results,
+    }
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", default=",".join(BENCHMARKS), help="Comma-separated benchmarks to run")
+    parser.add_argument("--sections", type=int, default=20000, help="Corpus sections for split, create_index and search")
+    parser.add_argument("--queries", type=int, default=1000, help="Number of distinct queries")
+    parser.add_argument("--dimension", type=int, default=384, help="Embedding dimension")
+    parser.add_argument("--k", type=int, default=5, help="Matches per search")
+    parser.add_argument("--types", default="flat,hnsw,ivf", help="Comma-separated index types")
+    parser.add_argument("--encode-texts", type=int, default=2000, help="Texts per bulk encode")
+    parser.add_argument("--ingest-files", type=int, default=16, help="Files the ingest benchmark splits the corpus over")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent clients (encode and e2e)")
+    parser.add_argument("--e2e-sections", type=int, default=5000, help="Corpus sections served in the e2e benchmark")
+    parser.add_argument("--workers", type=int, default=1, help="Server processes in the e2e benchmark")
+    parser.add_argument("--port", type=int, default=8790, help="Server port in the e2e benchmark")
+    parser.add_argument("--llama-port", type=int, default=8791, help="Port of the llama.cpp stand-in")
+    parser.add_argument("--llama-latency-ms", type=float, default=5.0, help="Stand-in time per request")
+    parser.add_argument("--llama-per-text-ms", type=float, default=0.05, help="Stand-in time per text")
+    parser.add_argument("--llama-slots", type=int, default=4, help="Stand-in requests processed at once")
+    parser.add_argument("--out", help="Write the JSON results here instead of to stdout")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.out}", file=sys.stderr)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
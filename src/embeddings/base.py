@@ -1,3 +1,4 @@
+import asyncio
 from abc import ABC, abstractmethod
 from typing import List
 import numpy as np
@@ -12,3 +13,31 @@ class EmbeddingsBase(ABC):
         Converts a list of strings to a 2D numpy array of shape (len(texts), embedding_dimension).
         """
         pass
+
+    async def aencode(self, texts: List[str]) -> np.ndarray:
+        """
+        Async version of encode. By default runs encode in the event loop's
+        default executor; providers with a native async client override this.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.encode, texts)
+
+    def close(self) -> None:
+        """
+        Release the threads and connections the provider holds. Providers
+        holding none keep this default, which does nothing.
+        """
+
+    async def aclose(self) -> None:
+        """
+        Close the async clients the provider holds. Call it on the event loop
+        that used `aencode`, before `close`.
+        """
+
+    @property
+    def identity(self) -> str:
+        """
+        A string identifying the provider and its configuration. Vectors produced by
+        providers with different identities are not interchangeable.
+        """
+        return type(self).__name__
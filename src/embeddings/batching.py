@@ -0,0 +1,135 @@
+import time
+import queue
+import asyncio
+import threading
+import numpy as np
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional
+
+from observability.metrics import EMBEDDING_BATCH_TEXTS
+from .base import EmbeddingsBase
+
+class _Request:
+    """
+    One caller's texts, waiting for their rows of a batch.
+    """
+    __slots__ = ("texts", "future")
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.future: Future = Future()
+
+class MicroBatchingEmbeddings(EmbeddingsBase):
+    """
+    Coalesces concurrent small encode calls into batched provider calls.
+
+    Calls with fewer than `max_batch_size` texts are queued. A dispatcher thread
+    collects queued calls for up to `max_wait` seconds after the first one
+    arrives, or until `max_batch_size` texts are waiting. It then embeds them
+    (each distinct text once) in a single provider call and hands every caller
+    its own rows. Larger calls, such as index builds, go straight to the provider.
+    """
+    def __init__(self,
+                 provider: EmbeddingsBase,
+                 max_wait: float = 0.002,
+                 max_batch_size: int = 64,
+                 max_concurrency: int = 4):
+        """
+        Args:
+            provider: The embedding provider to batch calls to
+            max_wait: Seconds to wait for more calls after the first one of a batch
+            max_batch_size: Texts that make a batch full, sending it without waiting further
+            max_concurrency: Batches sent to the provider at the same time
+        """
+        self.provider = provider
+        self.max_wait = max_wait
+        self.max_batch_size = max(1, max_batch_size)
+        self._queue: "queue.Queue[Optional[_Request]]" = queue.Queue()
+        # Batches are sent from a pool, so a slow batch does not hold up collecting the next one
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix="embedding-batch")
+        self._dispatcher = threading.Thread(target=self._dispatch, name="embedding-batcher", daemon=True)
+        self._dispatcher.start()
+
+    @property
+    def identity(self) -> str:
+        return self.provider.identity
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """
+        Return embeddings for `texts`, batched with concurrent calls if it is small.
+        """
+        if not texts or len(texts) >= self.max_batch_size:
+            return self.provider.encode(texts)
+        return self._submit(texts).result()
+
+    async def aencode(self, texts: List[str]) -> np.ndarray:
+        """
+        Async version of encode, awaiting the batch without blocking the event loop.
+        """
+        if not texts or len(texts) >= self.max_batch_size:
+            return await self.provider.aencode(texts)
+        return await asyncio.wrap_future(self._submit(texts))
+
+    async def aclose(self) -> None:
+        """
+        Close the provider's async clients.
+        """
+        await self.provider.aclose()
+
+    def close(self) -> None:
+        """
+        Stop the dispatcher once the calls already queued are sent, then close the provider.
+        """
+        self._queue.put(None)
+        self._dispatcher.join()
+        self._executor.shutdown()
+        self.provider.close()
+
+    def _submit(self, texts: List[str]) -> Future:
+        request = _Request(list(texts))
+        self._queue.put(request)
+        return request.future
+
+    def _dispatch(self) -> None:
+        """
+        Dispatcher thread: cut the queue into batches and send each one off.
+        """
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            size = len(first.texts)
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if request is None:
+                    stopping = True
+                    break
+                batch.append(request)
+                size += len(request.texts)
+            self._executor.submit(self._send, batch)
+
+    def _send(self, batch: List[_Request]) -> None:
+        """
+        Embed the distinct texts of a batch in one provider call and fan the rows out.
+        """
+        unique = list(dict.fromkeys(text for request in batch for text in request.texts))
+        EMBEDDING_BATCH_TEXTS.observe(len(unique))
+        try:
+            vectors = np.asarray(self.provider.encode(unique), dtype=np.float32)
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+            return
+
+        rows = {text: i for i, text in enumerate(unique)}
+        for request in batch:
+            request.future.set_result(vectors[[rows[text] for text in request.texts]])
@@ -0,0 +1,206 @@
+import os
+import hashlib
+import sqlite3
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from observability.metrics import CACHE_LOOKUPS, record_cache
+from .base import EmbeddingsBase
+
+class CachedEmbeddings(EmbeddingsBase):
+    """
+    Content-addressed embedding cache in front of any EmbeddingsBase provider.
+
+    Vectors are keyed by a hash of (provider identity, dimension, text) and kept
+    in a bounded in-memory LRU tier backed by an SQLite file under `cache_dir`,
+    so they survive restarts. Only texts missing from both tiers reach the provider.
+    """
+    def __init__(self,
+                 provider: EmbeddingsBase,
+                 cache_dir: str = "cache",
+                 dimension: int = 384,
+                 max_memory_entries: int = 10000,
+                 persist: bool = True):
+        """
+        Args:
+            provider: The embedding provider to cache
+            cache_dir: Directory holding the on-disk tier
+            dimension: Configured embedding dimension (part of the cache key)
+            max_memory_entries: Maximum number of vectors kept in the in-memory tier
+            persist: Whether to use the on-disk tier
+        """
+        self.provider = provider
+        self.dimension = dimension
+        self.max_memory_entries = max_memory_entries
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if persist:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._db = sqlite3.connect(os.path.join(cache_dir, "embeddings.sqlite"), check_same_thread=False)
+            # WAL lets worker processes sharing the file read while one of them writes
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            self._db.commit()
+
+    @property
+    def identity(self) -> str:
+        return self.provider.identity
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """
+        Return embeddings for `texts`, calling the provider only for cache misses.
+        """
+        if not texts:
+            return self.provider.encode(texts)
+
+        keys, found, miss_texts = self._lookup(texts)
+        if miss_texts:
+            self._store(keys, found, miss_texts, self.provider.encode(list(miss_texts.values())))
+        return np.array([found[key] for key in keys], dtype=np.float32)
+
+    async def aencode(self, texts: List[str]) -> np.ndarray:
+        """
+        Async version of encode, awaiting the provider's aencode for cache misses.
+        """
+        if not texts:
+            return await self.provider.aencode(texts)
+
+        keys, found, miss_texts = self._lookup(texts)
+        if miss_texts:
+            self._store(keys, found, miss_texts, await self.provider.aencode(list(miss_texts.values())))
+        return np.array([found[key] for key in keys], dtype=np.float32)
+
+    def _lookup(self, texts: List[str]) -> Tuple[List[str], Dict[str, np.ndarray], Dict[str, str]]:
+        """
+        Resolve texts from the memory and disk tiers.
+
+        Returns:
+            The key of each text, the vectors found so far by key, and the
+            texts still missing by key
+        """
+        keys = [self._key(text) for text in texts]
+        found: Dict[str, np.ndarray] = {}
+
+        with self._lock:
+            for key in keys:
+                if key in found:
+                    continue
+                vec = self._memory.get(key)
+                if vec is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vec
+            memory_hits = sum(1 for key in keys if key in found)
+            self.hits += memory_hits
+        record_cache("embedding", hits=memory_hits)
+
+        missing = list(dict.fromkeys(key for key in keys if key not in found))
+        if missing and self._db is not None:
+            from_disk = self._read_disk(missing)
+            found.update(from_disk)
+            disk_hits = sum(1 for key in keys if key in from_disk)
+            with self._lock:
+                self.disk_hits += disk_hits
+                for key, vec in from_disk.items():
+                    self._remember(key, vec)
+            if disk_hits:
+                CACHE_LOOKUPS.labels(cache="embedding", result="disk_hit").inc(disk_hits)
+
+        miss_texts: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                miss_texts.setdefault(key, text)
+        return keys, found, miss_texts
+
+    def _store(self,
+               keys: List[str],
+               found: Dict[str, np.ndarray],
+               miss_texts: Dict[str, str],
+               vectors: np.ndarray) -> None:
+        """
+        Record freshly computed vectors for the missing texts in both tiers.
+        """
+        fresh = dict(zip(miss_texts.keys(), vectors))
+        found.update(fresh)
+        # Zero vectors are the providers' error fallback; never cache them
+        cacheable = {key: vec for key, vec in fresh.items() if np.any(vec)}
+        self._write_disk(cacheable)
+        misses = sum(1 for key in keys if key in fresh)
+        record_cache("embedding", misses=misses)
+        with self._lock:
+            self.misses += misses
+            for key, vec in cacheable.items():
+                self._remember(key, vec)
+
+    async def aclose(self) -> None:
+        """
+        Close the provider's async clients.
+        """
+        await self.provider.aclose()
+
+    def close(self) -> None:
+        """
+        Close the on-disk tier, then the provider.
+        """
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+        self.provider.close()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Return hit/miss counters and the in-memory tier size.
+        """
+        with self._lock:
+            return {
+                "memory_hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+            }
+
+    def _key(self, text: str) -> str:
+        raw = f"{self.provider.identity}\x00{self.dimension}\x00{text}".encode("utf-8")
+        return hashlib.sha256(raw).hexdigest()
+
+    def _remember(self, key: str, vec: np.ndarray) -> None:
+        """
+        Insert into the LRU tier, evicting the least recently used entries. Caller holds the lock.
+        """
+        self._memory[key] = vec
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _read_disk(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        result: Dict[str, np.ndarray] = {}
+        with self._lock:
+            if self._db is None:
+                return result
+            # SQLite caps the number of bound parameters per statement
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    result[key] = np.frombuffer(blob, dtype=np.float32)
+        return result
+
+    def _write_disk(self, vectors: Dict[str, np.ndarray]) -> None:
+        if self._db is None or not vectors:
+            return
+        rows = [(key, np.asarray(vec, dtype=np.float32).tobytes()) for key, vec in vectors.items()]
+        with self._lock:
+            if self._db is None:
+                return
+            self._db.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+            self._db.commit()
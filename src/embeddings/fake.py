@@ -4,21 +4,50 @@ import hashlib
 
 from .base import EmbeddingsBase
 
+# splitmix64 constants
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+
+def _splitmix64(x: np.ndarray) -> np.ndarray:
+    """
+    Scramble an array of uint64 counters into well-mixed uint64 words (wrapping arithmetic).
+    """
+    x = (x ^ (x >> np.uint64(30))) * _MIX1
+    x = (x ^ (x >> np.uint64(27))) * _MIX2
+    return x ^ (x >> np.uint64(31))
+
 class FakeEmbeddings(EmbeddingsBase):
     """
-    Fake embedding generator for testing. 
+    Fake embedding generator for testing.
     Uses a hash of the text as a seed, generating a deterministic random vector.
+
+    The vectors of a whole call are generated at once from the array of text
+    seeds with a counter-based hash (splitmix64 of seed and column), turned
+    into normal draws by Box-Muller. No random state is shared or kept, so
+    concurrent encode calls (engine thread pools, parallel corpus ingests)
+    never see each other's seeds.
     """
     def __init__(self, dimension: int = 384):
         self.dimension = dimension
 
+    @property
+    def identity(self) -> str:
+        # v3: counter-based vectors differ from the v2 per-text Generator ones
+        return f"fake-v3:{self.dimension}"
+
     def encode(self, texts: List[str]) -> np.ndarray:
-        vectors = []
-        for text in texts:
-            seed = int(hashlib.md5(text.encode()).hexdigest(), 16) % (2**32)
-            np.random.seed(seed)
-            vec = np.random.randn(self.dimension).astype(np.float32)
-            # Normalize
-            vec /= np.linalg.norm(vec)
-            vectors.append(vec)
-        return np.array(vectors, dtype=np.float32)
+        digests = b"".join(hashlib.md5(text.encode()).digest()[:8] for text in texts)
+        seeds = np.frombuffer(digests, dtype="<u8").astype(np.uint64)
+        half = (self.dimension + 1) // 2
+        counters = np.arange(1, 2 * half + 1, dtype=np.uint64) * _GOLDEN
+        words = _splitmix64(seeds[:, None] + counters[None, :])
+        # Top 24 bits as float32 uniforms in (0, 1]
+        uniforms = ((words >> np.uint64(40)) + np.uint64(1)).astype(np.float32) * np.float32(1.0 / (1 << 24))
+        radius = np.sqrt(np.float32(-2.0) * np.log(uniforms[:, :half]))
+        angle = np.float32(2.0 * np.pi) * uniforms[:, half:]
+        vectors = np.concatenate([radius * np.cos(angle), radius * np.sin(angle)], axis=1)
+        vectors = np.ascontiguousarray(vectors[:, :self.dimension])
+        # Normalize
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors
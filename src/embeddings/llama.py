@@ -1,57 +1,207 @@
+import asyncio
+import logging
 import numpy as np
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+import httpx
 import requests
-import json
+from requests.adapters import HTTPAdapter
 
+from observability.metrics import EMBEDDED_TEXTS, EMBEDDING_ERRORS, EMBEDDING_REQUEST_SECONDS
 from .base import EmbeddingsBase
 
+logger = logging.getLogger(__name__)
+
 class LlamaEmbeddings(EmbeddingsBase):
     """
     LLaMA embedding class that calls the llama.cpp server API endpoint
     to obtain embeddings for the input texts.
+
+    Texts are sent in chunks of `batch_size` per request, with up to
+    `max_concurrency` requests in flight over a pooled keep-alive session.
+    `aencode` does the same over an async HTTP client, without using threads.
     """
-    def __init__(self, api_url: str):
+    def __init__(self,
+                 api_url: str,
+                 batch_size: int = 32,
+                 max_concurrency: int = 4,
+                 timeout: float = 30.0):
+        """
+        Args:
+            api_url: Base URL of the llama.cpp server
+            batch_size: Number of texts sent per /embedding request (1 disables batching)
+            max_concurrency: Maximum number of requests in flight at the same time
+            timeout: Per-request timeout in seconds
+        """
         self.api_url = api_url
+        self.batch_size = max(1, batch_size)
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        self.dimension: Optional[int] = None
+
+        # One pooled session shared by all worker threads, sized so every
+        # concurrent request can keep its own connection alive.
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # Sends the chunks of a multi-chunk encode; shared by all calls, so the
+        # threads are started once rather than per call
+        self._pool = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="llama-embed")
+
+        # Created lazily, as it is bound to the event loop it is first used on
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def identity(self) -> str:
+        return f"llama:{self.api_url}"
 
     def encode(self, texts: List[str]) -> np.ndarray:
         """
-        Call the llama.cpp server API for each text. Returns an (N x D) array of embeddings.
-        
+        Call the llama.cpp server API for the given texts. Returns an (N x D) array of embeddings.
+
         The llama.cpp server expects requests in the format:
         POST /embedding
         {
-            "content": "text to embed"
+            "content": "text to embed"    # or a list of texts when batching
         }
         """
-        embeddings = []
-        for text in texts:
-            try:
-                # Format payload according to llama.cpp server API
-                payload = {"content": text}
-                
-                # Make the API request
-                response = requests.post(f"{self.api_url}/embedding", json=payload)
-                response.raise_for_status()
-                
-                # Parse the response
-                data = response.json()
-                if "embedding" in data:
-                    embeddings.append(data["embedding"])
-                else:
-                    # Handle case where response format is different
-                    print(f"[LlamaEmbeddings] Warning: Unexpected response format: {data}")
-                    if isinstance(data, list) and len(data) > 0:
-                        embeddings.append(data)
-                    else:
-                        raise ValueError(f"Could not extract embedding from response: {data}")
-            except Exception as e:
-                print(f"[LlamaEmbeddings] Error getting embedding for text: {str(e)}")
-                # Fallback to a zero vector if there's an error
-                if embeddings:
-                    # Use same dimension as previous embeddings
-                    embeddings.append(np.zeros_like(embeddings[0]))
-                else:
-                    # Default to 384 dimensions if no previous embeddings
-                    embeddings.append(np.zeros(384))
-                
+        if not texts:
+            return np.zeros((0, self.dimension or 384), dtype=np.float32)
+
+        chunks = self._chunks(texts)
+        if len(chunks) == 1 or self.max_concurrency == 1:
+            results = [self._encode_chunk(chunk) for chunk in chunks]
+        else:
+            results = list(self._pool.map(self._encode_chunk, chunks))
+        return self._to_array(results)
+
+    async def aencode(self, texts: List[str]) -> np.ndarray:
+        """
+        Async version of encode, sending the chunks concurrently over a pooled
+        async HTTP client with at most `max_concurrency` requests in flight.
+        """
+        if not texts:
+            return np.zeros((0, self.dimension or 384), dtype=np.float32)
+
+        client = self._get_async_client()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def encode_chunk(chunk: List[str]) -> List[Optional[List[float]]]:
+            async with semaphore:
+                EMBEDDED_TEXTS.labels(provider="llama").inc(len(chunk))
+                try:
+                    with EMBEDDING_REQUEST_SECONDS.labels(provider="llama").time():
+                        response = await client.post(f"{self.api_url}/embedding", json=self._payload(chunk))
+                    response.raise_for_status()
+                    return self._parse_chunk(response.json(), chunk)
+                except Exception as e:
+                    return self._fallback(chunk, e)
+
+        results = await asyncio.gather(*(encode_chunk(chunk) for chunk in self._chunks(texts)))
+        return self._to_array(results)
+
+    def close(self) -> None:
+        """
+        Stop the chunk pool and close the HTTP session.
+        """
+        self._pool.shutdown()
+        self.session.close()
+
+    async def aclose(self) -> None:
+        """
+        Close the async HTTP client, if one was created on the running event loop.
+        """
+        client, loop = self._async_client, self._async_loop
+        self._async_client = self._async_loop = None
+        # A client bound to another (likely closed) loop cannot be closed from here
+        if client is not None and loop is asyncio.get_running_loop():
+            await client.aclose()
+
+    def _chunks(self, texts: List[str]) -> List[List[str]]:
+        return [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+
+    @staticmethod
+    def _payload(chunk: List[str]) -> dict:
+        return {"content": chunk[0] if len(chunk) == 1 else chunk}
+
+    def _to_array(self, results: List[List[Optional[List[float]]]]) -> np.ndarray:
+        embeddings = [vec for chunk in results for vec in chunk]
+        # Chunks that failed before any dimension was known are filled lazily
+        dim = self.dimension or 384
+        embeddings = [vec if vec is not None else np.zeros(dim) for vec in embeddings]
         return np.array(embeddings, dtype=np.float32)
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            limits = httpx.Limits(max_connections=self.max_concurrency,
+                                  max_keepalive_connections=self.max_concurrency)
+            self._async_client = httpx.AsyncClient(limits=limits, timeout=self.timeout)
+            self._async_loop = loop
+        return self._async_client
+
+    def _encode_chunk(self, chunk: List[str]) -> List[Optional[List[float]]]:
+        """
+        Embed one chunk of texts with a single request. On failure every text in
+        the chunk falls back to a zero vector.
+        """
+        EMBEDDED_TEXTS.labels(provider="llama").inc(len(chunk))
+        try:
+            with EMBEDDING_REQUEST_SECONDS.labels(provider="llama").time():
+                response = self.session.post(f"{self.api_url}/embedding", json=self._payload(chunk),
+                                             timeout=self.timeout)
+            response.raise_for_status()
+            return self._parse_chunk(response.json(), chunk)
+        except Exception as e:
+            return self._fallback(chunk, e)
+
+    def _parse_chunk(self, data, chunk: List[str]) -> List[List[float]]:
+        vectors = self._parse_response(data, len(chunk))
+        if self.dimension is None and vectors:
+            self.dimension = len(vectors[0])
+        return vectors
+
+    def _fallback(self, chunk: List[str], error: Exception) -> List[Optional[np.ndarray]]:
+        EMBEDDING_ERRORS.labels(provider="llama").inc()
+        logger.error("Error getting embeddings for %d text(s): %s", len(chunk), error)
+        # Fallback to zero vectors if there's an error
+        if self.dimension is not None:
+            return [np.zeros(self.dimension) for _ in chunk]
+        return [None for _ in chunk]
+
+    @staticmethod
+    def _parse_response(data, expected: int) -> List[List[float]]:
+        """
+        Extract embeddings from the llama.cpp response. Older servers answer a
+        single text with {"embedding": [...]}, newer ones answer with a list of
+        {"index": i, "embedding": [...]} entries (one per input).
+        """
+        if isinstance(data, dict) and "embedding" in data:
+            items = [data]
+        elif isinstance(data, dict) and "data" in data:
+            items = data["data"]
+        elif isinstance(data, list):
+            items = data
+        else:
+            raise ValueError(f"Could not extract embedding from response: {data}")
+
+        if items and isinstance(items[0], (int, float)):
+            # Bare vector
+            items = [{"embedding": items}]
+        if items and all(isinstance(item, dict) and "index" in item for item in items):
+            items = sorted(items, key=lambda item: item["index"])
+
+        vectors = []
+        for item in items:
+            vec = item["embedding"] if isinstance(item, dict) else item
+            # Newer servers nest vectors one level deeper (one row per token
+            # when pooling is disabled); mean-pool them back to one vector
+            if vec and isinstance(vec[0], list):
+                vec = np.mean(np.asarray(vec, dtype=np.float32), axis=0)
+            vectors.append(vec)
+
+        if len(vectors) != expected:
+            raise ValueError(f"Expected {expected} embeddings, got {len(vectors)}")
+        return vectors
@@ -0,0 +1,420 @@
+import math
+import time
+import asyncio
+import logging
+import threading
+import numpy as np
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Deque, Dict, List, Optional, Sequence
+import httpx
+from requests.adapters import HTTPAdapter
+
+from observability.metrics import (
+    EMBEDDED_TEXTS, EMBEDDING_REQUEST_SECONDS, EMBEDDING_HEDGES, EMBEDDING_REPLICA_EJECTIONS
+)
+from .llama import LlamaEmbeddings
+
+logger = logging.getLogger(__name__)
+
+# Seconds over which a replica's latency estimate fades, so a replica that was slow gets tried again
+LATENCY_DECAY = 30.0
+
+class Replica:
+    """
+    One llama.cpp endpoint, with its in-flight request count and circuit breaker state.
+
+    The breaker is closed while requests succeed. After `failure_threshold`
+    consecutive failures it opens, ejecting the replica for `cooldown`
+    seconds. It then lets a single trial request through (half-open): success
+    closes it again, failure ejects the replica for another cooldown.
+    """
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        self.failures = 0
+        self.open_until = 0.0
+        self.probing = False
+        # Moving average of request latencies, and when it was last updated
+        self.latency = 0.0
+        self.latency_updated = 0.0
+
+    @property
+    def ejected(self) -> bool:
+        return self.open_until > time.monotonic()
+
+    def admits(self, now: float) -> bool:
+        """
+        Whether a new request may be sent now: the breaker is closed, or
+        half-open with no trial request in flight yet.
+        """
+        return now >= self.open_until and not self.probing
+
+    def expected_latency(self, now: float) -> float:
+        return self.latency * math.exp(-(now - self.latency_updated) / LATENCY_DECAY)
+
+    def observe(self, seconds: float, now: float) -> None:
+        previous = self.expected_latency(now)
+        self.latency = seconds if not previous else 0.3 * seconds + 0.7 * previous
+        self.latency_updated = now
+
+class LatencyWindow:
+    """
+    Recent successful request latencies, kept separately per batch size class
+    (powers of two), as a 32-text batch is expected to take longer than one query.
+    """
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.size = size
+        self.min_samples = min_samples
+        self._samples: Dict[int, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _bucket(batch_size: int) -> int:
+        return max(1, batch_size - 1).bit_length()
+
+    def add(self, batch_size: int, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(self._bucket(batch_size), deque(maxlen=self.size)).append(seconds)
+
+    def percentile(self, batch_size: int, q: float) -> Optional[float]:
+        """
+        The q-th percentile latency for batches of this size, or None until enough are recorded.
+        """
+        with self._lock:
+            samples = self._samples.get(self._bucket(batch_size))
+            if samples is None or len(samples) < self.min_samples:
+                return None
+            return float(np.percentile(np.fromiter(samples, dtype=np.float64), q))
+
+class ReplicatedLlamaEmbeddings(LlamaEmbeddings):
+    """
+    LlamaEmbeddings spread over several llama.cpp servers running the same model.
+
+    Each chunk of texts goes to the replica with the fewest requests in flight
+    (the one with the lowest recent latency among equals).
+    A request still unanswered after the `hedge_percentile` latency of recent
+    requests of its size gets a duplicate sent to another replica with spare
+    capacity, and the first answer wins, so one stalled server does not set
+    the tail latency. Under full load no duplicates are sent.
+    Failed requests are retried on another replica, and replicas that keep
+    failing are ejected by a circuit breaker (see Replica) and re-probed later.
+    Only when every replica fails does a chunk fall back to zero vectors.
+    """
+    def __init__(self,
+                 api_urls: Sequence[str],
+                 batch_size: int = 32,
+                 max_concurrency: int = 4,
+                 timeout: float = 30.0,
+                 hedge_percentile: float = 95.0,
+                 hedge_min_delay: float = 0.005,
+                 failure_threshold: int = 3,
+                 cooldown: float = 10.0):
+        """
+        Args:
+            api_urls: Base URLs of the llama.cpp servers
+            batch_size: Number of texts sent per /embedding request (1 disables batching)
+            max_concurrency: Requests in flight at the same time per replica
+            timeout: Per-request timeout in seconds
+            hedge_percentile: Latency percentile after which a request is hedged (0 disables hedging)
+            hedge_min_delay: Shortest wait in seconds before hedging
+            failure_threshold: Consecutive failures that eject a replica
+            cooldown: Seconds an ejected replica waits before it is probed again
+        """
+        if not api_urls:
+            raise ValueError("At least one embedding API URL is required")
+        super().__init__(api_urls[0], batch_size=batch_size, max_concurrency=max_concurrency, timeout=timeout)
+        self.replicas = [Replica(url) for url in api_urls]
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.latencies = LatencyWindow()
+        self._lock = threading.Lock()
+        self._next = 0
+
+        # Chunks in flight across all replicas; hedges may double the requests
+        self._total_concurrency = self.max_concurrency * len(self.replicas)
+        adapter = HTTPAdapter(pool_connections=len(self.replicas), pool_maxsize=2 * self.max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._requests = ThreadPoolExecutor(max_workers=2 * self._total_concurrency,
+                                            thread_name_prefix="llama-replica")
+        # Chunks are spread over every replica, more than the base pool (no threads started yet) holds
+        self._pool.shutdown()
+        self._pool = ThreadPoolExecutor(max_workers=self._total_concurrency, thread_name_prefix="llama-embed")
+
+    @property
+    def identity(self) -> str:
+        # Replicas serve one model, so adding or removing replicas keeps saved vectors valid
+        return f"llama:{self.replicas[0].url}"
+
+    def check_health(self) -> int:
+        """
+        Call every replica's /health endpoint once, ejecting those that do not
+        answer (they are re-probed after the cooldown).
+
+        Returns:
+            The number of healthy replicas
+        """
+        healthy = 0
+        for replica in self.replicas:
+            try:
+                response = self.session.get(f"{replica.url}/health", timeout=2)
+                response.raise_for_status()
+                healthy += 1
+            except Exception as e:
+                logger.warning("Embedding replica %s is not healthy: %s", replica.url, e)
+                with self._lock:
+                    replica.failures = self.failure_threshold
+                    replica.open_until = time.monotonic() + self.cooldown
+        return healthy
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed texts in chunks of `batch_size`, spread over the replicas.
+        Returns an (N x D) array of embeddings.
+        """
+        if not texts:
+            return np.zeros((0, self.dimension or 384), dtype=np.float32)
+
+        chunks = self._chunks(texts)
+        if len(chunks) == 1:
+            results = [self._encode_chunk(chunks[0])]
+        else:
+            results = list(self._pool.map(self._encode_chunk, chunks))
+        return self._to_array(results)
+
+    def close(self) -> None:
+        """
+        Stop the chunk and request pools and close the HTTP session.
+        """
+        self._pool.shutdown()
+        self._requests.shutdown()
+        self.session.close()
+
+    async def aencode(self, texts: List[str]) -> np.ndarray:
+        """
+        Async version of encode, over a pooled async HTTP client.
+        """
+        if not texts:
+            return np.zeros((0, self.dimension or 384), dtype=np.float32)
+
+        semaphore = asyncio.Semaphore(self._total_concurrency)
+
+        async def encode_chunk(chunk: List[str]) -> List[Optional[List[float]]]:
+            async with semaphore:
+                return await self._aencode_chunk(chunk)
+
+        results = await asyncio.gather(*(encode_chunk(chunk) for chunk in self._chunks(texts)))
+        return self._to_array(results)
+
+    def _encode_chunk(self, chunk: List[str]) -> List[Optional[List[float]]]:
+        """
+        Embed one chunk, hedging and retrying across replicas.
+        """
+        EMBEDDED_TEXTS.labels(provider="llama").inc(len(chunk))
+        tried: List[Replica] = []
+        in_flight: Dict[Future, Replica] = {}
+        error: Optional[Exception] = None
+        hedged = False
+
+        def send(hedge: bool = False) -> bool:
+            replica = self._acquire(tried, spare_only=hedge)
+            if replica is None:
+                return False
+            tried.append(replica)
+            in_flight[self._requests.submit(self._request, replica, chunk)] = replica
+            return True
+
+        send()
+        while in_flight:
+            delay = None if hedged else self._hedge_delay(len(chunk))
+            done, _ = wait(in_flight, timeout=delay, return_when=FIRST_COMPLETED)
+            if not done:
+                hedged = True
+                if send(hedge=True):
+                    EMBEDDING_HEDGES.inc()
+                continue
+            for future in done:
+                in_flight.pop(future)
+                try:
+                    # Requests still in flight finish on their own; their answers are ignored
+                    return future.result()
+                except Exception as e:
+                    error = e
+            if not in_flight:
+                send()
+        return self._fallback(chunk, error or RuntimeError("no embedding replica available"))
+
+    async def _aencode_chunk(self, chunk: List[str]) -> List[Optional[List[float]]]:
+        """
+        Async version of _encode_chunk. Losing hedged requests are cancelled.
+        """
+        EMBEDDED_TEXTS.labels(provider="llama").inc(len(chunk))
+        client = self._get_async_client()
+        tried: List[Replica] = []
+        in_flight: Dict[asyncio.Task, Replica] = {}
+        error: Optional[Exception] = None
+        hedged = False
+
+        def send(hedge: bool = False) -> bool:
+            replica = self._acquire(tried, spare_only=hedge)
+            if replica is None:
+                return False
+            tried.append(replica)
+            in_flight[asyncio.ensure_future(self._arequest(client, replica, chunk))] = replica
+            return True
+
+        send()
+        try:
+            while in_flight:
+                delay = None if hedged else self._hedge_delay(len(chunk))
+                done, _ = await asyncio.wait(in_flight, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    if send(hedge=True):
+                        EMBEDDING_HEDGES.inc()
+                    continue
+                for task in done:
+                    in_flight.pop(task)
+                    try:
+                        return task.result()
+                    except Exception as e:
+                        error = e
+                if not in_flight:
+                    send()
+        finally:
+            for task in in_flight:
+                task.cancel()
+        return self._fallback(chunk, error or RuntimeError("no embedding replica available"))
+
+    def _request(self, replica: Replica, chunk: List[str]) -> List[List[float]]:
+        """
+        Send one chunk to one replica and parse the answer.
+        """
+        start = time.monotonic()
+        try:
+            with EMBEDDING_REQUEST_SECONDS.labels(provider="llama").time():
+                response = self.session.post(f"{replica.url}/embedding", json=self._payload(chunk),
+                                             timeout=self.timeout)
+            response.raise_for_status()
+            vectors = self._parse_chunk(response.json(), chunk)
+        except Exception as e:
+            self._release(replica, len(chunk), error=e)
+            raise
+        self._release(replica, len(chunk), latency=time.monotonic() - start)
+        return vectors
+
+    async def _arequest(self, client: httpx.AsyncClient, replica: Replica, chunk: List[str]) -> List[List[float]]:
+        """
+        Async version of _request.
+        """
+        start = time.monotonic()
+        try:
+            with EMBEDDING_REQUEST_SECONDS.labels(provider="llama").time():
+                response = await client.post(f"{replica.url}/embedding", json=self._payload(chunk))
+            response.raise_for_status()
+            vectors = self._parse_chunk(response.json(), chunk)
+        except asyncio.CancelledError:
+            # Lost to a hedged duplicate: not a failure, but the replica was at least this slow
+            self._release(replica, len(chunk), slower_than=time.monotonic() - start)
+            raise
+        except Exception as e:
+            self._release(replica, len(chunk), error=e)
+            raise
+        self._release(replica, len(chunk), latency=time.monotonic() - start)
+        return vectors
+
+    def _acquire(self, exclude: List[Replica], spare_only: bool = False) -> Optional[Replica]:
+        """
+        Pick the replica for a request and count it as in flight: the one with
+        the fewest requests in flight among those whose breaker admits one
+        (ties go to the lowest expected latency, then in turn). If every breaker
+        is open, the replica due to be probed soonest is tried anyway rather
+        than failing outright.
+
+        Args:
+            exclude: Replicas already tried for this request
+            spare_only: Only pick a healthy replica with fewer than max_concurrency
+                        requests in flight (for hedges, which must not add to a backlog)
+
+        Returns:
+            The replica, or None if there is none to pick
+        """
+        with self._lock:
+            now = time.monotonic()
+            candidates = [r for r in self.replicas if r not in exclude]
+            admitted = [r for r in candidates if r.admits(now)]
+            if spare_only:
+                candidates = admitted = [r for r in admitted if r.outstanding < self.max_concurrency]
+            if not candidates:
+                return None
+            if admitted:
+                n = len(self.replicas)
+                order = {id(r): (i - self._next) % n for i, r in enumerate(self.replicas)}
+                replica = min(admitted, key=lambda r: (r.outstanding, r.expected_latency(now), order[id(r)]))
+                self._next = (self.replicas.index(replica) + 1) % n
+            else:
+                replica = min(candidates, key=lambda r: r.open_until)
+            if replica.failures >= self.failure_threshold:
+                # Half-open: this request is the trial
+                replica.probing = True
+            replica.outstanding += 1
+            return replica
+
+    def _release(self,
+                 replica: Replica,
+                 batch_size: int,
+                 latency: Optional[float] = None,
+                 error: Optional[Exception] = None,
+                 slower_than: Optional[float] = None) -> None:
+        """
+        Record the end of a request: its latency if it succeeded (or a lower
+        bound if it was cancelled), and the breaker transition it causes.
+        """
+        with self._lock:
+            now = time.monotonic()
+            replica.outstanding -= 1
+            replica.probing = False
+            if latency is not None:
+                replica.observe(latency, now)
+                if replica.failures >= self.failure_threshold:
+                    logger.info("Embedding replica %s recovered", replica.url)
+                replica.failures = 0
+                replica.open_until = 0.0
+            elif slower_than is not None:
+                replica.observe(max(slower_than, replica.expected_latency(now)), now)
+            elif error is not None:
+                replica.failures += 1
+                if replica.failures < self.failure_threshold:
+                    logger.warning("Embedding replica %s failed (%d in a row): %s",
+                                   replica.url, replica.failures, error)
+                elif replica.failures == self.failure_threshold:
+                    EMBEDDING_REPLICA_EJECTIONS.labels(replica=replica.url).inc()
+                    logger.warning("Ejecting embedding replica %s for %.0fs after %d failures: %s",
+                                   replica.url, self.cooldown, replica.failures, error)
+                else:
+                    logger.debug("Embedding replica %s is still failing: %s", replica.url, error)
+                replica.open_until = now + self.cooldown if replica.failures >= self.failure_threshold else 0.0
+        if latency is not None:
+            self.latencies.add(batch_size, latency)
+
+    def _hedge_delay(self, batch_size: int) -> Optional[float]:
+        """
+        Seconds to wait for a request before hedging it, or None to not hedge
+        (hedging disabled, a single replica, or too few latencies recorded yet).
+        """
+        if self.hedge_percentile <= 0 or len(self.replicas) < 2:
+            return None
+        delay = self.latencies.percentile(batch_size, self.hedge_percentile)
+        return None if delay is None else max(delay, self.hedge_min_delay)
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            connections = 2 * self._total_concurrency
+            limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+            self._async_client = httpx.AsyncClient(limits=limits, timeout=self.timeout)
+            self._async_loop = loop
+        return self._async_client
@@ -1,12 +1,54 @@
+import os
+import shutil
+import tempfile
+import multiprocessing
 import uvicorn
-from server.app import create_app
+from dotenv import load_dotenv
+
+from observability.metrics import MULTIPROC_DIR_ENV
+
+load_dotenv()
+
+HOST = os.getenv("HOST", "127.0.0.1")
+PORT = int(os.getenv("PORT", "8002"))
+# Number of server processes; above 1, they share one read-only index
+WORKERS = int(os.getenv("WORKERS", "1"))
+
+def build_index() -> None:
+    """
+    Builder process: make sure the shared index exists in the cache directory.
+    """
+    from server.app import build_default_index
+    build_default_index()
 
 def main():
     """
     Entry point to run the RAG FastAPI application.
+
+    With WORKERS=1, one process serves requests and keeps its index writable.
+    With more, a builder process first loads or builds the index into the
+    cache directory; the workers then only memory-map it, so the index pages
+    are shared between them instead of being copied into each one.
     """
-    app = create_app()
-    uvicorn.run(app, host="127.0.0.1", port=8002)
+    if WORKERS <= 1:
+        from server.app import create_app
+        uvicorn.run(create_app(), host=HOST, port=PORT)
+        return
+
+    builder = multiprocessing.get_context("spawn").Process(target=build_index, name="index-builder")
+    builder.start()
+    builder.join()
+    if builder.exitcode != 0:
+        raise SystemExit(f"Index builder failed with exit code {builder.exitcode}")
+
+    # Inherited by the spawned workers
+    os.environ["INDEX_READ_ONLY"] = "true"
+    metrics_dir = tempfile.mkdtemp(prefix="rag-metrics-")
+    os.environ[MULTIPROC_DIR_ENV] = metrics_dir
+    try:
+        uvicorn.run("server.app:create_app", factory=True, host=HOST, port=PORT, workers=WORKERS)
+    finally:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,44 @@
+import json
+import logging
+import sys
+from typing import Optional
+
+# Attributes every LogRecord has; anything else was passed via `extra=`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats records as one JSON object per line, including any `extra=` fields.
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+def setup_logging(level: str = "INFO", fmt: str = "text", stream: Optional[object] = None) -> None:
+    """
+    Configure the root logger.
+
+    Args:
+        level: Minimum level to log (DEBUG, INFO, WARNING, ERROR)
+        fmt: "text" for human-readable lines, "json" for one JSON object per line
+        stream: Where to write logs (defaults to stderr)
+    """
+    handler = logging.StreamHandler(stream or sys.stderr)
+    if fmt.lower() == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
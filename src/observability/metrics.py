@@ -0,0 +1,102 @@
+import os
+from typing import Tuple
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+# When set (by main.py for multi-worker serving, before any worker imports this
+# module), every worker writes its metrics there and /metrics aggregates them
+MULTIPROC_DIR_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+# Latency buckets in seconds, from sub-millisecond FAISS searches to slow index builds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Pipeline stages: split, encode, index_build, index_search, lexical_search, serialize, transcribe
+STAGE_SECONDS = Histogram(
+    "rag_stage_seconds", "Time spent in each pipeline stage", ["stage"], buckets=LATENCY_BUCKETS
+)
+
+EMBEDDING_REQUEST_SECONDS = Histogram(
+    "rag_embedding_request_seconds", "Duration of HTTP requests to an embedding provider", ["provider"],
+    buckets=LATENCY_BUCKETS
+)
+EMBEDDING_ERRORS = Counter(
+    "rag_embedding_errors_total", "Failed embedding provider requests", ["provider"]
+)
+EMBEDDED_TEXTS = Counter(
+    "rag_embedded_texts_total", "Texts sent to an embedding provider", ["provider"]
+)
+# Duplicate requests sent to a second replica because the first was slow
+EMBEDDING_HEDGES = Counter(
+    "rag_embedding_hedges_total", "Hedged embedding requests sent to another replica"
+)
+EMBEDDING_REPLICA_EJECTIONS = Counter(
+    "rag_embedding_replica_ejections_total", "Embedding replicas ejected by the circuit breaker", ["replica"]
+)
+# Distinct texts per coalesced batch sent by MicroBatchingEmbeddings
+EMBEDDING_BATCH_TEXTS = Histogram(
+    "rag_embedding_batch_texts", "Texts per micro-batched embedding call",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+
+# reason is "error" (provider failed or returned zero vectors) or "timeout" (over the embedding budget)
+SEARCH_FALLBACKS = Counter(
+    "rag_search_fallbacks_total", "Queries answered from the BM25 index because embedding them failed",
+    ["reason"]
+)
+
+# path is "index" (searched with a FAISS ID selector) or "exact" (selected vectors scored directly)
+FILTERED_SEARCHES = Counter(
+    "rag_filtered_searches_total", "Metadata-filtered vector searches by how they were answered", ["path"]
+)
+
+# result is "hit" or "miss" (the embedding cache also reports "disk_hit")
+CACHE_LOOKUPS = Counter(
+    "rag_cache_lookups_total", "Cache lookups by cache and result", ["cache", "result"]
+)
+
+TRANSCRIPTION_QUEUE_DEPTH = Gauge(
+    "rag_transcription_queue_depth", "Transcription jobs waiting for a worker",
+    multiprocess_mode="livesum"
+)
+TRANSCRIPTION_RUNNING = Gauge(
+    "rag_transcription_running", "Transcription jobs currently running",
+    multiprocess_mode="livesum"
+)
+# status is "done", "failed" or "rejected" (queue full)
+TRANSCRIPTION_JOBS = Counter(
+    "rag_transcription_jobs_total", "Finished or rejected transcription jobs", ["status"]
+)
+
+HTTP_REQUESTS = Counter(
+    "rag_http_requests_total", "HTTP requests by endpoint and status", ["method", "endpoint", "status"]
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "rag_http_request_seconds", "Total HTTP request duration by endpoint", ["method", "endpoint"],
+    buckets=LATENCY_BUCKETS
+)
+
+def time_stage(stage: str):
+    """
+    Context manager (or decorator) recording the duration of one pipeline stage.
+    """
+    return STAGE_SECONDS.labels(stage=stage).time()
+
+def record_cache(cache: str, hits: int = 0, misses: int = 0) -> None:
+    """
+    Count cache hits and misses for the named cache.
+    """
+    if hits:
+        CACHE_LOOKUPS.labels(cache=cache, result="hit").inc(hits)
+    if misses:
+        CACHE_LOOKUPS.labels(cache=cache, result="miss").inc(misses)
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    Return all metrics in Prometheus text format, with their content type.
+    Across all worker processes when running multi-worker.
+    """
+    if os.environ.get(MULTIPROC_DIR_ENV):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
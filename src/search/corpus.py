@@ -0,0 +1,78 @@
+import os
+import glob
+import hashlib
+from collections import deque
+from concurrent.futures import Executor
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
+
+from search.manifest import file_hash
+from search.splitter import scan_file, split_file
+from search.term_section import TermSection
+
+def resolve_paths(paths_or_glob: Union[str, Sequence[str]]) -> List[str]:
+    """
+    Files of a corpus: each entry is a file path or a glob pattern ('**'
+    matches any number of directories). Returns the distinct matching files,
+    sorted, so a corpus is always read in the same order.
+
+    Raises:
+        FileNotFoundError: If nothing matches
+    """
+    patterns = [paths_or_glob] if isinstance(paths_or_glob, str) else list(paths_or_glob)
+    paths = set()
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True) if glob.has_magic(pattern) else [pattern]
+        paths.update(os.path.normpath(p) for p in matches if os.path.isfile(p))
+    if not paths:
+        raise FileNotFoundError(f"No files match {paths_or_glob}")
+    return sorted(paths)
+
+def scan_document(path: str) -> Tuple[int, int, int, str]:
+    """
+    Section, character and byte counts and content hash of one file.
+    Runs in a worker process.
+    """
+    return (*scan_file(path), file_hash(path))
+
+def corpus_hash(paths: List[str], hashes: List[str]) -> str:
+    """
+    Hash identifying a corpus by its file paths and contents.
+    """
+    digest = hashlib.sha256()
+    for path, content_hash in zip(paths, hashes):
+        digest.update(f"{path}\x00{content_hash}\x00".encode("utf-8"))
+    return digest.hexdigest()
+
+def split_documents(pool: Optional[Executor], paths: Sequence[str], window: int) -> Iterator[TermSection]:
+    """
+    Split files on a process pool and yield their sections in file order,
+    tagged with their file's path as document id. Section ids are assigned
+    here, consecutively across files.
+
+    Args:
+        pool: Worker processes, or None to split in this process
+        paths: Files to split
+        window: Files split ahead of the one being consumed, bounding memory
+    """
+    next_section_id = 0
+    if pool is None:
+        for path in paths:
+            sections = split_file(path, next_section_id, path)
+            next_section_id += len(sections)
+            yield from sections
+        return
+
+    pending = deque()
+    paths = iter(paths)
+    while True:
+        for path in paths:
+            pending.append(pool.submit(split_file, path, 0, path))
+            if len(pending) >= window:
+                break
+        if not pending:
+            return
+        for section in pending.popleft().result():
+            # Fresh objects from the worker, so renumbering in place is safe
+            section.section_id = next_section_id
+            next_section_id += 1
+            yield section
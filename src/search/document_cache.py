@@ -0,0 +1,103 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict
+
+from observability.metrics import record_cache
+from search.terms_search_engine import TermsSearchEngine
+
+class DocumentIndexCache:
+    """
+    LRU cache of per-document search engines, keyed by a hash of the document text.
+
+    Each distinct text is split and embedded once. Concurrent requests for a
+    text that is still being built wait for that build instead of starting
+    their own. Entries are evicted least-recently-used first once either the
+    entry count or the estimated memory use exceeds its bound.
+    """
+    def __init__(self,
+                 build: Callable[[str], TermsSearchEngine],
+                 max_entries: int = 32,
+                 max_bytes: int = 256 * 1024 * 1024):
+        """
+        Args:
+            build: Function that builds a search engine for a document text
+            max_entries: Maximum number of cached documents
+            max_bytes: Maximum estimated memory used by all cached documents
+        """
+        self.build = build
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self._entries: "OrderedDict[str, TermsSearchEngine]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._building: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_for(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get(self, text: str) -> TermsSearchEngine:
+        """
+        Return the search engine for `text`, building it if it is not cached.
+        """
+        key = self.key_for(text)
+        with self._lock:
+            engine = self._entries.get(key)
+            if engine is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                record_cache("document", hits=1)
+                return engine
+
+            pending = self._building.get(key)
+            if pending is not None:
+                self.hits += 1
+                record_cache("document", hits=1)
+            else:
+                self.misses += 1
+                record_cache("document", misses=1)
+                future: Future = Future()
+                self._building[key] = future
+        if pending is not None:
+            return pending.result()
+
+        try:
+            engine = self.build(text)
+        except BaseException as e:
+            with self._lock:
+                del self._building[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._building[key]
+            self._entries[key] = engine
+            self._sizes[key] = engine.memory_bytes()
+            self._evict()
+        future.set_result(engine)
+        return engine
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": sum(self._sizes.values()),
+            }
+
+    def _evict(self) -> None:
+        """
+        Drop least recently used entries until both bounds hold. Always keeps
+        the newest entry, even if it alone exceeds max_bytes. Caller holds the lock.
+        """
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_entries or sum(self._sizes.values()) > self.max_bytes
+        ):
+            key, _ = self._entries.popitem(last=False)
+            del self._sizes[key]
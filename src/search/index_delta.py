@@ -0,0 +1,208 @@
+import os
+import faiss
+import numpy as np
+from dataclasses import dataclass
+from typing import Optional, Sequence, Tuple
+
+from search.index_factory import (
+    add_vectors, copy_index, remove_vectors, search_params, filtered_search_params, excluding_selector,
+    stored_vectors, vector_scores
+)
+from search.section_store import DELTA_INDEX_FILE, DELTA_STALE_FILE
+
+# A delta is folded into a new main index once it holds more changes than this
+# fraction of the main index's vectors (and more than COMPACT_MIN_CHANGES)
+COMPACT_FRACTION = 0.05
+COMPACT_MIN_CHANGES = 1024
+
+@dataclass(frozen=True)
+class IndexDelta:
+    """
+    The vector changes made since a main FAISS index was built, kept beside
+    it so that an edit costs about the size of the change rather than a copy
+    (or, for HNSW and reranking indexes, a rebuild) of the main index.
+
+    `index` holds the exact vectors of sections added or re-embedded since,
+    under their section ids, which `ids` lists in ascending order. `stale`
+    lists the ids whose vectors in the main index are no longer current
+    (removed or re-embedded sections); searches of the main index skip them.
+    Like the snapshot holding it, a delta is never modified: changed()
+    returns a new one, and compact() folds one into a new main index.
+    """
+    index: faiss.Index
+    ids: np.ndarray
+    stale: np.ndarray
+
+    @classmethod
+    def empty(cls, dim: int) -> "IndexDelta":
+        return cls(faiss.IndexIDMap2(faiss.IndexFlatIP(dim)), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+
+    def __len__(self) -> int:
+        """
+        Number of changes held: vectors plus stale ids.
+        """
+        return len(self.ids) + len(self.stale)
+
+    def changed(self,
+                removed: Sequence[int] = (),
+                embeddings: Optional[np.ndarray] = None,
+                ids: Sequence[int] = ()) -> "IndexDelta":
+        """
+        A delta with the vectors under `removed` dropped, then the normalized
+        `embeddings` added under `ids`. To replace a vector, remove and add its id.
+        """
+        removed = np.unique(np.asarray(removed, dtype=np.int64))
+        ids = np.asarray(ids, dtype=np.int64)
+        # Copying the delta costs about its size, not the main index's
+        index = copy_index(self.index)
+        held = removed[np.isin(removed, self.ids)]
+        if len(held):
+            index.remove_ids(held)
+        if len(ids):
+            add_vectors(index, embeddings, ids)
+        kept = np.setdiff1d(self.ids, removed, assume_unique=True)
+        return IndexDelta(index, np.union1d(kept, ids), np.union1d(self.stale, removed))
+
+    def needs_compaction(self, main: faiss.Index) -> bool:
+        return len(self) > max(COMPACT_MIN_CHANGES, COMPACT_FRACTION * main.ntotal)
+
+    def compact(self, main: faiss.Index) -> faiss.Index:
+        """
+        A new main index holding the main index's vectors with this delta
+        applied. The main index itself is left as it is.
+        """
+        index = copy_index(main)
+        if len(self.stale):
+            index = remove_vectors(index, self.stale)
+        if len(self.ids):
+            add_vectors(index, self._vectors(), faiss.vector_to_array(self.index.id_map))
+        return index
+
+    def search(self,
+               main: faiss.Index,
+               queries: np.ndarray,
+               k: int,
+               nprobe: Optional[int] = None,
+               ef_search: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Search normalized queries in the main index with this delta applied.
+
+        Returns:
+            Scores and ids (-1 for no match) per query, as from index.search
+        """
+        distances, ids = self._search_main(main, queries, k, nprobe, ef_search)
+        if len(self.ids):
+            delta_distances, delta_ids = self.index.search(queries, min(k, len(self.ids)))
+            distances, ids = merge_results(distances, ids, delta_distances, delta_ids, k)
+        return distances, ids
+
+    def _search_main(self,
+                     main: faiss.Index,
+                     queries: np.ndarray,
+                     k: int,
+                     nprobe: Optional[int],
+                     ef_search: Optional[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Search the main index, skipping stale ids.
+        """
+        if len(self.stale):
+            selectivity = 1 - len(self.stale) / max(main.ntotal, 1)
+            params = filtered_search_params(main, excluding_selector(self.stale), selectivity, nprobe, ef_search)
+            if params is not None:
+                return main.search(queries, k, params=params)
+
+        params = search_params(main, nprobe=nprobe, ef_search=ef_search)
+        if not len(self.stale):
+            return main.search(queries, k, params=params)
+        # This index cannot skip ids during its scan: fetch enough more to drop the stale ones
+        distances, ids = main.search(queries, max(k, min(k + len(self.stale), main.ntotal)), params=params)
+        ids = np.where(np.isin(ids, self.stale), -1, ids)
+        return merge_results(distances, ids, distances[:, :0], ids[:, :0], k)
+
+    def vector_scores(self, main: faiss.Index, queries: np.ndarray, ids: Sequence[int]) -> np.ndarray:
+        """
+        Like index_factory.vector_scores for the main index with this delta
+        applied: ids held by the delta are scored with its vectors, stale ids
+        the delta does not hold score NaN.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(self):
+            return vector_scores(main, queries, ids)
+        single = np.ndim(queries) == 1
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, main.d)
+        held = np.isin(ids, self.ids)
+        current = ~held & ~np.isin(ids, self.stale)
+        scores = np.full((len(queries), len(ids)), np.nan, dtype=np.float32)
+        if current.any():
+            scores[:, current] = vector_scores(main, queries, ids[current])
+        if held.any():
+            scores[:, held] = vector_scores(self.index, queries, ids[held])
+        return scores[0] if single else scores
+
+    def stored_vectors(self, main: faiss.Index, ids: Sequence[int]) -> Optional[np.ndarray]:
+        """
+        Like index_factory.stored_vectors for the main index with this delta
+        applied (None if the main index only keeps compressed vectors).
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        held = np.isin(ids, self.ids)
+        vectors = stored_vectors(main, ids[~held])
+        if vectors is None or not held.any():
+            return vectors
+        result = np.empty((len(ids), main.d), dtype=np.float32)
+        result[~held] = vectors
+        result[held] = self.index.reconstruct_batch(ids[held])
+        return result
+
+    def _vectors(self) -> np.ndarray:
+        """
+        The delta's vectors, in the order of its id map.
+        """
+        return faiss.downcast_index(self.index.index).reconstruct_n(0, self.index.ntotal)
+
+    @property
+    def nbytes(self) -> int:
+        return self.index.ntotal * self.index.d * 4 + self.ids.nbytes + self.stale.nbytes
+
+    def save(self, path: str) -> None:
+        """
+        Write the delta into a state directory (nothing for an empty one).
+        """
+        if not len(self):
+            return
+        faiss.write_index(self.index, os.path.join(path, DELTA_INDEX_FILE))
+        np.save(os.path.join(path, DELTA_STALE_FILE), self.stale)
+
+    @classmethod
+    def load(cls, path: str, dim: int) -> "IndexDelta":
+        """
+        Read the delta saved in a state directory (an empty one if there is none).
+        """
+        index_path = os.path.join(path, DELTA_INDEX_FILE)
+        if not os.path.exists(index_path):
+            return cls.empty(dim)
+        index = faiss.read_index(index_path)
+        ids = np.sort(faiss.vector_to_array(index.id_map)).astype(np.int64)
+        return cls(index, ids, np.load(os.path.join(path, DELTA_STALE_FILE)))
+
+def merge_results(distances: np.ndarray,
+                  ids: np.ndarray,
+                  other_distances: np.ndarray,
+                  other_ids: np.ndarray,
+                  k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Best k of two sets of search results per query (ids of -1 are no match),
+    padded with -1 ids, as from index.search.
+    """
+    distances = np.concatenate([distances, other_distances], axis=1).astype(np.float32)
+    ids = np.concatenate([ids, other_ids], axis=1)
+    distances[ids < 0] = -np.inf
+    if distances.shape[1] < k:
+        pad = k - distances.shape[1]
+        distances = np.pad(distances, ((0, 0), (0, pad)), constant_values=-np.inf)
+        ids = np.pad(ids, ((0, 0), (0, pad)), constant_values=-1)
+    top = np.argsort(-distances, axis=1, kind="stable")[:, :k]
+    distances = np.take_along_axis(distances, top, axis=1)
+    ids = np.take_along_axis(ids, top, axis=1)
+    ids[np.isneginf(distances)] = -1
+    return distances, ids
@@ -0,0 +1,491 @@
+import math
+import faiss
+import functools
+import numpy as np
+from typing import Optional, Sequence, Tuple
+
+# Index types understood by create_index, besides "auto"
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq")
+
+# Vector storage: full float32, scalar-quantized to float16 or int8, or product-quantized
+COMPRESSIONS = ("none", "fp16", "int8", "pq")
+
+# Section counts at which "auto" switches to the next index type
+FLAT_MAX_VECTORS = 10_000
+HNSW_MAX_VECTORS = 200_000
+IVF_MAX_VECTORS = 1_000_000
+
+# Default search-time knobs, used when a search does not override them
+DEFAULT_NPROBE = 16
+DEFAULT_EF_SEARCH = 64
+DEFAULT_HNSW_M = 32
+
+# Largest efSearch a filtered HNSW search may be given (efSearch grows as the filter
+# narrows); filters needing more are searched by scoring their vectors directly
+MAX_FILTERED_EF_SEARCH = 1024
+
+def choose_index_type(num_vectors: int) -> str:
+    """
+    Pick an index type for a corpus of `num_vectors` sections. Small corpora
+    are scanned exactly, larger ones use graph or inverted-file indexes.
+    """
+    if num_vectors < FLAT_MAX_VECTORS:
+        return "flat"
+    if num_vectors < HNSW_MAX_VECTORS:
+        return "hnsw"
+    if num_vectors < IVF_MAX_VECTORS:
+        return "ivf"
+    return "ivfpq"
+
+def _pq_codec(num_vectors: int, dim: int) -> str:
+    # Largest sub-quantizer count dividing dim with at least 8 dims per code
+    pq_m = max(m for m in range(1, max(1, dim // 8) + 1) if dim % m == 0)
+    # Keep ~39 training points per PQ centroid
+    nbits = max(1, min(8, int(math.log2(max(2, num_vectors // 39)))))
+    return f"PQ{pq_m}x{nbits}"
+
+def index_description(index_type: str,
+                      num_vectors: int,
+                      dim: int,
+                      hnsw_m: int = DEFAULT_HNSW_M,
+                      compression: str = "none",
+                      rerank: int = 0) -> str:
+    """
+    Build the faiss.index_factory description string for an index type.
+
+    `compression` selects how vectors are stored (ivfpq is always
+    product-quantized). With `rerank`, full float32 vectors are kept next to
+    the compressed ones to rescore candidates exactly.
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression '{compression}', expected one of {COMPRESSIONS}")
+    codec = {"none": "Flat", "fp16": "SQfp16", "int8": "SQ8", "pq": _pq_codec(num_vectors, dim)}[compression]
+
+    if index_type == "flat":
+        description = codec
+    elif index_type == "hnsw":
+        if compression == "pq" and num_vectors >= 39 * 256:
+            # HNSW's PQ storage always uses 8-bit codes
+            description = f"HNSW{hnsw_m}_PQ{codec[2:].split('x')[0]}"
+        elif compression == "pq":
+            # Too few vectors to train 8-bit PQ codes; int8 is the next smallest
+            description = f"HNSW{hnsw_m},SQ8"
+        else:
+            description = f"HNSW{hnsw_m}" if compression == "none" else f"HNSW{hnsw_m},{codec}"
+    else:
+        # Keep ~39 training points per centroid, as recommended by FAISS
+        nlist = max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39))
+        if index_type == "ivf":
+            description = f"IVF{nlist},{codec}"
+        elif index_type == "ivfpq":
+            description = f"IVF{nlist},{_pq_codec(num_vectors, dim)}"
+        else:
+            raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES} or 'auto'")
+
+    # Reranking only helps when the stored vectors are compressed
+    if rerank and (compression != "none" or index_type == "ivfpq"):
+        description += ",RFlat"
+    return description
+
+def new_index(dim: int,
+              num_vectors: int,
+              index_type: str = "auto",
+              nprobe: int = DEFAULT_NPROBE,
+              ef_search: int = DEFAULT_EF_SEARCH,
+              hnsw_m: int = DEFAULT_HNSW_M,
+              compression: str = "none",
+              rerank: int = 0) -> faiss.Index:
+    """
+    Create an empty inner-product index sized for about `num_vectors` vectors.
+    Trained types (IVF) must be trained on training_size() vectors before
+    vectors are added; see create_index for the one-shot version.
+
+    Args:
+        dim: Embedding dimension
+        num_vectors: Expected number of vectors
+        index_type: One of INDEX_TYPES, or "auto" to choose by corpus size
+        nprobe: Default number of inverted lists visited per search (IVF types)
+        ef_search: Default search-time candidate list size (HNSW)
+        hnsw_m: Number of graph neighbours per node (HNSW)
+        compression: One of COMPRESSIONS, how vectors are stored
+        rerank: Rescore `rerank` x k candidates with exact vectors (0 disables)
+    """
+    if index_type == "auto":
+        index_type = choose_index_type(num_vectors)
+
+    description = index_description(index_type, num_vectors, dim, hnsw_m, compression=compression, rerank=rerank)
+    index = faiss.index_factory(dim, description, faiss.METRIC_INNER_PRODUCT)
+    # IVF indexes store ids natively, the others need an id map around them
+    if not isinstance(index, faiss.IndexIVF):
+        index = faiss.IndexIDMap2(index)
+    set_default_search_params(index, nprobe=nprobe, ef_search=ef_search, rerank=rerank)
+    return index
+
+def training_size(index: faiss.Index, num_vectors: int) -> int:
+    """
+    Number of vectors to train the index on (0 if it needs no training).
+    """
+    if index.is_trained:
+        return 0
+    inner = base_index(index)
+    centroids = inner.nlist if isinstance(inner, faiss.IndexIVF) else 1
+    pq = _product_quantizer(inner)
+    if pq is not None:
+        centroids = max(centroids, pq.ksub)
+    return min(num_vectors, 39 * centroids)
+
+def _product_quantizer(inner: faiss.Index) -> Optional[faiss.ProductQuantizer]:
+    if isinstance(inner, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return inner.pq
+    if isinstance(inner, faiss.IndexHNSW):
+        storage = faiss.downcast_index(inner.storage)
+        if isinstance(storage, faiss.IndexPQ):
+            return storage.pq
+    return None
+
+def create_index(embeddings: np.ndarray,
+                 index_type: str = "auto",
+                 ids: Optional[np.ndarray] = None,
+                 nprobe: int = DEFAULT_NPROBE,
+                 ef_search: int = DEFAULT_EF_SEARCH,
+                 hnsw_m: int = DEFAULT_HNSW_M,
+                 compression: str = "none",
+                 rerank: int = 0) -> faiss.Index:
+    """
+    Create, train and fill an inner-product index for the given (already
+    normalized) embeddings. Vectors are stored under the given ids, so
+    searches return ids rather than insertion positions.
+
+    Args:
+        embeddings: (N x D) float32 array of normalized vectors
+        index_type: One of INDEX_TYPES, or "auto" to choose by corpus size
+        ids: int64 id of each vector (defaults to 0..N-1)
+        nprobe: Default number of inverted lists visited per search (IVF types)
+        ef_search: Default search-time candidate list size (HNSW)
+        hnsw_m: Number of graph neighbours per node (HNSW)
+        compression: One of COMPRESSIONS, how vectors are stored
+        rerank: Rescore `rerank` x k candidates with exact vectors (0 disables)
+
+    Returns:
+        A populated faiss.Index
+    """
+    num_vectors, dim = embeddings.shape
+    if ids is None:
+        ids = np.arange(num_vectors, dtype=np.int64)
+
+    index = new_index(dim, num_vectors, index_type, nprobe=nprobe, ef_search=ef_search, hnsw_m=hnsw_m,
+                      compression=compression, rerank=rerank)
+    if not index.is_trained:
+        index.train(embeddings)
+    add_vectors(index, embeddings, ids)
+    return index
+
+def add_vectors(index: faiss.Index, embeddings: np.ndarray, ids: Sequence[int]) -> None:
+    """
+    Add normalized vectors under the given ids.
+    """
+    index.add_with_ids(embeddings, np.asarray(ids, dtype=np.int64))
+
+def remove_vectors(index: faiss.Index, ids: Sequence[int]) -> faiss.Index:
+    """
+    Remove the vectors stored under `ids`. Returns the index to use from now
+    on: HNSW graphs and reranking indexes do not support removal, so they are
+    rebuilt from their stored vectors (no re-embedding is needed).
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    wrapped = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else None
+    if not isinstance(wrapped, (faiss.IndexHNSW, faiss.IndexRefine)):
+        index.remove_ids(ids)
+        return index
+
+    all_ids = faiss.vector_to_array(index.id_map)
+    keep = ~np.isin(all_ids, ids)
+    # A reranking index reconstructs from its exact vectors
+    vectors = wrapped.reconstruct_n(0, wrapped.ntotal)[keep]
+    # An emptied copy keeps the type, training and search defaults
+    rebuilt = copy_index(index)
+    rebuilt.reset()
+    if len(vectors):
+        add_vectors(rebuilt, vectors, all_ids[keep])
+    return rebuilt
+
+def copy_index(index: faiss.Index) -> faiss.Index:
+    """
+    Return a private, writable copy of an index (also of a memory-mapped one).
+    """
+    ivf = base_index(index)
+    if not isinstance(ivf, faiss.IndexIVF) or isinstance(faiss.downcast_InvertedLists(ivf.invlists),
+                                                         faiss.ArrayInvertedLists):
+        return faiss.deserialize_index(faiss.serialize_index(index))
+
+    # Inverted lists mapped from disk serialize as a reference to their file,
+    # which the copy could not open: copy the lists into memory instead
+    reader = faiss.VectorIOReader()
+    faiss.copy_array_to_vector(faiss.serialize_index(index), reader.data)
+    copy = faiss.read_index(reader, faiss.IO_FLAG_SKIP_IVF_DATA)
+    lists = faiss.ArrayInvertedLists(ivf.nlist, ivf.code_size)
+    for list_no in range(ivf.nlist):
+        size = ivf.invlists.list_size(list_no)
+        if size:
+            lists.add_entries(list_no, size, ivf.invlists.get_ids(list_no), ivf.invlists.get_codes(list_no))
+    base_index(copy).replace_invlists(lists, True)
+    lists.this.disown()
+    return copy
+
+def stored_vectors(index: faiss.Index, ids: Sequence[int]) -> Optional[np.ndarray]:
+    """
+    Return the exact vectors stored under `ids`, or None if the index only
+    keeps compressed (lossy) vectors. Reranking indexes keep exact copies.
+    """
+    if compression_of(index) != "none" and refine_index(index) is None:
+        return None
+    ids = np.asarray(ids, dtype=np.int64)
+    if not len(ids):
+        return np.zeros((0, index.d), dtype=np.float32)
+    enable_id_lookup(index)
+    return np.vstack([index.reconstruct(int(i)) for i in ids]).astype(np.float32)
+
+def enable_id_lookup(index: faiss.Index) -> None:
+    """
+    Let an IVF index look vectors up by id, through a direct map built now.
+    Building it modifies the index, so do so before sharing it between threads.
+    """
+    if isinstance(index, faiss.IndexIVF) and not index.direct_map.type:
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+
+def vector_scores(index: faiss.Index, queries: np.ndarray, ids: Sequence[int]) -> np.ndarray:
+    """
+    Inner products of normalized query embeddings (one per row, or a single
+    vector) with the vectors stored under `ids`, without searching the rest of
+    the index and without modifying it. Compressed vectors give approximate
+    scores; ids the index does not hold score NaN.
+
+    Returns:
+        A (queries x ids) array, or a 1-D array for a single query vector
+    """
+    single = np.ndim(queries) == 1
+    queries = np.asarray(queries, dtype=np.float32).reshape(-1, index.d)
+    ids = np.asarray(ids, dtype=np.int64)
+    scores = np.full((len(queries), len(ids)), np.nan, dtype=np.float32)
+    if not len(ids):
+        return scores[0] if single else scores
+
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIVF):
+        # Unwrapped IVF has no id lookup without a direct map; search only the
+        # candidates instead, visiting every list so none are missed
+        params = faiss.SearchParametersIVF(sel=faiss.IDSelectorBatch(ids), nprobe=index.nlist)
+        distances, found = index.search(queries, len(ids), params=params)
+        order = np.argsort(ids)
+        rows, cols = np.nonzero(found >= 0)
+        positions = order[np.searchsorted(ids[order], found[rows, cols])]
+        scores[rows, positions] = distances[rows, cols]
+        return scores[0] if single else scores
+
+    try:
+        vectors = index.reconstruct_batch(ids)
+        scores = queries @ vectors.T
+    except RuntimeError:
+        # Some ids are missing; look them up one by one
+        for n, i in enumerate(ids):
+            try:
+                scores[:, n] = queries @ index.reconstruct(int(i))
+            except RuntimeError:
+                pass
+    return scores[0] if single else scores
+
+def id_selector(ids: np.ndarray, whole_range: bool = False) -> faiss.IDSelector:
+    """
+    FAISS selector admitting only the given (ascending) ids. With
+    `whole_range`, the ids are every indexed id from the first to the last, so
+    a range check replaces the set lookup.
+    """
+    if whole_range:
+        return faiss.IDSelectorRange(int(ids[0]), int(ids[-1]) + 1)
+    return faiss.IDSelectorBatch(np.ascontiguousarray(ids, dtype=np.int64))
+
+def excluding_selector(ids: np.ndarray) -> faiss.IDSelector:
+    """
+    FAISS selector admitting every id except the given ones.
+    """
+    excluded = faiss.IDSelectorBatch(np.ascontiguousarray(ids, dtype=np.int64))
+    selector = faiss.IDSelectorNot(excluded)
+    # The C++ selector holds a raw pointer; keep the Python object alive with it
+    selector.referenced_objects = [excluded]
+    return selector
+
+def base_index(index: faiss.Index) -> faiss.Index:
+    """
+    Return the innermost index, looking through ID maps, rerankers and other wrappers.
+    """
+    index = faiss.downcast_index(index)
+    while True:
+        if isinstance(index, faiss.IndexRefine):
+            index = faiss.downcast_index(index.base_index)
+        elif hasattr(index, "index") and isinstance(getattr(index, "index"), faiss.Index):
+            index = faiss.downcast_index(index.index)
+        else:
+            return index
+
+def refine_index(index: faiss.Index) -> Optional[faiss.IndexRefine]:
+    """
+    Return the reranking wrapper of an index, or None if it does not rerank.
+    """
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap):
+        index = faiss.downcast_index(index.index)
+    return index if isinstance(index, faiss.IndexRefine) else None
+
+def set_default_search_params(index: faiss.Index, nprobe: int, ef_search: int, rerank: int = 0) -> None:
+    """
+    Store default search knobs on the index itself so they are saved with it.
+    """
+    inner = base_index(index)
+    if isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = min(nprobe, inner.nlist)
+    elif isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = ef_search
+    refine = refine_index(index)
+    if refine is not None and rerank:
+        refine.k_factor = float(rerank)
+
+@functools.lru_cache(maxsize=None)
+def id_map_takes_params() -> bool:
+    """
+    Whether ID-mapped indexes accept per-search parameters. Older FAISS
+    releases reject any parameters given to an IndexIDMap.
+    """
+    index = faiss.IndexIDMap(faiss.IndexFlatIP(1))
+    vector = np.ones((1, 1), dtype=np.float32)
+    index.add_with_ids(vector, np.zeros(1, dtype=np.int64))
+    try:
+        index.search(vector, 1, params=faiss.SearchParameters())
+        return True
+    except RuntimeError:
+        return False
+
+def search_params(index: faiss.Index,
+                  nprobe: Optional[int] = None,
+                  ef_search: Optional[int] = None) -> Optional[faiss.SearchParameters]:
+    """
+    Build per-search parameters for the index, or None to use its defaults.
+    Unlike setting attributes on the index, this is safe under concurrent searches.
+    With a FAISS release whose ID maps take no parameters, ID-mapped indexes
+    always search with their defaults.
+    """
+    if isinstance(faiss.downcast_index(index), faiss.IndexIDMap) and not id_map_takes_params():
+        return None
+    inner = base_index(index)
+    params = None
+    if isinstance(inner, faiss.IndexIVF) and nprobe:
+        params = faiss.SearchParametersIVF(nprobe=min(nprobe, inner.nlist))
+    elif isinstance(inner, faiss.IndexHNSW) and ef_search:
+        params = faiss.SearchParametersHNSW(efSearch=ef_search)
+    return _with_refine(index, params)
+
+def filtered_search_params(index: faiss.Index,
+                           selector: faiss.IDSelector,
+                           selectivity: float,
+                           nprobe: Optional[int] = None,
+                           ef_search: Optional[int] = None) -> Optional[faiss.SearchParameters]:
+    """
+    Build parameters restricting a search to the ids `selector` admits, inside
+    the index scan. `selectivity` is the fraction of indexed vectors admitted:
+    IVF probes and the HNSW candidate list grow by its inverse, so a filtered
+    search still meets about as many admitted vectors as an unfiltered one.
+
+    Returns:
+        The parameters, or None if this index cannot filter well inside its
+        scan (product-quantized flat storage, a filter too narrow for HNSW, or
+        a FAISS release unable to pass a selector through the index's ID map
+        or reranker); score the admitted vectors with vector_scores instead
+    """
+    outer = faiss.downcast_index(index)
+    reranks = refine_index(index) is not None
+    if isinstance(outer, faiss.IndexIDMap):
+        if not id_map_takes_params() or (reranks and not hasattr(faiss, "IDSelectorTranslated")):
+            return None
+    inner = base_index(index)
+    selectivity = min(max(selectivity, 1e-9), 1.0)
+    if isinstance(inner, faiss.IndexIVF):
+        probes = math.ceil((nprobe or inner.nprobe) / selectivity)
+        params = faiss.SearchParametersIVF(nprobe=min(probes, inner.nlist))
+    elif isinstance(inner, faiss.IndexHNSW):
+        ef = math.ceil((ef_search or inner.hnsw.efSearch) / selectivity)
+        if ef > MAX_FILTERED_EF_SEARCH:
+            return None
+        params = faiss.SearchParametersHNSW(efSearch=ef)
+    elif isinstance(inner, faiss.IndexPQ):
+        return None
+    else:
+        params = faiss.SearchParameters()
+
+    if isinstance(outer, faiss.IndexIDMap) and reranks:
+        # The ID map translates the selector of the parameters it is given, but
+        # a reranker hands only its base parameters on, so translate those here
+        translated = faiss.IDSelectorTranslated(outer.id_map, selector)
+        params.sel = translated
+        params.referenced_objects = [translated, selector]
+    else:
+        params.sel = selector
+        params.referenced_objects = [selector]
+    return _with_refine(index, params)
+
+def _with_refine(index: faiss.Index, params: Optional[faiss.SearchParameters]) -> Optional[faiss.SearchParameters]:
+    """
+    Wrap base index parameters for a reranking index.
+    """
+    refine = refine_index(index)
+    if refine is None or params is None:
+        return params
+    if not hasattr(faiss, "IndexRefineSearchParameters"):
+        # Older FAISS cannot pass parameters through a reranker; use its defaults
+        return None
+    # Per-search parameters replace the reranker's own, so pass its k_factor along
+    refine_params = faiss.IndexRefineSearchParameters(k_factor=refine.k_factor)
+    refine_params.base_index_params = params
+    # The C++ struct holds a raw pointer; keep the Python object alive with it
+    refine_params.referenced_objects = [params]
+    return refine_params
+
+def compression_of(index: faiss.Index) -> str:
+    """
+    Return the COMPRESSIONS name of a built index's vector storage.
+    """
+    inner = base_index(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner = faiss.downcast_index(inner.storage)
+    if _product_quantizer(inner) is not None:
+        return "pq"
+    if isinstance(inner, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "fp16" if inner.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "int8"
+    return "none"
+
+def index_bytes(index: faiss.Index) -> int:
+    """
+    Size of the index's serialized form, a close estimate of its memory use.
+    """
+    return int(faiss.serialize_index(index).nbytes)
+
+def read_index_mmap(path: str) -> Tuple[faiss.Index, bool]:
+    """
+    Open a saved index read-only and memory-mapped where this FAISS build
+    supports it, so several processes can share its pages.
+
+    Returns:
+        The index, and whether it is memory-mapped. A memory-mapped index must
+        not be modified; change a copy_index copy instead.
+    """
+    flag_sets = []
+    if hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+        # Newer FAISS: maps flat code storage (flat, HNSW and IVF lists)
+        flag_sets.append(faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+    # Older FAISS: maps IVF inverted lists only
+    flag_sets.append(faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+
+    for flags in flag_sets:
+        try:
+            return faiss.read_index(path, flags), True
+        except RuntimeError:
+            continue
+    return faiss.read_index(path), False
@@ -0,0 +1,181 @@
+"""
+Recall-vs-latency report for the index types in search.index_factory.
+
+Compares every index type against an exact IndexFlatIP on the same vectors.
+Run from the src/ directory:
+
+    python -m search.index_report --sections 50000 --queries 200 --k 10
+
+With --compression, compares the vector storage modes of one index type
+instead, reporting memory saved against IndexFlatIP and recall with and
+without exact reranking:
+
+    python -m search.index_report --compression --type flat --rerank 0,4
+"""
+import argparse
+import json
+import time
+import faiss
+import numpy as np
+from typing import Dict, List, Optional, Sequence
+
+from search.index_factory import COMPRESSIONS, INDEX_TYPES, create_index, index_bytes, refine_index, search_params
+
+def synthetic_embeddings(num_vectors: int, dim: int, num_clusters: int = 64, seed: int = 0) -> np.ndarray:
+    """
+    Generate normalized, clustered vectors. Clustered data is closer to real
+    embeddings than isotropic noise, which no ANN index can search well.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((num_clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, num_clusters, size=num_vectors)
+    vectors = centers[labels] + 0.5 * rng.standard_normal((num_vectors, dim)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+def recall_at_k(truth: np.ndarray, found: np.ndarray) -> float:
+    """
+    Fraction of the exact top-k neighbours that appear in the approximate top-k.
+    """
+    k = truth.shape[1]
+    hits = sum(len(set(t) & set(f)) for t, f in zip(truth, found))
+    return hits / float(truth.shape[0] * k)
+
+def recall_latency_report(embeddings: np.ndarray,
+                          queries: np.ndarray,
+                          k: int = 10,
+                          index_types: Sequence[str] = INDEX_TYPES,
+                          nprobe_values: Sequence[int] = (1, 4, 16, 64),
+                          ef_search_values: Sequence[int] = (16, 64, 256)) -> List[Dict]:
+    """
+    Build each index type over `embeddings` and measure recall@k against the
+    flat index, plus per-query latency, for each value of its tuning knob.
+
+    Returns:
+        A list of result rows (one per index type and knob setting)
+    """
+    exact = create_index(embeddings.copy(), "flat")
+    _, truth = exact.search(queries, k)
+
+    rows = []
+    for index_type in index_types:
+        start = time.perf_counter()
+        index = create_index(embeddings.copy(), index_type)
+        build_s = time.perf_counter() - start
+
+        if index_type in ("ivf", "ivfpq"):
+            settings = [{"nprobe": n} for n in nprobe_values]
+        elif index_type == "hnsw":
+            settings = [{"ef_search": ef} for ef in ef_search_values]
+        else:
+            settings = [{}]
+
+        for knobs in settings:
+            found, latencies_ms = _measure(index, queries, k, search_params(index, **knobs))
+            rows.append({
+                "index_type": index_type,
+                **knobs,
+                "recall_at_k": round(recall_at_k(truth, found), 4),
+                "latency_p50_ms": round(float(np.percentile(latencies_ms, 50)), 4),
+                "latency_p99_ms": round(float(np.percentile(latencies_ms, 99)), 4),
+                "build_s": round(build_s, 3),
+            })
+    return rows
+
+def _measure(index: faiss.Index, queries: np.ndarray, k: int, params=None):
+    """
+    Search one query at a time. Returns the found ids and per-query latencies in ms.
+    """
+    latencies = []
+    found = np.empty((len(queries), k), dtype=np.int64)
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        _, ids = index.search(query.reshape(1, -1), k, params=params)
+        latencies.append(time.perf_counter() - start)
+        found[i] = ids[0]
+    return found, np.array(latencies) * 1000
+
+def compression_report(embeddings: np.ndarray,
+                       queries: np.ndarray,
+                       k: int = 10,
+                       index_type: str = "flat",
+                       compressions: Sequence[str] = COMPRESSIONS,
+                       rerank_values: Sequence[int] = (0, 4)) -> List[Dict]:
+    """
+    Build `index_type` with each vector storage mode and compare its size and
+    recall@k against an exact IndexFlatIP, with and without exact reranking.
+
+    `bytes` is the whole index; `rerank_bytes` is the part holding exact
+    vectors for reranking, which is memory-mapped (paged in only for
+    candidates) when the index is loaded from the cache. `bytes_saved`
+    compares the rest against the IndexFlatIP.
+
+    Returns:
+        A list of result rows (one per compression and rerank setting)
+    """
+    exact = create_index(embeddings.copy(), "flat")
+    exact_bytes = index_bytes(exact)
+    _, truth = exact.search(queries, k)
+
+    rows = []
+    for compression in compressions:
+        for rerank in rerank_values:
+            if compression == "none" and rerank:
+                # Nothing to rerank: the stored vectors are already exact
+                continue
+            start = time.perf_counter()
+            index = create_index(embeddings.copy(), index_type, compression=compression, rerank=rerank)
+            build_s = time.perf_counter() - start
+
+            found, latencies_ms = _measure(index, queries, k)
+            size = index_bytes(index)
+            refine = refine_index(index)
+            rerank_bytes = index_bytes(refine.refine_index) if refine is not None else 0
+            rows.append({
+                "index_type": index_type,
+                "compression": compression,
+                "rerank": rerank,
+                "bytes": size,
+                "rerank_bytes": rerank_bytes,
+                "bytes_saved": exact_bytes - (size - rerank_bytes),
+                "size_ratio": round((size - rerank_bytes) / exact_bytes, 4),
+                "recall_at_k": round(recall_at_k(truth, found), 4),
+                "latency_p50_ms": round(float(np.percentile(latencies_ms, 50)), 4),
+                "build_s": round(build_s, 3),
+            })
+    return rows
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sections", type=int, default=20000, help="Number of indexed vectors")
+    parser.add_argument("--dimension", type=int, default=384, help="Embedding dimension")
+    parser.add_argument("--queries", type=int, default=200, help="Number of query vectors")
+    parser.add_argument("--k", type=int, default=10, help="Neighbours per query")
+    parser.add_argument("--types", default=",".join(INDEX_TYPES), help="Comma-separated index types")
+    parser.add_argument("--compression", action="store_true", help="Compare vector storage modes instead")
+    parser.add_argument("--type", default="flat", help="Index type for --compression")
+    parser.add_argument("--compressions", default=",".join(COMPRESSIONS), help="Comma-separated storage modes")
+    parser.add_argument("--rerank", default="0,4", help="Comma-separated rerank factors for --compression")
+    args = parser.parse_args(argv)
+
+    vectors = synthetic_embeddings(args.sections + args.queries, args.dimension)
+    if args.compression:
+        rows = compression_report(
+            vectors[:args.sections],
+            vectors[args.sections:],
+            k=args.k,
+            index_type=args.type,
+            compressions=args.compressions.split(","),
+            rerank_values=[int(r) for r in args.rerank.split(",")],
+        )
+    else:
+        rows = recall_latency_report(
+            vectors[:args.sections],
+            vectors[args.sections:],
+            k=args.k,
+            index_types=args.types.split(","),
+        )
+    print(json.dumps(rows, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+from dataclasses import dataclass
+from typing import Optional
+
+import faiss
+
+from search.section_store import SectionStore
+from search.index_delta import IndexDelta
+from search.lexical_index import LexicalIndex
+from search.section_filter import SectionFilterIndex
+
+@dataclass(frozen=True)
+class IndexSnapshot:
+    """
+    One consistent, never modified set of index, sections, BM25 index and
+    metadata filter lookups. Search engines publish a new snapshot for every
+    build or change, so a search that took a snapshot keeps matching ones
+    however long it runs.
+    `version` increases with every snapshot and keys the query caches.
+    `delta` holds the vectors changed since `index` was built (see
+    IndexDelta); searches apply it to the index.
+    """
+    index: Optional[faiss.Index]
+    sections: SectionStore
+    version: int = 0
+    lexical: Optional[LexicalIndex] = None
+    filters: Optional[SectionFilterIndex] = None
+    delta: Optional[IndexDelta] = None
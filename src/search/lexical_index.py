@@ -0,0 +1,303 @@
+import os
+import re
+import json
+import numpy as np
+from array import array
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from search.term_section import TermSection
+
+# Bumped whenever tokenization or the on-disk layout changes; older files are rebuilt
+LEXICAL_FORMAT_VERSION = 2
+
+LEXICAL_META_FILE = "lexical.json"
+LEXICAL_TERMS_FILE = "lexical_terms.txt"
+LEXICAL_OFFSETS_FILE = "lexical_offsets.npy"
+LEXICAL_ROWS_FILE = "lexical_rows.npy"
+LEXICAL_TFS_FILE = "lexical_tfs.npy"
+LEXICAL_LENGTHS_FILE = "lexical_lengths.npy"
+LEXICAL_SECTION_IDS_FILE = "lexical_section_ids.npy"
+
+TOKEN_RE = re.compile(r"\w+")
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased word tokens of a text.
+    """
+    return TOKEN_RE.findall(text.lower())
+
+class LexicalIndexWriter:
+    """
+    Collects the terms of sections, added in ascending section_id order,
+    into the postings of a LexicalIndex.
+
+    Only each token's term id is recorded per section (4 bytes per token);
+    finish() counts term frequencies and groups postings by term with one
+    sort over all tokens rather than per-posting bookkeeping in Python.
+    """
+    def __init__(self, terms: Sequence[str] = ()):
+        """
+        Args:
+            terms: Vocabulary to number terms after (e.g. an existing index's),
+                   so its term ids stay valid
+        """
+        # Numbers terms in order of first appearance
+        self._term_ids: Dict[str, int] = defaultdict()
+        self._term_ids.update(zip(terms, range(len(terms))))
+        self._term_ids.default_factory = self._term_ids.__len__
+        self._tokens = array("i")
+        self._lengths = array("i")
+        self._section_ids = array("q")
+
+    def add(self, section: TermSection) -> None:
+        """
+        Index one section's title and content.
+        """
+        tokens = tokenize(f"{section.title} {section.content}")
+        self._tokens.extend(map(self._term_ids.__getitem__, tokens))
+        self._lengths.append(len(tokens))
+        self._section_ids.append(section.section_id)
+
+    def finish(self) -> "LexicalIndex":
+        """
+        Build the index from everything added so far.
+        """
+        terms, rows, tfs = self.postings()
+        return LexicalIndex(
+            terms=self.terms(),
+            offsets=_term_offsets(terms, len(self._term_ids)),
+            rows=rows.astype(np.int32),
+            tfs=tfs,
+            lengths=self.lengths(),
+            section_ids=self.section_ids()
+        )
+
+    def postings(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Term ids, rows (in order added) and term frequencies of every
+        posting so far, sorted by term, then row.
+        """
+        lengths = self.lengths()
+        tokens = np.frombuffer(self._tokens, dtype=np.int32) if self._tokens else np.zeros(0, dtype=np.int32)
+        num_rows = max(len(lengths), 1)
+        # One key per (term, row) pair, so sorting groups postings by term, then row
+        rows = np.repeat(np.arange(len(lengths), dtype=np.int64), lengths)
+        keys, tfs = np.unique(tokens.astype(np.int64) * num_rows + rows, return_counts=True)
+        return keys // num_rows, keys % num_rows, tfs.astype(np.int32)
+
+    def lengths(self) -> np.ndarray:
+        """
+        Token count of each section added so far.
+        """
+        return np.frombuffer(self._lengths, dtype=np.int32).copy() if self._lengths else np.zeros(0, dtype=np.int32)
+
+    def section_ids(self) -> np.ndarray:
+        """
+        section_id of each section added so far.
+        """
+        return np.frombuffer(self._section_ids, dtype=np.int64).copy() if self._section_ids else np.zeros(0, np.int64)
+
+    def terms(self) -> List[str]:
+        """
+        Vocabulary so far, by term id.
+        """
+        return list(self._term_ids)
+
+class LexicalIndex:
+    """
+    BM25 inverted index over section titles and contents.
+
+    Postings are stored as flat arrays (per term: an offset range of section
+    rows and term frequencies), saved next to the FAISS index and
+    memory-mapped on load, like the SectionStore. A search only touches the
+    postings of the query's terms, so it needs no embedding and takes well
+    under a millisecond for typical queries.
+    """
+    def __init__(self,
+                 terms: List[str],
+                 offsets: np.ndarray,
+                 rows: np.ndarray,
+                 tfs: np.ndarray,
+                 lengths: np.ndarray,
+                 section_ids: np.ndarray,
+                 k1: float = 1.5,
+                 b: float = 0.75):
+        """
+        Args:
+            terms: Vocabulary; term i's postings are rows/tfs[offsets[i]:offsets[i + 1]]
+            offsets: int64 posting offsets per term (len(terms) + 1)
+            rows: Section row of each posting
+            tfs: Term frequency of each posting
+            lengths: Token count of each section row
+            section_ids: section_id of each row
+            k1: BM25 term frequency saturation
+            b: BM25 length normalization
+        """
+        self.terms = terms
+        self.term_ids = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.rows = rows
+        self.tfs = tfs
+        self.lengths = lengths
+        self.section_ids = section_ids
+        self.k1 = k1
+        self.b = b
+        avg_length = float(lengths.mean()) if len(lengths) else 1.0
+        # Per-row denominator term of BM25, computed once
+        self._norms = (k1 * (1 - b + b * lengths / max(avg_length, 1e-9))).astype(np.float32)
+
+    @classmethod
+    def from_sections(cls, sections: Iterable[TermSection]) -> "LexicalIndex":
+        """
+        Build an index over sections (in ascending section_id order).
+        """
+        writer = LexicalIndexWriter()
+        for section in sections:
+            writer.add(section)
+        return writer.finish()
+
+    def with_changes(self, upserts: Iterable[TermSection] = (), removed: Iterable[int] = ()) -> "LexicalIndex":
+        """
+        A copy of the index with `upserts` indexed (replacing any sections
+        with the same ids) and the sections with ids in `removed` dropped.
+        Only the changed sections are tokenized; the postings of the others
+        are carried over with their rows renumbered. This index is left
+        unchanged.
+        """
+        writer = LexicalIndexWriter(self.terms)
+        for section in sorted(upserts, key=lambda sec: sec.section_id):
+            writer.add(section)
+        new_terms, new_rows, new_tfs = writer.postings()
+        new_ids = writer.section_ids()
+
+        section_ids = np.asarray(self.section_ids)
+        replaced = np.union1d(np.asarray(list(removed), dtype=np.int64), new_ids)
+        pos = np.minimum(np.searchsorted(section_ids, replaced), max(len(section_ids) - 1, 0))
+        dropped = np.zeros(len(section_ids), dtype=bool)
+        if len(section_ids):
+            dropped[pos[section_ids[pos] == replaced]] = True
+        kept_ids = section_ids[~dropped]
+        insert_at = np.searchsorted(kept_ids, new_ids)
+        merged_ids = np.insert(kept_ids, insert_at, new_ids)
+        num_rows = max(len(merged_ids), 1)
+
+        # Rows keep their order, so renumbered postings stay sorted by (term, row)
+        row_map = np.searchsorted(merged_ids, section_ids)
+        rows = np.asarray(self.rows)
+        keep = ~dropped[rows]
+        old_terms = np.repeat(np.arange(len(self.terms), dtype=np.int64), np.diff(self.offsets))
+        old_keys = old_terms[keep] * num_rows + row_map[rows[keep]]
+        new_keys = new_terms * num_rows + np.searchsorted(merged_ids, new_ids)[new_rows]
+        at = np.searchsorted(old_keys, new_keys)
+        keys = np.insert(old_keys, at, new_keys)
+        terms = writer.terms()
+        return LexicalIndex(
+            terms=terms,
+            offsets=_term_offsets(keys // num_rows, len(terms)),
+            rows=(keys % num_rows).astype(np.int32),
+            tfs=np.insert(np.asarray(self.tfs)[keep], at, new_tfs),
+            lengths=np.insert(np.asarray(self.lengths)[~dropped], insert_at, writer.lengths()),
+            section_ids=merged_ids,
+            k1=self.k1,
+            b=self.b
+        )
+
+    def __len__(self) -> int:
+        return len(self.section_ids)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.offsets, self.rows, self.tfs, self.lengths, self.section_ids, self._norms)
+        return sum(a.nbytes for a in arrays) + sum(len(t) for t in self.terms)
+
+    def search(self, query: str, k: int, row_ranges: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Rank sections by BM25 score for a query.
+
+        Args:
+            query: Query text
+            k: Number of sections to return
+            row_ranges: Only rank rows in these sorted, disjoint [start, end)
+                ranges (R x 2), e.g. from SectionFilterIndex.rows; None ranks all
+
+        Returns:
+            The section ids and scores of the (at most k) best sections sharing
+            a term with the query, best first
+        """
+        term_ids = [self.term_ids[t] for t in set(tokenize(query)) if t in self.term_ids]
+        if not term_ids or k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        num_rows = len(self.section_ids)
+        all_rows, all_scores = [], []
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            rows = np.asarray(self.rows[start:end])
+            tfs = np.asarray(self.tfs[start:end], dtype=np.float32)
+            df = end - start
+            idf = np.log1p((num_rows - df + 0.5) / (df + 0.5))
+            all_rows.append(rows)
+            all_scores.append(idf * tfs * (self.k1 + 1) / (tfs + self._norms[rows]))
+
+        rows = np.concatenate(all_rows)
+        scores = np.concatenate(all_scores)
+        if row_ranges is not None:
+            # Rows inside a range land on an odd position among the range bounds
+            keep = np.searchsorted(np.asarray(row_ranges).ravel(), rows, side="right") % 2 == 1
+            rows, scores = rows[keep], scores[keep]
+            if not len(rows):
+                return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        rows, inverse = np.unique(rows, return_inverse=True)
+        scores = np.bincount(inverse, weights=scores).astype(np.float32)
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return self.section_ids[rows[top]], scores[top]
+
+    def save(self, path: str) -> None:
+        """
+        Write the index into a state directory.
+        """
+        np.save(os.path.join(path, LEXICAL_OFFSETS_FILE), self.offsets)
+        np.save(os.path.join(path, LEXICAL_ROWS_FILE), self.rows)
+        np.save(os.path.join(path, LEXICAL_TFS_FILE), self.tfs)
+        np.save(os.path.join(path, LEXICAL_LENGTHS_FILE), self.lengths)
+        np.save(os.path.join(path, LEXICAL_SECTION_IDS_FILE), self.section_ids)
+        # Tokens never contain a newline; plain lines write far faster than JSON
+        with open(os.path.join(path, LEXICAL_TERMS_FILE), "w", encoding="utf-8") as f:
+            f.write("\n".join(self.terms))
+        with open(os.path.join(path, LEXICAL_META_FILE), "w", encoding="utf-8") as f:
+            json.dump({"format_version": LEXICAL_FORMAT_VERSION, "k1": self.k1, "b": self.b}, f)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["LexicalIndex"]:
+        """
+        Open an index saved in a state directory, memory-mapping its postings.
+        Returns None if there is none, or it was saved in an older format.
+        """
+        try:
+            with open(os.path.join(path, LEXICAL_META_FILE), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("format_version") != LEXICAL_FORMAT_VERSION:
+                return None
+            with open(os.path.join(path, LEXICAL_TERMS_FILE), "r", encoding="utf-8") as f:
+                text = f.read()
+            terms = text.split("\n") if text else []
+            arrays = [np.load(os.path.join(path, name), mmap_mode="r") for name in (
+                LEXICAL_OFFSETS_FILE, LEXICAL_ROWS_FILE, LEXICAL_TFS_FILE, LEXICAL_LENGTHS_FILE, LEXICAL_SECTION_IDS_FILE
+            )]
+        except (OSError, ValueError, KeyError):
+            return None
+        return cls(terms, *arrays, k1=meta["k1"], b=meta["b"])
+
+def _term_offsets(terms: np.ndarray, num_terms: int) -> np.ndarray:
+    """
+    Posting offsets per term (num_terms + 1) of postings sorted by term.
+    """
+    offsets = np.zeros(num_terms + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(terms, minlength=num_terms))
+    return offsets
@@ -0,0 +1,61 @@
+import hashlib
+from dataclasses import dataclass, asdict
+from typing import Dict, Optional
+
+# Bump whenever search.splitter changes how text is split into sections,
+# so indexes saved with the old splitting are rebuilt
+SPLITTER_VERSION = 1
+
+@dataclass
+class IndexManifest:
+    """
+    What a saved index was built from. Saved with each state version (next
+    to the per-section content hashes of its SectionStore) and checked on
+    load, so an index is never served with vectors from another provider,
+    dimension or splitter, or for a source file that has since changed.
+    """
+    provider: str
+    dimension: int
+    splitter_version: int = SPLITTER_VERSION
+    # SHA-256 of the markdown file the index was built from (None if built from text)
+    source_hash: Optional[str] = None
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict]) -> Optional["IndexManifest"]:
+        """
+        Read a manifest saved by to_dict, or return None if there is none.
+        """
+        if not data:
+            return None
+        return cls(
+            provider=data["provider"],
+            dimension=data["dimension"],
+            splitter_version=data["splitter_version"],
+            source_hash=data.get("source_hash")
+        )
+
+    def vectors_mismatch(self, other: "IndexManifest") -> Optional[str]:
+        """
+        Explain why vectors and sections saved under this manifest can't be
+        used with `other`, or return None if they can.
+        """
+        if self.provider != other.provider:
+            return f"embedding provider changed from {self.provider} to {other.provider}"
+        if self.dimension != other.dimension:
+            return f"embedding dimension changed from {self.dimension} to {other.dimension}"
+        if self.splitter_version != other.splitter_version:
+            return f"splitter version changed from {self.splitter_version} to {other.splitter_version}"
+        return None
+
+def file_hash(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    SHA-256 of a file's contents, read in chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
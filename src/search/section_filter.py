@@ -0,0 +1,221 @@
+import numpy as np
+from dataclasses import dataclass, fields
+from typing import Callable, Dict, List, Optional
+
+from search.section_store import SectionStore
+
+@dataclass(frozen=True)
+class SectionFilter:
+    """
+    Restricts a search to some sections. All given conditions must hold.
+
+    Attributes:
+        title: Title of the section's heading (case-insensitive)
+        min_section_id: Smallest section_id (inclusive)
+        max_section_id: Largest section_id (inclusive)
+        start_idx: Sections must start at or after this character offset
+        end_idx: Sections must end at or before this character offset
+        document_id: Document of the section, for corpora built by build_corpus
+                     (offsets are then within each document)
+    """
+    title: Optional[str] = None
+    min_section_id: Optional[int] = None
+    max_section_id: Optional[int] = None
+    start_idx: Optional[int] = None
+    end_idx: Optional[int] = None
+    document_id: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict]) -> Optional["SectionFilter"]:
+        """
+        Parse a filter from a request body, or return None for an empty one.
+
+        Raises:
+            ValueError: On unknown keys or values of the wrong type
+        """
+        if not data:
+            return None
+        if not isinstance(data, dict):
+            raise ValueError("filter must be an object")
+        known = {f.name for f in fields(cls)}
+        unknown = set(data) - known
+        if unknown:
+            raise ValueError(f"Unknown filter key(s): {', '.join(sorted(unknown))}")
+        values = {}
+        for key, value in data.items():
+            if value is None:
+                continue
+            if key in ("title", "document_id"):
+                if not isinstance(value, str):
+                    raise ValueError(f"filter {key} must be a string")
+            elif isinstance(value, bool) or not isinstance(value, int):
+                raise ValueError(f"filter {key} must be an integer")
+            values[key] = value
+        return cls(**values) if values else None
+
+def _runs(values: np.ndarray) -> np.ndarray:
+    """
+    Runs of equal consecutive values, as a (R x 3) array of [start, end, value].
+    """
+    values = np.asarray(values)
+    if not len(values):
+        return np.zeros((0, 3), dtype=np.int64)
+    bounds = np.flatnonzero(np.diff(values)) + 1
+    starts = np.concatenate(([0], bounds)).astype(np.int64)
+    ends = np.concatenate((bounds, [len(values)])).astype(np.int64)
+    return np.stack([starts, ends, values[starts].astype(np.int64)], axis=1)
+
+def _rows_by_name(runs: np.ndarray, names: List[str], key: Callable[[str], str]) -> Dict[str, np.ndarray]:
+    """
+    Sorted [start, end) row ranges of each name's runs, with names mapped by `key`
+    (runs with a negative value have no name).
+    """
+    runs = runs[runs[:, 2] >= 0]
+    # Group the runs by value with one sort rather than a scan per name
+    order = np.argsort(runs[:, 2], kind="stable")
+    groups = np.split(order, np.flatnonzero(np.diff(runs[order, 2])) + 1) if len(order) else []
+    rows_by_name: Dict[str, np.ndarray] = {}
+    for group in groups:
+        name = key(names[runs[group[0], 2]])
+        rows = runs[group, :2]
+        if name in rows_by_name:
+            # Names mapping to the same key
+            rows = np.concatenate([rows_by_name[name], rows])
+            rows = rows[np.argsort(rows[:, 0])]
+        rows_by_name[name] = rows
+    return rows_by_name
+
+def _intersect(ranges: np.ndarray, other: np.ndarray) -> np.ndarray:
+    """
+    Intersection of two sets of sorted, disjoint [start, end) ranges.
+    """
+    parts = []
+    for start, end in ranges:
+        first = np.searchsorted(other[:, 1], start, side="right")
+        last = np.searchsorted(other[:, 0], end, side="left")
+        parts.append(np.clip(other[first:last], start, end))
+    return np.concatenate(parts) if parts else np.zeros((0, 2), dtype=np.int64)
+
+class SectionFilterIndex:
+    """
+    Precomputed lookups from section metadata to the rows (positions in
+    section_id order) a SectionFilter selects, as sorted [start, end) row
+    ranges. Sections are stored in document order, so each run of sections
+    under one heading, a document, a section id range and a character span
+    within a document are each a contiguous block of rows; no per-section
+    scan is needed at query time.
+    """
+    def __init__(self,
+                 section_ids: np.ndarray,
+                 title_ids: np.ndarray,
+                 titles: List[str],
+                 spans: np.ndarray,
+                 document_ids: Optional[np.ndarray] = None,
+                 documents: Optional[List[str]] = None):
+        """
+        Args:
+            section_ids: Ascending section ids, one per row
+            title_ids: Index into `titles` of each row's title
+            titles: Distinct titles
+            spans: (start_idx, end_idx, ...) columns of each row
+            document_ids: Index into `documents` of each row's document (-1 for none)
+            documents: Distinct document ids
+        """
+        self.section_ids = section_ids
+        self.starts = np.asarray(spans[:, 0]) if len(spans) else np.zeros(0, dtype=np.int64)
+        self.ends = np.asarray(spans[:, 1]) if len(spans) else np.zeros(0, dtype=np.int64)
+
+        self._title_ids = title_ids
+        self._titles = titles
+        self._document_ids = document_ids if document_ids is not None else np.full(len(section_ids), -1, np.int32)
+        self._documents = documents or []
+        # Built on the first filter needing them
+        self._title_rows: Optional[Dict[str, np.ndarray]] = None
+        self._document_runs: Optional[np.ndarray] = None
+        self._document_rows: Optional[Dict[str, np.ndarray]] = None
+
+    @property
+    def title_rows(self) -> Dict[str, np.ndarray]:
+        """
+        Row ranges of each (case-folded) title: one per run of consecutive
+        sections under a heading with that title.
+        """
+        if self._title_rows is None:
+            self._title_rows = _rows_by_name(_runs(self._title_ids), self._titles, lambda t: t.strip().casefold())
+        return self._title_rows
+
+    @property
+    def document_runs(self) -> np.ndarray:
+        """
+        Row ranges of consecutive sections of one document (or of none), in
+        each of which character offsets ascend.
+        """
+        if self._document_runs is None:
+            self._document_runs = _runs(self._document_ids)[:, :2]
+        return self._document_runs
+
+    @property
+    def document_rows(self) -> Dict[str, np.ndarray]:
+        """
+        Row ranges of each document.
+        """
+        if self._document_rows is None:
+            self._document_rows = _rows_by_name(_runs(self._document_ids), self._documents, lambda d: d)
+        return self._document_rows
+
+    @classmethod
+    def from_store(cls, store: SectionStore) -> "SectionFilterIndex":
+        """
+        Build from a SectionStore's columns, without materializing its sections.
+        """
+        return cls(store.section_ids, store.title_ids, store.titles, store.spans, store.document_ids, store.documents)
+
+    def __len__(self) -> int:
+        return len(self.section_ids)
+
+    def rows(self, section_filter: SectionFilter) -> np.ndarray:
+        """
+        The rows a filter selects, as a (R x 2) array of sorted, disjoint
+        [start, end) row ranges (empty if nothing matches).
+        """
+        f = section_filter
+        lo, hi = 0, len(self.section_ids)
+        if f.min_section_id is not None:
+            lo = max(lo, int(np.searchsorted(self.section_ids, f.min_section_id, side="left")))
+        if f.max_section_id is not None:
+            hi = min(hi, int(np.searchsorted(self.section_ids, f.max_section_id, side="right")))
+
+        if f.document_id is not None:
+            blocks = self.document_rows.get(f.document_id, np.zeros((0, 2), dtype=np.int64))
+        elif f.start_idx is not None or f.end_idx is not None:
+            # Offsets only ascend within a document
+            blocks = self.document_runs
+        else:
+            blocks = np.array([[0, len(self.section_ids)]], dtype=np.int64)
+
+        ranges = []
+        for start, end in blocks:
+            start, end = max(int(start), lo), min(int(end), hi)
+            if f.start_idx is not None and start < end:
+                start += int(np.searchsorted(self.starts[start:end], f.start_idx, side="left"))
+            if f.end_idx is not None and start < end:
+                end = start + int(np.searchsorted(self.ends[start:end], f.end_idx, side="right"))
+            if start < end:
+                ranges.append((start, end))
+        ranges = np.array(ranges, dtype=np.int64).reshape(-1, 2)
+
+        if f.title is not None:
+            ranges = _intersect(ranges, self.title_rows.get(f.title.strip().casefold(), np.zeros((0, 2), dtype=np.int64)))
+        return ranges[ranges[:, 1] > ranges[:, 0]]
+
+    def ids(self, rows: np.ndarray) -> np.ndarray:
+        """
+        The section ids of row ranges (see rows).
+        """
+        if not len(rows):
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate([self.section_ids[a:b] for a, b in rows]).astype(np.int64)
+
+    @staticmethod
+    def count(rows: np.ndarray) -> int:
+        return int((rows[:, 1] - rows[:, 0]).sum())
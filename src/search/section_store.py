@@ -0,0 +1,440 @@
+import io
+import os
+import json
+import time
+import hashlib
+import shutil
+import numpy as np
+from typing import Dict, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+from search.term_section import TermSection
+
+# Bumped whenever the on-disk layout changes
+STORE_FORMAT_VERSION = 4
+
+CURRENT_FILE = "CURRENT"
+INDEX_FILE = "index.faiss"
+META_FILE = "meta.json"
+CONTENT_FILE = "content.bin"
+CONTENT_OFFSETS_FILE = "content_offsets.npy"
+SECTION_IDS_FILE = "section_ids.npy"
+TITLE_IDS_FILE = "title_ids.npy"
+SPANS_FILE = "spans.npy"
+CONTENT_HASHES_FILE = "content_hashes.npy"
+DOCUMENT_IDS_FILE = "document_ids.npy"
+TIMES_FILE = "times.npy"
+SPEAKER_IDS_FILE = "speaker_ids.npy"
+DELTA_INDEX_FILE = "delta.faiss"
+DELTA_STALE_FILE = "delta_stale.npy"
+
+# Per-row columns (all but content_offsets, which has one more entry) and their files
+COLUMN_FILES = {
+    "content_offsets": CONTENT_OFFSETS_FILE,
+    "section_ids": SECTION_IDS_FILE,
+    "title_ids": TITLE_IDS_FILE,
+    "spans": SPANS_FILE,
+    "content_hashes": CONTENT_HASHES_FILE,
+    "document_ids": DOCUMENT_IDS_FILE,
+    "times": TIMES_FILE,
+    "speaker_ids": SPEAKER_IDS_FILE,
+}
+ROW_COLUMNS = tuple(name for name in COLUMN_FILES if name != "content_offsets")
+
+# Bytes per section content hash
+HASH_SIZE = 16
+
+def content_hash(content: str) -> bytes:
+    """
+    Hash of a section's content, as stored by SectionStoreWriter.
+    """
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=HASH_SIZE).digest()
+
+class SpanShift(NamedTuple):
+    """
+    Moves the spans of the sections of one document (None for sections
+    without one) that start after `after_idx` by `delta` characters and
+    `byte_delta` bytes, as when an earlier section's text changed length.
+    """
+    document_id: Optional[str]
+    after_idx: int
+    delta: int
+    byte_delta: int
+
+class SectionStoreWriter:
+    """
+    Streams sections into the columnar format read by SectionStore: one
+    contiguous UTF-8 blob of section contents, plus NumPy arrays of blob
+    offsets, section ids, title ids, (start_idx, end_idx, start_byte, end_byte)
+    spans, content hashes, document ids, (start_ms, end_ms) times and speaker
+    ids (-1 where a section has no document, time or speaker).
+    Sections must be added in ascending section_id order.
+
+    With a `path` the store is written to disk (close), without one it is
+    kept in memory (to_store).
+    """
+    def __init__(self,
+                 path: Optional[str] = None,
+                 titles: Sequence[str] = (),
+                 documents: Sequence[str] = (),
+                 speakers: Sequence[str] = ()):
+        """
+        Args:
+            path: Directory to write the store into (None keeps it in memory)
+            titles: Titles already numbered, e.g. by a store the added
+                    sections will be merged into; new ones are numbered after them
+            documents: Document ids already numbered, likewise
+            speakers: Speakers already numbered, likewise
+        """
+        self.path = path
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            self._content = open(os.path.join(path, CONTENT_FILE), "wb")
+        else:
+            self._content = io.BytesIO()
+        self._content_offsets: List[int] = [0]
+        self._section_ids: List[int] = []
+        self._title_ids: List[int] = []
+        self._spans: List[tuple] = []
+        self._content_hashes: List[bytes] = []
+        self._document_ids: List[int] = []
+        self._times: List[tuple] = []
+        self._speaker_ids: List[int] = []
+        self._titles: Dict[str, int] = {name: i for i, name in enumerate(titles)}
+        self._documents: Dict[str, int] = {name: i for i, name in enumerate(documents)}
+        self._speakers: Dict[str, int] = {name: i for i, name in enumerate(speakers)}
+
+    def add(self, section: TermSection) -> None:
+        """
+        Append one TermSection.
+        """
+        data = section.content.encode("utf-8")
+        self._content.write(data)
+        self._content_offsets.append(self._content_offsets[-1] + len(data))
+        self._section_ids.append(section.section_id)
+        self._title_ids.append(self._titles.setdefault(section.title, len(self._titles)))
+        self._spans.append((section.start_idx, section.end_idx, section.start_byte, section.end_byte))
+        self._content_hashes.append(hashlib.blake2b(data, digest_size=HASH_SIZE).digest())
+        self._document_ids.append(_name_id(self._documents, section.document_id))
+        self._times.append((-1 if section.start_ms is None else section.start_ms,
+                            -1 if section.end_ms is None else section.end_ms))
+        self._speaker_ids.append(_name_id(self._speakers, section.speaker))
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        """
+        The arrays of the sections added so far, by name (see COLUMN_FILES).
+        """
+        return {
+            "content_offsets": np.asarray(self._content_offsets, dtype=np.int64),
+            "section_ids": np.asarray(self._section_ids, dtype=np.int64),
+            "title_ids": np.asarray(self._title_ids, dtype=np.int32),
+            "spans": np.asarray(self._spans, dtype=np.int64).reshape(-1, 4),
+            "content_hashes": np.frombuffer(b"".join(self._content_hashes), dtype=np.uint8).reshape(-1, HASH_SIZE),
+            "document_ids": np.asarray(self._document_ids, dtype=np.int32),
+            "times": np.asarray(self._times, dtype=np.int64).reshape(-1, 2),
+            "speaker_ids": np.asarray(self._speaker_ids, dtype=np.int32),
+        }
+
+    def names(self) -> Dict[str, List[str]]:
+        """
+        Titles, document ids and speakers, in the order the arrays number them.
+        """
+        return {"titles": list(self._titles), "documents": list(self._documents), "speakers": list(self._speakers)}
+
+    def close(self, meta: Optional[Dict] = None) -> None:
+        """
+        Write the arrays and metadata. `meta` holds any extra JSON-serializable state.
+        """
+        self._content.close()
+        _write_store(self.path, self.columns(), self.names(), meta)
+
+    def discard(self) -> None:
+        """
+        Stop writing and delete the store's directory, e.g. after a failed build.
+        """
+        self._content.close()
+        if self.path is not None:
+            shutil.rmtree(self.path, ignore_errors=True)
+
+    def to_store(self, meta: Optional[Dict] = None) -> "SectionStore":
+        """
+        The sections added so far, as an in-memory SectionStore.
+        """
+        return SectionStore.from_columns(self.columns(), self._content_array(), self.names(), meta)
+
+    def _content_array(self) -> np.ndarray:
+        return np.frombuffer(self._content.getvalue(), dtype=np.uint8)
+
+class SectionStore(Mapping):
+    """
+    Read-only mapping of section_id -> TermSection over the columnar arrays
+    of SectionStoreWriter. Opened from a directory, all arrays are
+    memory-mapped, so opening a store is near-instant and processes opening
+    the same files share their pages. from_sections builds a store in memory.
+
+    with_changes derives an edited store by splicing the arrays, without
+    materializing the unchanged sections: an edit costs a few array copies
+    plus Python work for the changed sections only.
+    """
+    def __init__(self, path: str):
+        with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+            meta: Dict = json.load(f)
+        if meta.get("format_version") != STORE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported section store format: {meta.get('format_version')}")
+
+        columns = {name: np.load(os.path.join(path, filename), mmap_mode="r")
+                   for name, filename in COLUMN_FILES.items()}
+        content_path = os.path.join(path, CONTENT_FILE)
+        # np.memmap cannot map an empty file
+        if os.path.getsize(content_path):
+            content = np.memmap(content_path, dtype=np.uint8, mode="r")
+        else:
+            content = np.zeros(0, dtype=np.uint8)
+        self._init(path, meta, columns, content)
+
+    def _init(self, path: Optional[str], meta: Dict, columns: Dict[str, np.ndarray], content: np.ndarray) -> None:
+        self.path = path
+        self.meta = meta
+        self.titles: List[str] = meta["titles"]
+        self.documents: List[str] = meta["documents"]
+        self.speakers: List[str] = meta["speakers"]
+        self.content = content
+        self.content_offsets = columns["content_offsets"]
+        self.section_ids = columns["section_ids"]
+        self.title_ids = columns["title_ids"]
+        self.spans = columns["spans"]
+        self.content_hashes = columns["content_hashes"]
+        self.document_ids = columns["document_ids"]
+        self.times = columns["times"]
+        self.speaker_ids = columns["speaker_ids"]
+
+    @classmethod
+    def from_columns(cls,
+                     columns: Dict[str, np.ndarray],
+                     content: np.ndarray,
+                     names: Dict[str, List[str]],
+                     meta: Optional[Dict] = None) -> "SectionStore":
+        """
+        An in-memory store over arrays laid out as SectionStoreWriter.columns
+        returns them, with the content blob and names they refer to.
+        """
+        store = cls.__new__(cls)
+        store._init(None, {**(meta or {}), "format_version": STORE_FORMAT_VERSION, **names}, columns, content)
+        return store
+
+    @classmethod
+    def from_sections(cls, sections: Iterable[TermSection], meta: Optional[Dict] = None) -> "SectionStore":
+        """
+        An in-memory store of sections given in ascending section_id order.
+        """
+        writer = SectionStoreWriter()
+        for section in sections:
+            writer.add(section)
+        return writer.to_store(meta)
+
+    def save(self, path: str, meta: Optional[Dict] = None) -> None:
+        """
+        Write the store into a directory, to be opened with SectionStore(path).
+        `meta` holds any extra JSON-serializable state.
+        """
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, CONTENT_FILE), "wb") as f:
+            f.write(np.ascontiguousarray(self.content).tobytes())
+        _write_store(path, self._columns(), self._names(), meta)
+
+    def with_changes(self,
+                     upserts: Iterable[TermSection] = (),
+                     removed: Iterable[int] = (),
+                     shift: Optional[SpanShift] = None) -> "SectionStore":
+        """
+        An in-memory copy of the store with `upserts` added (replacing any
+        sections with the same ids), the sections with ids in `removed`
+        dropped, and then `shift` applied. This store is left unchanged.
+        """
+        writer = SectionStoreWriter(titles=self.titles, documents=self.documents, speakers=self.speakers)
+        for section in sorted(upserts, key=lambda sec: sec.section_id):
+            writer.add(section)
+        new = writer.columns()
+        new_content = writer._content_array()
+
+        ids = np.asarray(self.section_ids)
+        replaced = np.union1d(np.asarray(list(removed), dtype=np.int64), new["section_ids"])
+        rows = np.searchsorted(ids, replaced)
+        found = rows < len(ids)
+        rows = rows[found][ids[rows[found]] == replaced[found]]
+        plan = _splice_plan(len(ids), rows, np.searchsorted(ids, new["section_ids"]))
+
+        columns = {name: _take(plan, getattr(self, name), new[name]) for name in ROW_COLUMNS}
+        lengths = _take(plan, np.diff(self.content_offsets), np.diff(new["content_offsets"]))
+        columns["content_offsets"] = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        blobs = [
+            new_content[new["content_offsets"][a]:new["content_offsets"][b]] if from_new
+            else self.content[self.content_offsets[a]:self.content_offsets[b]]
+            for from_new, a, b in plan
+        ]
+        content = np.concatenate(blobs) if blobs else np.zeros(0, dtype=np.uint8)
+
+        names = writer.names()
+        if shift is not None and len(plan):
+            document = -1 if shift.document_id is None else names["documents"].index(shift.document_id)
+            spans = columns["spans"]
+            moved = (spans[:, 0] > shift.after_idx) & (columns["document_ids"] == document)
+            spans[moved, :2] += shift.delta
+            spans[moved, 2:] += shift.byte_delta
+        return SectionStore.from_columns(columns, content, names)
+
+    def _columns(self) -> Dict[str, np.ndarray]:
+        return {name: getattr(self, name) for name in COLUMN_FILES}
+
+    def _names(self) -> Dict[str, List[str]]:
+        return {"titles": self.titles, "documents": self.documents, "speakers": self.speakers}
+
+    def _row(self, section_id: int) -> Optional[int]:
+        """
+        Row of a section id, or None if the store has no such section.
+        """
+        pos = int(np.searchsorted(self.section_ids, section_id))
+        if pos >= len(self.section_ids) or self.section_ids[pos] != section_id:
+            return None
+        return pos
+
+    def __getitem__(self, section_id: int) -> TermSection:
+        pos = self._row(section_id)
+        if pos is None:
+            raise KeyError(section_id)
+        return self.section_at(pos)
+
+    def __contains__(self, section_id: object) -> bool:
+        # Without materializing the section, as Mapping's default would
+        return isinstance(section_id, (int, np.integer)) and self._row(section_id) is not None
+
+    def __iter__(self) -> Iterator[int]:
+        return (int(sid) for sid in self.section_ids)
+
+    def __len__(self) -> int:
+        return len(self.section_ids)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Size of the store's arrays and content (mapped, for a store opened from disk).
+        """
+        return sum(array.nbytes for array in self._columns().values()) + self.content.nbytes
+
+    def values(self) -> Iterator[TermSection]:
+        """
+        Iterate sections in order (without the per-id lookup of Mapping.values).
+        """
+        return (self.section_at(pos) for pos in range(len(self.section_ids)))
+
+    def ids_by_content_hash(self) -> Dict[bytes, int]:
+        """
+        Map each distinct content hash (see content_hash) to a section id holding that content.
+        """
+        return {h.tobytes(): int(sid) for h, sid in zip(self.content_hashes, self.section_ids)}
+
+    def section_at(self, pos: int) -> TermSection:
+        """
+        Materialize the section stored at row `pos`.
+        """
+        start, end = self.content_offsets[pos], self.content_offsets[pos + 1]
+        start_idx, end_idx, start_byte, end_byte = (int(v) for v in self.spans[pos])
+        start_ms, end_ms = (int(v) for v in self.times[pos])
+        document = int(self.document_ids[pos])
+        speaker = int(self.speaker_ids[pos])
+        return TermSection(
+            section_id=int(self.section_ids[pos]),
+            content=self.content[start:end].tobytes().decode("utf-8"),
+            title=self.titles[self.title_ids[pos]],
+            start_idx=start_idx,
+            end_idx=end_idx,
+            start_byte=start_byte,
+            end_byte=end_byte,
+            start_ms=start_ms if start_ms >= 0 else None,
+            end_ms=end_ms if end_ms >= 0 else None,
+            speaker=self.speakers[speaker] if speaker >= 0 else None,
+            document_id=self.documents[document] if document >= 0 else None
+        )
+
+def _name_id(names: Dict[str, int], name: Optional[str]) -> int:
+    """
+    Number of a name, numbering new names in order of first appearance (-1 for None).
+    """
+    return -1 if name is None else names.setdefault(name, len(names))
+
+def _write_store(path: str, columns: Dict[str, np.ndarray], names: Dict[str, List[str]], meta: Optional[Dict]) -> None:
+    """
+    Write a store's arrays and metadata (its content blob is written separately).
+    """
+    for name, array in columns.items():
+        np.save(os.path.join(path, COLUMN_FILES[name]), array)
+    with open(os.path.join(path, META_FILE), "w", encoding="utf-8") as f:
+        json.dump({**(meta or {}), "format_version": STORE_FORMAT_VERSION, **names}, f)
+
+def _splice_plan(num_rows: int, drop: np.ndarray, insert_at: np.ndarray) -> List[Tuple[bool, int, int]]:
+    """
+    Row ranges making up a spliced table, in order. (from_new, start, end)
+    stands for rows start..end-1 of the new rows if from_new, else of the old
+    ones. Old rows at the positions in `drop` are left out, and new row i goes
+    before old row insert_at[i] (new rows in ascending order).
+    """
+    events = sorted([(int(pos), False, i) for i, pos in enumerate(insert_at)] + [(int(pos), True, 0) for pos in drop])
+    plan: List[Tuple[bool, int, int]] = []
+    row = 0
+    for pos, dropped, i in events:
+        if pos > row:
+            plan.append((False, row, pos))
+            row = pos
+        if dropped:
+            row = pos + 1
+        elif plan and plan[-1][0] and plan[-1][2] == i:
+            plan[-1] = (True, plan[-1][1], i + 1)
+        else:
+            plan.append((True, i, i + 1))
+    if row < num_rows:
+        plan.append((False, row, num_rows))
+    return plan
+
+def _take(plan: List[Tuple[bool, int, int]], old: np.ndarray, new: np.ndarray) -> np.ndarray:
+    """
+    The rows of a splice plan (see _splice_plan) from old and new arrays.
+    """
+    parts = [new[a:b] if from_new else old[a:b] for from_new, a, b in plan]
+    return np.concatenate(parts) if parts else np.array(old[:0])
+
+def new_version_dir(root: str) -> str:
+    """
+    Create a fresh directory under `root` to write a new state version into.
+    """
+    path = os.path.join(root, f"v{time.time_ns()}-{os.getpid()}")
+    os.makedirs(path)
+    return path
+
+def publish_version(root: str, path: str, keep: int = 2) -> None:
+    """
+    Atomically make `path` the current version and delete older versions,
+    keeping the `keep` most recent ones for readers that still have them open.
+    """
+    pointer = os.path.join(root, CURRENT_FILE)
+    tmp_pointer = f"{pointer}.{os.getpid()}.tmp"
+    with open(tmp_pointer, "w", encoding="utf-8") as f:
+        f.write(os.path.basename(path))
+    os.replace(tmp_pointer, pointer)
+
+    versions = sorted(
+        (name for name in os.listdir(root) if name.startswith("v") and os.path.isdir(os.path.join(root, name))),
+        key=lambda name: os.path.getmtime(os.path.join(root, name))
+    )
+    for name in versions[:-keep]:
+        if name != os.path.basename(path):
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+def current_version_dir(root: str) -> Optional[str]:
+    """
+    Return the directory of the current version, or None if nothing was published.
+    """
+    pointer = os.path.join(root, CURRENT_FILE)
+    if not os.path.exists(pointer):
+        return None
+    with open(pointer, "r", encoding="utf-8") as f:
+        path = os.path.join(root, f.read().strip())
+    return path if os.path.isdir(path) else None
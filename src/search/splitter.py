@@ -0,0 +1,70 @@
+import os
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from search.term_section import TermSection
+
+def iter_sections(lines: Iterable[str],
+                  first_section_id: int = 0,
+                  initial_title: str = "Introduction",
+                  offset: int = 0,
+                  byte_offset: int = 0,
+                  document_id: Optional[str] = None) -> Iterator[TermSection]:
+    """
+    Naive splitting of content by lines. If a line starts with and ends with '**',
+    we treat it as a new title, otherwise it's appended as content to a section.
+
+    Works in a single streaming pass over `lines` (each ending in '\\n',
+    except possibly the last), tracking character and byte offsets as it goes.
+    Sections are tagged with `document_id`, if given.
+    """
+    current_title = initial_title
+    section_id = first_section_id
+    char_pos = offset
+    byte_pos = byte_offset
+
+    for line in lines:
+        text = line[:-1] if line.endswith("\n") else line
+        text_bytes = len(text.encode("utf-8"))
+        clean_line = text.strip()
+
+        if clean_line:
+            if clean_line.startswith("**") and clean_line.endswith("**"):
+                current_title = clean_line.replace("**", "")
+            else:
+                yield TermSection(
+                    section_id=section_id,
+                    content=clean_line,
+                    title=current_title,
+                    start_idx=char_pos,
+                    end_idx=char_pos + len(text),
+                    start_byte=byte_pos,
+                    end_byte=byte_pos + text_bytes,
+                    document_id=document_id
+                )
+                section_id += 1
+
+        char_pos += len(line)
+        byte_pos += text_bytes + (len(line) - len(text))
+
+def scan_file(markdown_path: str) -> Tuple[int, int, int]:
+    """
+    Stream a file once to count its sections, characters and bytes.
+    """
+    length = 0
+
+    def lines() -> Iterator[str]:
+        nonlocal length
+        with open(markdown_path, "r", encoding="utf-8", newline="\n") as f:
+            for line in f:
+                length += len(line)
+                yield line
+
+    count = sum(1 for _ in iter_sections(lines()))
+    return count, length, os.path.getsize(markdown_path)
+
+def split_file(markdown_path: str, first_section_id: int = 0, document_id: Optional[str] = None) -> List[TermSection]:
+    """
+    All sections of a file, numbered from `first_section_id`.
+    """
+    with open(markdown_path, "r", encoding="utf-8", newline="\n") as f:
+        return list(iter_sections(f, first_section_id=first_section_id, document_id=document_id))
@@ -0,0 +1,23 @@
+from dataclasses import dataclass
+from typing import Optional
+
+@dataclass
+class TermSection:
+    """
+    A single section of text with a title, content, and position in the original text.
+    start_idx/end_idx are character offsets, start_byte/end_byte UTF-8 byte offsets.
+    Sections made from transcript utterances also carry their start/end time in
+    milliseconds and their speaker label. Sections of a multi-document corpus
+    carry the id of their document, and their offsets are within that document.
+    """
+    section_id: int
+    content: str
+    title: str
+    start_idx: int
+    end_idx: int
+    start_byte: int = 0
+    end_byte: int = 0
+    start_ms: Optional[int] = None
+    end_ms: Optional[int] = None
+    speaker: Optional[str] = None
+    document_id: Optional[str] = None
@@ -1,24 +1,50 @@
+import io
 import os
-import pickle
+import logging
+import asyncio
+import threading
+import functools
+import itertools
+import dataclasses
+import multiprocessing
 import faiss
 import numpy as np
-from dataclasses import dataclass
-from typing import List, Dict, Union, Optional, Type
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Iterable, Iterator, List, Dict, Sequence, Tuple, Union, Optional, Type
 
 from embeddings.base import EmbeddingsBase
 from embeddings.llama import LlamaEmbeddings
+from embeddings.replicas import ReplicatedLlamaEmbeddings
 from embeddings.fake import FakeEmbeddings
+from embeddings.cache import CachedEmbeddings
+from embeddings.batching import MicroBatchingEmbeddings
+from search.term_section import TermSection
+from search.index_factory import (
+    create_index, new_index, training_size, add_vectors, read_index_mmap, index_bytes, stored_vectors,
+    enable_id_lookup, id_selector, filtered_search_params, DEFAULT_NPROBE, DEFAULT_EF_SEARCH
+)
+from search.query_cache import TTLCache
+from search.index_delta import IndexDelta, merge_results
+from search.index_snapshot import IndexSnapshot
+from search.manifest import IndexManifest, file_hash
+from search.lexical_index import LexicalIndex, LexicalIndexWriter
+from search.section_filter import SectionFilter, SectionFilterIndex
+from search.splitter import iter_sections, scan_file
+from search.corpus import resolve_paths, scan_document, corpus_hash, split_documents
+from observability.metrics import time_stage, SEARCH_FALLBACKS, FILTERED_SEARCHES
+from search.section_store import (
+    SectionStore, SectionStoreWriter, SpanShift, INDEX_FILE, new_version_dir, publish_version, current_version_dir,
+    content_hash
+)
 
-@dataclass
-class TermSection:
-    """
-    A single section of text with a title, content, and position in the original text.
-    """
-    section_id: int
-    content: str
-    title: str
-    start_idx: int
-    end_idx: int
+logger = logging.getLogger(__name__)
+
+# vector: FAISS only; lexical: BM25 only, no embedding; hybrid: BM25 candidates reranked by vectors
+SEARCH_MODES = ("vector", "lexical", "hybrid")
+
+# Vectors scored at a time when a filtered search scores its sections directly
+FILTER_SCORE_BATCH = 16384
 
 class TermsSearchEngine:
     """
@@ -29,7 +55,33 @@ class TermsSearchEngine:
                  embedding_api_url: str = "http://localhost:8080", 
                  cache_dir: str = "cache",
                  embedding_provider: str = "llama",
-                 embedding_dimension: int = 384):
+                 embedding_dimension: int = 384,
+                 embedding_batch_size: int = 32,
+                 embedding_concurrency: int = 4,
+                 embedding_cache: bool = True,
+                 embedding_cache_size: int = 10000,
+                 embedding_batch_wait: float = 0.0,
+                 embedding_batch_max: int = 64,
+                 embedding_api_urls: Optional[List[str]] = None,
+                 embedding_hedge_percentile: float = 95.0,
+                 embedding_eject_failures: int = 3,
+                 embedding_eject_seconds: float = 10.0,
+                 index_type: str = "auto",
+                 nprobe: int = DEFAULT_NPROBE,
+                 ef_search: int = DEFAULT_EF_SEARCH,
+                 compression: str = "none",
+                 rerank: int = 0,
+                 embedding_model: Optional[EmbeddingsBase] = None,
+                 max_workers: int = 4,
+                 executor: Optional[ThreadPoolExecutor] = None,
+                 index_batch_size: int = 1024,
+                 query_cache_size: int = 1024,
+                 query_cache_ttl: float = 300.0,
+                 search_mode: str = "vector",
+                 embedding_timeout: float = 0.0,
+                 hybrid_candidates: int = 100,
+                 hybrid_weight: float = 0.5,
+                 filter_exact_max: int = 4096):
         """
         Initialize the search engine with a configurable embedding model
         and optional cache directory for storing the FAISS index and sections.
@@ -39,20 +91,162 @@ class TermsSearchEngine:
             cache_dir: Directory to store cached index and sections
             embedding_provider: Which embedding provider to use ('llama' or 'fake')
             embedding_dimension: Dimension of embeddings (only used for FakeEmbeddings)
+            embedding_batch_size: Texts sent per embedding request (used by LlamaEmbeddings)
+            embedding_concurrency: Embedding requests in flight at once (used by LlamaEmbeddings)
+            embedding_cache: Whether to cache embeddings in memory and under cache_dir
+            embedding_cache_size: Maximum number of embeddings kept in the in-memory cache tier
+            embedding_batch_wait: Seconds concurrent small encode calls are collected into one
+                                  provider call (0 disables micro-batching)
+            embedding_batch_max: Texts that make a micro-batch full, sending it without waiting further
+            embedding_api_urls: Several llama.cpp servers to spread embedding requests over
+                                (overrides embedding_api_url, see ReplicatedLlamaEmbeddings)
+            embedding_hedge_percentile: Latency percentile after which a replica's request is
+                                        duplicated to another replica (0 disables hedging)
+            embedding_eject_failures: Consecutive failures that eject a replica
+            embedding_eject_seconds: Seconds an ejected replica waits before it is probed again
+            index_type: FAISS index type ('flat', 'ivf', 'hnsw', 'ivfpq' or 'auto' to choose by size)
+            nprobe: Default inverted lists visited per search (IVF index types)
+            ef_search: Default search-time candidate list size (HNSW index type)
+            compression: Vector storage ('none', 'fp16', 'int8' or 'pq'), see search.index_factory
+            rerank: Rescore rerank x k compressed-search candidates with exact vectors (0 disables)
+            embedding_model: An existing embedding model to share (overrides all embedding_* options)
+            max_workers: Size of the thread pool running blocking work for the async API
+            executor: An existing thread pool to share (overrides max_workers)
+            index_batch_size: Sections embedded and added to the index at a time by build_index
+            query_cache_size: Entries in each query cache (query embeddings and results, 0 disables)
+            query_cache_ttl: Seconds a query cache entry stays valid
+            search_mode: Default search mode ('vector', 'lexical' or 'hybrid', see SEARCH_MODES)
+            embedding_timeout: Seconds a search waits for its query embedding before answering
+                               from the BM25 index instead (0 waits as long as the provider takes)
+            hybrid_candidates: BM25 candidates reranked by vector similarity in hybrid mode
+            hybrid_weight: Weight of vector similarity against normalized BM25 score in hybrid mode
+            filter_exact_max: Filtered searches selecting at most this many sections score them
+                              directly instead of searching the index with an ID selector
         """
-        self.embedding_model: EmbeddingsBase = self._get_embedding_model(
-            provider=embedding_provider,
-            api_url=embedding_api_url,
-            dimension=embedding_dimension
-        )
+        if search_mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode '{search_mode}', expected one of {SEARCH_MODES}")
         self.cache_dir = cache_dir
         os.makedirs(self.cache_dir, exist_ok=True)
 
-        self.index: Optional[faiss.Index] = None
-        self.sections: List[TermSection] = []
+        # Shared models and pools belong to whoever passed them in, and are not closed by close()
+        self._owns_embedding_model = embedding_model is None
+        self._owns_executor = executor is None
+        if embedding_model is not None:
+            self.embedding_model: EmbeddingsBase = embedding_model
+        else:
+            self.embedding_model = self._get_embedding_model(
+                provider=embedding_provider,
+                api_url=embedding_api_url,
+                dimension=embedding_dimension,
+                batch_size=embedding_batch_size,
+                concurrency=embedding_concurrency,
+                api_urls=embedding_api_urls,
+                hedge_percentile=embedding_hedge_percentile,
+                eject_failures=embedding_eject_failures,
+                eject_seconds=embedding_eject_seconds
+            )
+            if embedding_batch_wait > 0:
+                # Behind the cache, so only cache misses wait for a batch
+                self.embedding_model = MicroBatchingEmbeddings(
+                    self.embedding_model,
+                    max_wait=embedding_batch_wait,
+                    max_batch_size=embedding_batch_max,
+                    max_concurrency=embedding_concurrency
+                )
+        if embedding_cache and embedding_model is None:
+            self.embedding_model = CachedEmbeddings(
+                self.embedding_model,
+                cache_dir=self.cache_dir,
+                dimension=embedding_dimension,
+                max_memory_entries=embedding_cache_size
+            )
+
+        # Thread pool for the async API, so embedding and FAISS calls never block the event loop
+        self.executor = executor or ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="terms-search")
+
+        self.embedding_dimension = embedding_dimension
+        self.index_type = index_type
+        self.compression = compression
+        self.rerank = rerank
+        self.index_batch_size = index_batch_size
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.search_mode = search_mode
+        self.embedding_timeout = embedding_timeout
+        self.hybrid_candidates = hybrid_candidates
+        self.hybrid_weight = hybrid_weight
+        self.filter_exact_max = filter_exact_max
+        # Runs the query embeddings that a (sync) search only waits embedding_timeout for;
+        # created on first use, as engines searched only through the async API never need it
+        self._max_workers = max_workers
+        self._timeout_executor: Optional[ThreadPoolExecutor] = None
+        self._timeout_executor_lock = threading.Lock()
+
+        # The searchable index and sections. Builds and changes prepare a new
+        # snapshot off to the side and swap it in; searches never see a half-built one.
+        self._snapshot = IndexSnapshot(index=None, sections=SectionStore.from_sections([]))
+        # Serializes builds and changes (searches never take it)
+        self._write_lock = threading.RLock()
+        # The document text; not kept for indexes streamed from a file
         self.original_text: str = ""
+        self._text_length = 0
+        self._text_bytes = 0
+        self._next_section_id = 0
+        # Whether changes should be written back to cache_dir (False for on-the-fly indexes)
+        self._persistent = False
+        # Saved state lives in versioned directories under here (see search.section_store)
+        self._state_root = os.path.join(self.cache_dir, "terms_search")
+        self._state_dir: Optional[str] = None
+        # The main FAISS index saved in _state_dir; later versions link to its file while it is unchanged
+        self._saved_index: Optional[faiss.Index] = None
+        # Hash of the markdown file the saved index was built from
+        self._source_hash: Optional[str] = None
+
+        self._embedding_cache = TTLCache(query_cache_size, query_cache_ttl, name="query_embedding")
+        self._result_cache = TTLCache(query_cache_size, query_cache_ttl, name="query_result")
 
-    def _get_embedding_model(self, provider: str, api_url: str, dimension: int) -> EmbeddingsBase:
+    @property
+    def index(self) -> Optional[faiss.Index]:
+        """
+        The main FAISS index of the current snapshot (None until one is built
+        or loaded). Vectors changed since it was built are in the snapshot's
+        delta, which searches apply to it.
+        """
+        return self._snapshot.index
+
+    @property
+    def sections(self) -> SectionStore:
+        """
+        Sections of the current snapshot, keyed by their stable section_id, in
+        document order. A read-only SectionStore, memory-mapped after
+        build_index/load_state and held in memory after any change.
+        """
+        return self._snapshot.sections
+
+    @property
+    def lexical(self) -> Optional[LexicalIndex]:
+        """
+        BM25 index of the current snapshot's sections.
+        """
+        return self._snapshot.lexical
+
+    @property
+    def index_version(self) -> int:
+        """
+        Version of the current snapshot; query caches are tied to one version.
+        """
+        return self._snapshot.version
+
+    def _get_embedding_model(self,
+                             provider: str,
+                             api_url: str,
+                             dimension: int,
+                             batch_size: int = 32,
+                             concurrency: int = 4,
+                             api_urls: Optional[List[str]] = None,
+                             hedge_percentile: float = 95.0,
+                             eject_failures: int = 3,
+                             eject_seconds: float = 10.0) -> EmbeddingsBase:
         """
         Factory method to create the appropriate embedding model based on the provider.
         
@@ -60,184 +254,1229 @@ class TermsSearchEngine:
             provider: The embedding provider to use ('llama' or 'fake')
             api_url: URL for the embedding API (used by LlamaEmbeddings)
             dimension: Dimension of embeddings (only used for FakeEmbeddings)
+            batch_size: Texts sent per embedding request (used by LlamaEmbeddings)
+            concurrency: Embedding requests in flight at once (per server with several api_urls)
+            api_urls: Several llama.cpp servers to use instead of api_url
+            hedge_percentile: See ReplicatedLlamaEmbeddings
+            eject_failures: See ReplicatedLlamaEmbeddings (failure_threshold)
+            eject_seconds: See ReplicatedLlamaEmbeddings (cooldown)
             
         Returns:
             An instance of a class implementing EmbeddingsBase
         """
         provider = provider.lower()
-        if provider == "llama":
+        if provider == "llama" and api_urls and len(api_urls) > 1:
+            model = ReplicatedLlamaEmbeddings(
+                api_urls,
+                batch_size=batch_size,
+                max_concurrency=concurrency,
+                hedge_percentile=hedge_percentile,
+                failure_threshold=eject_failures,
+                cooldown=eject_seconds
+            )
+            healthy = model.check_health()
+            if healthy:
+                logger.info("Connected to %d of %d llama.cpp servers", healthy, len(api_urls))
+                return model
+            logger.warning("None of the llama.cpp servers %s is reachable, falling back to FakeEmbeddings",
+                           ", ".join(api_urls))
+            return FakeEmbeddings(dimension)
+        elif provider == "llama":
+            if api_urls:
+                api_url = api_urls[0]
             # Try to connect to the llama.cpp server, fall back to FakeEmbeddings if not available
             try:
                 import requests
                 # Test connection with a simple request
                 response = requests.get(f"{api_url}/health", timeout=2)
                 if response.status_code == 200:
-                    print(f"[TermsSearchEngine] Successfully connected to llama.cpp server at {api_url}")
-                    return LlamaEmbeddings(api_url)
+                    logger.info("Connected to llama.cpp server at %s", api_url)
+                    return LlamaEmbeddings(api_url, batch_size=batch_size, max_concurrency=concurrency)
                 else:
-                    print(f"[TermsSearchEngine] Warning: llama.cpp server returned status code {response.status_code}")
+                    logger.warning("llama.cpp server returned status code %s", response.status_code)
             except Exception as e:
-                print(f"[TermsSearchEngine] Warning: Could not connect to llama.cpp server at {api_url}: {str(e)}")
-                print("[TermsSearchEngine] Falling back to FakeEmbeddings")
+                logger.warning("Could not connect to llama.cpp server at %s: %s", api_url, e)
+                logger.warning("Falling back to FakeEmbeddings")
             
             # If we get here, there was an issue connecting to the server
             return FakeEmbeddings(dimension)
         elif provider == "fake":
             return FakeEmbeddings(dimension)
         else:
-            print(f"[TermsSearchEngine] Unknown provider '{provider}', falling back to FakeEmbeddings")
+            logger.warning("Unknown provider '%s', falling back to FakeEmbeddings", provider)
             return FakeEmbeddings(dimension)
 
+    @time_stage("index_build")
     def build_index(self, markdown_path: str) -> None:
         """
         Build and save a FAISS index from a local markdown file.
+
+        The file is streamed twice: once to count sections (which picks the
+        index type), then to embed and index them `index_batch_size` at a time,
+        so memory stays bounded however large the file is. Searches keep using
+        the current index until the new one is complete and swapped in.
+
+        Sections whose content is unchanged since the saved index was built
+        (with the same provider, dimension and splitter) keep their saved
+        vectors; only new or edited sections are embedded.
         """
-        print(f"[TermsSearchEngine] Reading markdown file: {markdown_path}")
-        with open(markdown_path, "r", encoding="utf-8") as f:
-            content = f.read()
+        with self._write_lock:
+            logger.info("Reading markdown file: %s", markdown_path)
+            source_hash = file_hash(markdown_path)
+            with time_stage("split"):
+                num_sections, text_length, text_bytes = scan_file(markdown_path)
+            with open(markdown_path, "r", encoding="utf-8", newline="\n") as f:
+                self._build(iter_sections(f), num_sections, text_length, text_bytes, source_hash)
 
-        print("[TermsSearchEngine] Splitting content into sections...")
-        self.sections = self._split_into_sections(content)
+    @time_stage("index_build")
+    def build_corpus(self, paths_or_glob: Union[str, Sequence[str]], processes: Optional[int] = None) -> None:
+        """
+        Build and save one FAISS index over several markdown files.
 
-        texts = [sec.content for sec in self.sections]
-        embeddings = self.embedding_model.encode(texts)
+        Files are split on a pool of `processes` worker processes, and up to
+        max_workers batches of sections are embedded at once while earlier
+        ones are added to the index, so large ingests keep every core and the
+        embedding provider busy. Sections stream through in file order, so
+        memory stays bounded as in build_index.
 
-        print("[TermsSearchEngine] Creating FAISS index...")
-        self.index = self._create_index(embeddings)
+        Each section's document_id is its file's path, and its offsets are
+        within that file. Section ids run on across files, and all files are
+        merged into one index, BM25 index and section store. Unchanged
+        sections keep their saved vectors, as in build_index.
 
-        print("[TermsSearchEngine] Saving index to cache...")
-        self._save_state()
-        print("[TermsSearchEngine] Index build complete.")
+        Worker processes are spawned, so scripts calling this need the usual
+        `if __name__ == "__main__":` guard.
 
+        Args:
+            paths_or_glob: A glob pattern ('**' recursive), or a list of file paths and patterns
+            processes: Worker processes splitting files (defaults to the number of CPUs)
+
+        Raises:
+            FileNotFoundError: If no file matches
+        """
+        paths = resolve_paths(paths_or_glob)
+        processes = min(processes or os.cpu_count() or 1, len(paths))
+        with self._write_lock:
+            logger.info("Reading %d markdown files with %d processes", len(paths), processes)
+            # Spawned, as forking a process that runs threads can deadlock the child;
+            # a single worker splits in this process instead
+            context = multiprocessing.get_context("spawn")
+            pool = ProcessPoolExecutor(max_workers=processes, mp_context=context) if processes > 1 else None
+            try:
+                with time_stage("split"):
+                    if pool is None:
+                        scans = [scan_document(path) for path in paths]
+                    else:
+                        scans = list(pool.map(scan_document, paths, chunksize=max(1, len(paths) // (4 * processes))))
+                self._build(
+                    split_documents(pool, paths, window=2 * processes),
+                    num_sections=sum(scan[0] for scan in scans),
+                    text_length=sum(scan[1] for scan in scans),
+                    text_bytes=sum(scan[2] for scan in scans),
+                    source_hash=corpus_hash(paths, [scan[3] for scan in scans]),
+                    embedding_workers=self._max_workers
+                )
+            finally:
+                if pool is not None:
+                    pool.shutdown(cancel_futures=True)
+
+    def _build(self,
+               sections: Iterable[TermSection],
+               num_sections: int,
+               text_length: int,
+               text_bytes: int,
+               source_hash: str,
+               embedding_workers: int = 1) -> None:
+        """
+        Embed and index streamed sections (in ascending section_id order) into
+        a new state version, save it and swap it in. Caller holds the write lock.
+
+        Args:
+            sections: The sections, streamed
+            num_sections: Expected number of sections (picks the index type)
+            text_length: Characters of the source text
+            text_bytes: Bytes of the source text
+            source_hash: Hash of the source, for the manifest
+            embedding_workers: Batches embedded at once
+        """
+        reuse = self._reusable_vectors()
+        reused = 0
+
+        logger.info("Indexing %d sections in batches of %d", num_sections, self.index_batch_size)
+        index: Optional[faiss.Index] = None
+        writer: Optional[SectionStoreWriter] = None
+        next_section_id = 0
+        lexical_writer = LexicalIndexWriter()
+
+        try:
+            # Trained index types buffer batches until there is enough training data
+            pending: List[Tuple[List[TermSection], np.ndarray]] = []
+            for batch, embeddings, batch_reused in self._embedded_batches(sections, reuse, embedding_workers):
+                reused += batch_reused
+                if index is None:
+                    index = new_index(embeddings.shape[1], num_sections, self.index_type,
+                                      nprobe=self.nprobe, ef_search=self.ef_search,
+                                      compression=self.compression, rerank=self.rerank)
+                    # Sections go straight to disk rather than being kept in memory
+                    writer = SectionStoreWriter(new_version_dir(self._state_root))
+                pending.append((batch, embeddings))
+                if not index.is_trained:
+                    if sum(len(b) for b, _ in pending) < training_size(index, num_sections):
+                        continue
+                    index.train(np.vstack([e for _, e in pending]))
+                next_section_id = self._add_batches(index, pending, writer, lexical_writer)
+                pending = []
+
+            if pending:
+                # The source shrank between the two passes; train on what there is
+                index.train(np.vstack([e for _, e in pending]))
+                next_section_id = self._add_batches(index, pending, writer, lexical_writer)
+        except BaseException:
+            # Leave no half-written version behind
+            if writer is not None:
+                writer.discard()
+            raise
+
+        if reuse is not None:
+            logger.info("Reused the saved vectors of %d of %d sections", reused, num_sections)
+        if isinstance(self.embedding_model, CachedEmbeddings):
+            logger.info("Embedding cache: %s", self.embedding_model.stats())
+
+        if index is None:
+            logger.warning("No sections created, keeping the current index")
+            return
+
+        logger.info("Saving index to cache")
+        lexical = lexical_writer.finish()
+        writer.close(meta={
+            "text_length": text_length,
+            "text_bytes": text_bytes,
+            "next_section_id": next_section_id,
+            "manifest": self._manifest(source_hash).to_dict(),
+        })
+        self._write_state(writer.path, index, None, lexical)
+        self._source_hash = source_hash
+        self.original_text = ""
+        self._text_length = text_length
+        self._text_bytes = text_bytes
+        self._next_section_id = next_section_id
+        self._persistent = True
+        self._swap(index, SectionStore(writer.path), lexical)
+        logger.info("Index build complete", extra={"sections": num_sections})
+
+    def _manifest(self, source_hash: Optional[str] = None) -> IndexManifest:
+        """
+        Manifest for an index built now by this engine.
+        """
+        return IndexManifest(
+            provider=self.embedding_model.identity,
+            dimension=self.embedding_dimension,
+            source_hash=source_hash
+        )
+
+    def _stale_reason(self, saved: Optional[IndexManifest], markdown_path: Optional[str]) -> Optional[str]:
+        """
+        Explain why a saved index must not be served, or return None if it can be.
+        """
+        if saved is None:
+            return "it has no manifest"
+        reason = saved.vectors_mismatch(self._manifest())
+        if reason is None and markdown_path is not None and os.path.exists(markdown_path):
+            if saved.source_hash != file_hash(markdown_path):
+                reason = f"{markdown_path} changed"
+        return reason
+
+    def _reusable_vectors(self) -> Optional[Tuple[faiss.Index, IndexDelta, Dict[bytes, int]]]:
+        """
+        Open the saved index for reusing its vectors in a rebuild, if they were
+        made by the same provider, dimension and splitter and stored exactly.
+
+        Returns:
+            The saved index, its delta and the id of its section for each
+            content hash, or None
+        """
+        state_dir = current_version_dir(self._state_root)
+        if state_dir is None:
+            return None
+        try:
+            sections = SectionStore(state_dir)
+        except (OSError, ValueError, KeyError):
+            return None
+
+        saved = IndexManifest.from_dict(sections.meta.get("manifest"))
+        reason = "it has no manifest" if saved is None else saved.vectors_mismatch(self._manifest())
+        if reason is not None:
+            logger.info("Not reusing saved vectors: %s", reason)
+            return None
+        # A separate copy, as looking vectors up may add a direct map to it
+        index, _ = read_index_mmap(os.path.join(state_dir, INDEX_FILE))
+        if stored_vectors(index, []) is None:
+            logger.info("Not reusing saved vectors: they are stored compressed")
+            return None
+        # IVF builds its id lookup on first use, which must not happen in
+        # several embedding threads at once
+        enable_id_lookup(index)
+        return index, IndexDelta.load(state_dir, index.d), sections.ids_by_content_hash()
+
+    def _embed_sections(self,
+                        sections: List[TermSection],
+                        reuse: Optional[Tuple[faiss.Index, IndexDelta, Dict[bytes, int]]]) -> Tuple[np.ndarray, int]:
+        """
+        Normalized embeddings of sections. Sections whose content the saved
+        index already holds (see _reusable_vectors) get its vectors back
+        instead of being embedded again.
+
+        Returns:
+            The (N x D) embeddings, and how many of them were reused
+        """
+        old_ids: Dict[int, int] = {}
+        if reuse is not None:
+            for i, sec in enumerate(sections):
+                old_id = reuse[2].get(content_hash(sec.content))
+                if old_id is not None:
+                    old_ids[i] = old_id
+
+        fresh = [i for i in range(len(sections)) if i not in old_ids]
+        if fresh:
+            vectors = self._encode([sections[i].content for i in fresh])
+            faiss.normalize_L2(vectors)
+            if old_ids and vectors.shape[1] != reuse[0].d:
+                # The provider's vectors changed size under the same identity
+                return self._embed_sections(sections, None)
+        if not old_ids:
+            return vectors, 0
+
+        embeddings = np.empty((len(sections), reuse[0].d), dtype=np.float32)
+        embeddings[list(old_ids)] = reuse[1].stored_vectors(reuse[0], list(old_ids.values()))
+        if fresh:
+            embeddings[fresh] = vectors
+        return embeddings, len(old_ids)
+
+    def _embedded_batches(self,
+                          sections: Iterable[TermSection],
+                          reuse: Optional[Tuple[faiss.Index, IndexDelta, Dict[bytes, int]]],
+                          workers: int) -> Iterator[Tuple[List[TermSection], np.ndarray, int]]:
+        """
+        Embed sections index_batch_size at a time (see _embed_sections), with
+        up to `workers` batches in flight at once.
+
+        Yields:
+            Each batch, its embeddings and how many of them were reused, in order
+        """
+        batches = self._batched(sections, self.index_batch_size)
+        if workers <= 1:
+            for batch in batches:
+                yield (batch, *self._embed_sections(batch, reuse))
+            return
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="terms-ingest") as pool:
+            pending = deque()
+            for batch in batches:
+                pending.append((batch, pool.submit(self._embed_sections, batch, reuse)))
+                if len(pending) >= workers:
+                    batch, future = pending.popleft()
+                    yield (batch, *future.result())
+            while pending:
+                batch, future = pending.popleft()
+                yield (batch, *future.result())
+
+    @staticmethod
+    def _add_batches(index: faiss.Index,
+                     batches: List[Tuple[List[TermSection], np.ndarray]],
+                     writer: SectionStoreWriter,
+                     lexical_writer: LexicalIndexWriter) -> int:
+        """
+        Add embedded batches of sections to the (trained) index, the section
+        store and the BM25 index.
+
+        Returns:
+            The section id following the last one added
+        """
+        for batch, embeddings in batches:
+            add_vectors(index, embeddings, [sec.section_id for sec in batch])
+            for sec in batch:
+                writer.add(sec)
+                lexical_writer.add(sec)
+        return batches[-1][0][-1].section_id + 1
+
+    @staticmethod
+    def _batched(items: Iterable[TermSection], size: int) -> Iterator[List[TermSection]]:
+        iterator = iter(items)
+        while batch := list(itertools.islice(iterator, size)):
+            yield batch
+
+    @time_stage("index_build")
     def process_text(self, text: str) -> None:
         """
         Build an index directly from a user-provided text (instead of a file).
         Useful for on-the-fly indexing.
         """
-        self.sections.clear()
-        self.index = None
+        with self._write_lock:
+            self._index_in_memory(text, len(text.encode("utf-8")), self._split_into_sections(text))
+
+    @time_stage("index_build")
+    def process_utterances(self, utterances: List[Dict]) -> None:
+        """
+        Build an in-memory index over a transcript, one section per utterance.
+        Sections keep the utterance's start/end milliseconds and speaker, and
+        their character offsets point into the utterance texts joined by newlines.
+
+        Args:
+            utterances: Dicts with "text", "start" and "end" (ms) and optionally "speaker"
+        """
+        sections = []
+        pos = byte_pos = 0
+        for utterance in utterances:
+            content = " ".join(str(utterance.get("text", "")).split())
+            if not content:
+                continue
+            if sections:
+                pos += 1
+                byte_pos += 1
+            speaker = utterance.get("speaker")
+            sections.append(TermSection(
+                section_id=len(sections),
+                content=content,
+                title=f"Speaker {speaker}" if speaker is not None else "Transcript",
+                start_idx=pos,
+                end_idx=pos + len(content),
+                start_byte=byte_pos,
+                end_byte=byte_pos + len(content.encode("utf-8")),
+                start_ms=utterance.get("start"),
+                end_ms=utterance.get("end"),
+                speaker=None if speaker is None else str(speaker)
+            ))
+            pos = sections[-1].end_idx
+            byte_pos = sections[-1].end_byte
+
+        with self._write_lock:
+            self._index_in_memory("\n".join(sec.content for sec in sections), byte_pos, sections)
+
+    def _index_in_memory(self, text: str, text_bytes: int, sections: List[TermSection]) -> None:
+        """
+        Embed every section of an in-memory text, build a fresh index over
+        them and swap it in.
+        """
+        index = None
+        if sections:
+            embeddings = self._encode([s.content for s in sections])
+            index = self._create_index(embeddings, [s.section_id for s in sections])
+            logger.info("In-memory index created", extra={"sections": len(sections)})
+        else:
+            logger.warning("No sections created")
+
         self.original_text = text
+        self._text_length = len(text)
+        self._text_bytes = text_bytes
+        self._next_section_id = sections[-1].section_id + 1 if sections else 0
+        self._persistent = False
+        self._swap(index, SectionStore.from_sections(sections), LexicalIndex.from_sections(sections))
 
-        self.sections = self._split_into_sections(text)
-        if not self.sections:
-            print("[TermsSearchEngine] Warning: no sections created!")
-            return
+    def add_text(self, text: str, title: Optional[str] = None) -> List[TermSection]:
+        """
+        Append text to the document and index only its sections, leaving
+        existing vectors in place. New sections get fresh section ids. Their
+        vectors go into the snapshot's delta, so the cost does not grow with
+        the size of the index (see _commit).
+
+        Args:
+            text: Markdown text to append
+            title: Title for sections before the first heading in `text`
+                   (defaults to the title of the last existing section)
+
+        Returns:
+            The newly added sections
+        """
+        with self._write_lock:
+            snapshot = self._snapshot
+            index, delta, sections = snapshot.index, snapshot.delta, snapshot.sections
+            if title is None:
+                title = sections.section_at(len(sections) - 1).title if len(sections) else "Introduction"
+
+            separator = "\n" if self._text_length and not self.original_text.endswith("\n") else ""
+            offset = self._text_length + len(separator)
+            byte_offset = self._text_bytes + len(separator)
+            new_sections = self._split_into_sections(
+                text,
+                first_section_id=self._next_section_id,
+                initial_title=title,
+                offset=offset,
+                byte_offset=byte_offset
+            )
+
+            if new_sections:
+                embeddings = self._encode([sec.content for sec in new_sections])
+                ids = [sec.section_id for sec in new_sections]
+                if index is None:
+                    index = self._create_index(embeddings, ids)
+                    delta = IndexDelta.empty(index.d)
+                else:
+                    faiss.normalize_L2(embeddings)
+                    delta = delta.changed(embeddings=embeddings, ids=ids)
+
+            # Keep the document text up to date only if it is held in full
+            if len(self.original_text) == self._text_length:
+                self.original_text += separator + text
+            self._text_length = offset + len(text)
+            self._text_bytes = byte_offset + len(text.encode("utf-8"))
+            if not new_sections:
+                return []
+
+            self._next_section_id = ids[-1] + 1
+            self._commit(index, delta, sections.with_changes(upserts=new_sections), upserts=new_sections)
+            logger.info("Added %d section(s)", len(new_sections))
+            return new_sections
+
+    def update_section(self, section_id: int, content: str, title: Optional[str] = None) -> TermSection:
+        """
+        Replace the content (and optionally the title) of one section and
+        re-embed only that section. Offsets of later sections are shifted
+        to match the edited document.
+
+        Raises:
+            KeyError: If no section has this id
+        """
+        with self._write_lock:
+            snapshot = self._snapshot
+            old = snapshot.sections[section_id]
+            content = content.strip()
+
+            embeddings = self._encode([content])
+            faiss.normalize_L2(embeddings)
+            delta = snapshot.delta.changed(removed=[section_id], embeddings=embeddings, ids=[section_id])
+
+            shift = len(content) - (old.end_idx - old.start_idx)
+            byte_shift = len(content.encode("utf-8")) - (old.end_byte - old.start_byte)
+            if len(self.original_text) == self._text_length:
+                self.original_text = self.original_text[:old.start_idx] + content + self.original_text[old.end_idx:]
+            self._text_length += shift
+            self._text_bytes += byte_shift
+
+            updated = dataclasses.replace(
+                old,
+                content=content,
+                title=old.title if title is None else title,
+                end_idx=old.end_idx + shift,
+                end_byte=old.end_byte + byte_shift
+            )
+            # Later sections of the same document move by the change in length
+            sections = snapshot.sections.with_changes(
+                upserts=[updated],
+                shift=SpanShift(old.document_id, old.start_idx, shift, byte_shift)
+            )
+            self._commit(snapshot.index, delta, sections, upserts=[updated])
+            return updated
+
+    def remove_sections(self, section_ids: List[int]) -> int:
+        """
+        Remove sections and their vectors from the index. Unknown ids are ignored.
+        The document text is left untouched so other offsets stay valid.
+
+        Returns:
+            The number of sections removed
+        """
+        with self._write_lock:
+            ids = [sid for sid in dict.fromkeys(section_ids) if sid in self.sections]
+            if not ids:
+                return 0
+
+            snapshot = self._snapshot
+            self._commit(snapshot.index, snapshot.delta.changed(removed=ids), snapshot.sections.with_changes(removed=ids),
+                         removed=ids)
+            logger.info("Removed %d section(s)", len(ids))
+            return len(ids)
+
+    def memory_bytes(self) -> int:
+        """
+        Rough estimate of the memory held by the index, sections and text.
+        """
+        snapshot = self._snapshot
+        vectors = index_bytes(snapshot.index) if snapshot.index is not None else 0
+        if snapshot.delta is not None:
+            vectors += snapshot.delta.nbytes
+        lexical = snapshot.lexical.nbytes if snapshot.lexical is not None else 0
+        return vectors + lexical + snapshot.sections.nbytes + len(self.original_text)
+
+    def _commit(self,
+                index: Optional[faiss.Index],
+                delta: Optional[IndexDelta],
+                sections: SectionStore,
+                upserts: Sequence[TermSection] = (),
+                removed: Sequence[int] = ()) -> None:
+        """
+        Update the BM25 index for the changed sections (`upserts` added or
+        replaced, `removed` dropped), persist the new state (for indexes
+        backed by cache_dir), then swap it in. Only the changed sections are
+        tokenized; the other postings are carried over (see
+        LexicalIndex.with_changes).
 
-        embeddings = self.embedding_model.encode([s.content for s in self.sections])
-        self.index = self._create_index(embeddings)
-        print("[TermsSearchEngine] In-memory index created.")
+        Edits leave the main index alone and collect their vectors in `delta`.
+        Once the delta grows past a fraction of the index (see
+        IndexDelta.needs_compaction) it is folded into a new main index here;
+        that one edit pays for copying (or, for HNSW and reranking indexes,
+        rebuilding) the index.
+        """
+        if index is not None and delta.needs_compaction(index):
+            logger.info("Compacting %d change(s) into the index", len(delta))
+            index, delta = delta.compact(index), None
+        lexical = self._snapshot.lexical
+        if lexical is None:
+            lexical = LexicalIndex.from_sections(sections.values())
+        else:
+            lexical = lexical.with_changes(upserts, removed)
+        if self._persistent:
+            self._save_state(index, delta, sections, lexical)
+        self._swap(index, sections, lexical, delta)
 
-    def load_state(self) -> bool:
+    def _swap(self,
+              index: Optional[faiss.Index],
+              sections: SectionStore,
+              lexical: Optional[LexicalIndex],
+              delta: Optional[IndexDelta] = None) -> None:
+        """
+        Atomically replace the current snapshot, starting a new index version
+        and invalidating the query caches. `delta` holds the changes not yet
+        in `index` (None for none).
+        """
+        if index is not None and delta is None:
+            delta = IndexDelta.empty(index.d)
+        self._snapshot = IndexSnapshot(index=index, sections=sections, version=self._snapshot.version + 1,
+                                       lexical=lexical, filters=SectionFilterIndex.from_store(sections), delta=delta)
+        self._embedding_cache.clear()
+        self._result_cache.clear()
+
+    def load_state(self, markdown_path: Optional[str] = None) -> bool:
         """
         Load index and sections from the cache directory, if they exist.
         Returns True if successful, else False.
+
+        Sections and (where FAISS supports it) the index are memory-mapped,
+        so loading is near-instant and processes share the same pages.
+
+        A saved index whose manifest does not match this engine's provider,
+        dimension or splitter is not loaded, nor one built from an earlier
+        version of `markdown_path` (if given). Rebuild it with build_index,
+        which reuses the vectors of unchanged sections.
         """
-        cache_path = os.path.join(self.cache_dir, "terms_search")
-        index_file = f"{cache_path}.index"
-        pkl_file = f"{cache_path}.pkl"
-
-        if os.path.exists(index_file) and os.path.exists(pkl_file):
-            self.index = faiss.read_index(index_file)
-            with open(pkl_file, "rb") as f:
-                state = pickle.load(f)
-                self.sections = state["sections"]
-                self.original_text = state["original_text"]
-            print("[TermsSearchEngine] Successfully loaded state from cache.")
-            return True
+        with self._write_lock:
+            state_dir = current_version_dir(self._state_root)
+            if state_dir is None:
+                return False
 
-        return False
+            try:
+                sections = SectionStore(state_dir)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning("Cache is unreadable or outdated, ignoring it: %s", e)
+                return False
+
+            saved = IndexManifest.from_dict(sections.meta.get("manifest"))
+            reason = self._stale_reason(saved, markdown_path)
+            if reason is not None:
+                logger.warning("Saved index is out of date, not loading it: %s", reason)
+                return False
 
-    def search(self, query: str, k: int = 3) -> List[Dict]:
+            index, _ = read_index_mmap(os.path.join(state_dir, INDEX_FILE))
+            delta = IndexDelta.load(state_dir, index.d)
+            lexical = LexicalIndex.load(state_dir)
+            if lexical is None:
+                # Saved before the BM25 index existed, or in an older format
+                logger.info("Building the BM25 index of the saved sections")
+                lexical = LexicalIndex.from_sections(sections.values())
+            self.original_text = ""
+            self._text_length = sections.meta["text_length"]
+            self._text_bytes = sections.meta["text_bytes"]
+            self._next_section_id = sections.meta["next_section_id"]
+            self._state_dir = state_dir
+            self._saved_index = index
+            self._source_hash = saved.source_hash
+            self._persistent = True
+            self._swap(index, sections, lexical, delta)
+            logger.info("Loaded state from cache", extra={"sections": len(sections)})
+            return True
+
+    def search(self,
+               query: str,
+               k: int = 3,
+               nprobe: Optional[int] = None,
+               ef_search: Optional[int] = None,
+               mode: Optional[str] = None,
+               filters: Optional[SectionFilter] = None) -> List[Dict]:
         """
-        Perform semantic search for similar sections given a query.
+        Search for the sections best matching a query.
         Returns a list of dictionaries containing the matched sections.
+
+        `mode` overrides the engine's search_mode for this search (see
+        SEARCH_MODES). `nprobe` and `ef_search` override the index defaults
+        for this search only (they apply to IVF and HNSW indexes respectively).
+        Repeated queries are answered from the query caches without embedding
+        or searching again.
+
+        `filters` restricts the search to sections with a given title, section
+        id range or character span. The restriction is applied inside the
+        FAISS (and BM25) search, so a filtered search still returns up to k
+        matching sections, however few sections the filter selects.
+
+        If the query cannot be embedded (the provider fails, or takes longer
+        than embedding_timeout), it is answered from the BM25 index instead;
+        such matches have "retrieval": "lexical".
+        """
+        logger.debug("Searching for: %s", query)
+        return self.search_many([query], k, nprobe, ef_search, mode, filters)[0]
+
+    def search_many(self,
+                    queries: List[str],
+                    k: int = 3,
+                    nprobe: Optional[int] = None,
+                    ef_search: Optional[int] = None,
+                    mode: Optional[str] = None,
+                    filters: Optional[SectionFilter] = None) -> List[List[Dict]]:
+        """
+        Search several queries at once: all uncached queries are embedded in one
+        provider call and searched with one matrix search. Returns one result
+        list per query, in the order of `queries`.
         """
-        if not self.index:
+        mode = self._search_mode(mode)
+        # One snapshot for the whole call, whatever is swapped in meanwhile
+        snapshot = self._snapshot
+        if not snapshot.index:
             raise ValueError("[TermsSearchEngine] Error: Index not built yet.")
+        if not queries:
+            return []
 
-        print(f"[TermsSearchEngine] Searching for: {query}")
-        # Convert query into embeddings
-        query_embedding = self.embedding_model.encode([query])
+        version = snapshot.version
+        normalized, results, pending = self._cached_results(queries, version, k, nprobe, ef_search, mode, filters)
+        if pending:
+            embeddings = self._query_embeddings(pending) if mode != "lexical" else {}
+            found = self._search_pending(snapshot, pending, embeddings, k, nprobe, ef_search, mode, filters)
+            self._store_results(results, pending, found, embeddings, version, k, nprobe, ef_search, mode, filters)
+        return [[dict(match) for match in results[q]] for q in normalized]
 
-        # Normalize query embedding
-        faiss.normalize_L2(query_embedding)
+    async def asearch(self,
+                      query: str,
+                      k: int = 3,
+                      nprobe: Optional[int] = None,
+                      ef_search: Optional[int] = None,
+                      mode: Optional[str] = None,
+                      filters: Optional[SectionFilter] = None) -> List[Dict]:
+        """
+        Async version of search. Embeds the query with the provider's async API
+        and runs the FAISS search on the engine's thread pool.
+        """
+        logger.debug("Searching for: %s", query)
+        results = await self.asearch_many([query], k, nprobe, ef_search, mode, filters)
+        return results[0]
+
+    async def asearch_many(self,
+                           queries: List[str],
+                           k: int = 3,
+                           nprobe: Optional[int] = None,
+                           ef_search: Optional[int] = None,
+                           mode: Optional[str] = None,
+                           filters: Optional[SectionFilter] = None) -> List[List[Dict]]:
+        """
+        Async version of search_many.
+        """
+        mode = self._search_mode(mode)
+        # One snapshot for the whole call, whatever is swapped in meanwhile
+        snapshot = self._snapshot
+        if not snapshot.index:
+            raise ValueError("[TermsSearchEngine] Error: Index not built yet.")
+        if not queries:
+            return []
+
+        version = snapshot.version
+        normalized, results, pending = self._cached_results(queries, version, k, nprobe, ef_search, mode, filters)
+        if pending:
+            embeddings = await self._aquery_embeddings(pending) if mode != "lexical" else {}
+            found = await self._run(self._search_pending, snapshot, pending, embeddings, k, nprobe, ef_search, mode,
+                                    filters)
+            self._store_results(results, pending, found, embeddings, version, k, nprobe, ef_search, mode, filters)
+        return [[dict(match) for match in results[q]] for q in normalized]
+
+    def _search_mode(self, mode: Optional[str]) -> str:
+        mode = mode or self.search_mode
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode '{mode}', expected one of {SEARCH_MODES}")
+        return mode
+
+    @staticmethod
+    def _normalize_query(query: str) -> str:
+        return " ".join(query.split())
+
+    def _cached_results(self,
+                        queries: List[str],
+                        version: int,
+                        k: int,
+                        nprobe: Optional[int],
+                        ef_search: Optional[int],
+                        mode: str,
+                        filters: Optional[SectionFilter]) -> Tuple[List[str], Dict[str, Optional[List[Dict]]], List[str]]:
+        """
+        Look queries up in the result cache.
+
+        Returns:
+            The normalized queries, cached results by normalized query, and the
+            distinct normalized queries that still need a search
+        """
+        normalized = [self._normalize_query(q) for q in queries]
+        results = {
+            q: self._result_cache.get((version, q, k, nprobe, ef_search, mode, filters))
+            for q in dict.fromkeys(normalized)
+        }
+        pending = [q for q, r in results.items() if r is None]
+        return normalized, results, pending
+
+    def _cached_query_embeddings(self, queries: List[str]) -> Tuple[Dict[str, np.ndarray], List[str]]:
+        """
+        Look normalized queries up in the query embedding cache.
+
+        Returns:
+            The cached embeddings by query, and the queries still to embed
+        """
+        embeddings = {}
+        for q in queries:
+            vec = self._embedding_cache.get(q)
+            if vec is not None:
+                embeddings[q] = vec
+        return embeddings, [q for q in queries if q not in embeddings]
+
+    def _query_embeddings(self, queries: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Embeddings of normalized queries, from the query embedding cache or the
+        provider. Queries the provider fails on, or does not answer within
+        embedding_timeout, are left out (and later answered lexically).
+        """
+        embeddings, missing = self._cached_query_embeddings(queries)
+        if not missing:
+            return embeddings
+        try:
+            if self.embedding_timeout <= 0:
+                vectors = self._encode(missing)
+            else:
+                future = self._get_timeout_executor().submit(self._encode, missing)
+                try:
+                    vectors = future.result(timeout=self.embedding_timeout)
+                except FutureTimeoutError:
+                    # Keep the embeddings once they arrive, for the next search of these queries
+                    future.add_done_callback(functools.partial(self._store_late_embeddings, missing))
+                    self._record_fallback("timeout", missing)
+                    return embeddings
+        except Exception as e:
+            self._record_fallback("error", missing, e)
+            return embeddings
+        self._store_query_embeddings(embeddings, missing, vectors)
+        return embeddings
+
+    def _get_timeout_executor(self) -> ThreadPoolExecutor:
+        with self._timeout_executor_lock:
+            if self._timeout_executor is None:
+                self._timeout_executor = ThreadPoolExecutor(max_workers=self._max_workers,
+                                                            thread_name_prefix="terms-embed")
+            return self._timeout_executor
+
+    async def _aquery_embeddings(self, queries: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Async version of _query_embeddings.
+        """
+        embeddings, missing = self._cached_query_embeddings(queries)
+        if not missing:
+            return embeddings
+        try:
+            if self.embedding_timeout <= 0:
+                vectors = await self._aencode(missing)
+            else:
+                task = asyncio.ensure_future(self._aencode(missing))
+                try:
+                    vectors = await asyncio.wait_for(asyncio.shield(task), self.embedding_timeout)
+                except asyncio.TimeoutError:
+                    task.add_done_callback(functools.partial(self._store_late_embeddings, missing))
+                    self._record_fallback("timeout", missing)
+                    return embeddings
+        except Exception as e:
+            self._record_fallback("error", missing, e)
+            return embeddings
+        self._store_query_embeddings(embeddings, missing, vectors)
+        return embeddings
+
+    def _store_query_embeddings(self, embeddings: Dict[str, np.ndarray], queries: List[str], vectors: np.ndarray) -> None:
+        failed = []
+        for q, vec in zip(queries, vectors):
+            vec = np.array(vec, dtype=np.float32)
+            # Zero vectors are the providers' error fallback; never search or cache them
+            if np.any(vec):
+                embeddings[q] = vec
+                self._embedding_cache.put(q, vec)
+            else:
+                failed.append(q)
+        if failed:
+            self._record_fallback("error", failed)
+
+    def _store_late_embeddings(self, queries: List[str], future: Union[Future, asyncio.Future]) -> None:
+        if not future.cancelled() and future.exception() is None:
+            for q, vec in zip(queries, future.result()):
+                vec = np.array(vec, dtype=np.float32)
+                if np.any(vec):
+                    self._embedding_cache.put(q, vec)
+
+    @staticmethod
+    def _record_fallback(reason: str, queries: List[str], error: Optional[Exception] = None) -> None:
+        SEARCH_FALLBACKS.labels(reason=reason).inc(len(queries))
+        logger.warning("Query embedding %s, searching %d query(s) lexically%s",
+                       "timed out" if reason == "timeout" else "failed", len(queries),
+                       f": {error}" if error is not None else "")
+
+    def _store_results(self,
+                       results: Dict[str, Optional[List[Dict]]],
+                       queries: List[str],
+                       found: List[List[Dict]],
+                       embeddings: Dict[str, np.ndarray],
+                       version: int,
+                       k: int,
+                       nprobe: Optional[int],
+                       ef_search: Optional[int],
+                       mode: str,
+                       filters: Optional[SectionFilter]) -> None:
+        for q, matches in zip(queries, found):
+            results[q] = matches
+            # Lexical fallback results are not cached, so the query is retried once the provider recovers
+            if mode == "lexical" or q in embeddings:
+                self._result_cache.put((version, q, k, nprobe, ef_search, mode, filters), matches)
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        with time_stage("encode"):
+            return self.embedding_model.encode(texts)
+
+    async def _aencode(self, texts: List[str]) -> np.ndarray:
+        with time_stage("encode"):
+            return await self.embedding_model.aencode(texts)
+
+    async def aprocess_text(self, text: str) -> None:
+        """
+        Async version of process_text, run on the engine's thread pool.
+        """
+        await self._run(self.process_text, text)
+
+    async def abuild_index(self, markdown_path: str) -> None:
+        """
+        Async version of build_index, run on the engine's thread pool.
+        """
+        await self._run(self.build_index, markdown_path)
+
+    def close(self) -> None:
+        """
+        Stop the engine's thread pools and close the embedding model it built
+        (its micro-batcher, cache and provider). Models and pools passed in by
+        the caller are left to the caller.
+        """
+        with self._timeout_executor_lock:
+            timeout_executor, self._timeout_executor = self._timeout_executor, None
+        if timeout_executor is not None:
+            # Holds only embeddings a search already stopped waiting for
+            timeout_executor.shutdown(wait=False)
+        if self._owns_executor:
+            self.executor.shutdown()
+        if self._owns_embedding_model:
+            self.embedding_model.close()
+
+    async def aclose(self) -> None:
+        """
+        Async version of close, which also closes the async HTTP clients of
+        the embedding model the engine built.
+        """
+        if self._owns_embedding_model:
+            await self.embedding_model.aclose()
+        self.close()
+
+    async def _run(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Run a blocking function on the engine's thread pool.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    def _search_pending(self,
+                        snapshot: IndexSnapshot,
+                        queries: List[str],
+                        embeddings: Dict[str, np.ndarray],
+                        k: int,
+                        nprobe: Optional[int],
+                        ef_search: Optional[int],
+                        mode: str,
+                        filters: Optional[SectionFilter] = None) -> List[List[Dict]]:
+        """
+        Search normalized queries in a snapshot. Queries without an embedding
+        (all of them in lexical mode) are answered from the BM25 index.
+        Returns one result list per query.
+        """
+        rows = snapshot.filters.rows(filters) if filters is not None else None
+        if rows is not None and not len(rows):
+            return [[] for _ in queries]
+
+        found: Dict[str, List[Dict]] = {}
+        embedded = [q for q in queries if q in embeddings]
+        if mode == "vector" and embedded:
+            results = self._search_embeddings(snapshot, np.array([embeddings[q] for q in embedded]),
+                                              k, nprobe, ef_search, rows)
+            found.update(zip(embedded, results))
+        elif mode == "hybrid":
+            for q in embedded:
+                found[q] = self._hybrid_search(snapshot, q, embeddings[q], k, nprobe, ef_search, rows)
+        for q in queries:
+            if q not in found:
+                found[q] = self._lexical_search(snapshot, q, k, rows)
+        return [found[q] for q in queries]
+
+    def _search_embeddings(self,
+                           snapshot: IndexSnapshot,
+                           query_embeddings: np.ndarray,
+                           k: int,
+                           nprobe: Optional[int] = None,
+                           ef_search: Optional[int] = None,
+                           rows: Optional[np.ndarray] = None) -> List[List[Dict]]:
+        """
+        Search a snapshot's index with already computed query embeddings (one
+        per row), among the sections in `rows` if given (see
+        SectionFilterIndex.rows). Returns one result list per row.
+        """
+        # Normalize query embeddings
+        faiss.normalize_L2(query_embeddings)
 
         # Search
-        distances, indices = self.index.search(query_embedding, k)
+        if rows is not None:
+            distances, indices = self._filtered_search(snapshot, query_embeddings, k, nprobe, ef_search, rows)
+        else:
+            with time_stage("index_search"):
+                distances, indices = snapshot.delta.search(snapshot.index, query_embeddings, k, nprobe, ef_search)
+        return [self._matches(snapshot, row_indices, row_distances, "vector")
+                for row_distances, row_indices in zip(distances, indices)]
+
+    def _filtered_search(self,
+                         snapshot: IndexSnapshot,
+                         query_embeddings: np.ndarray,
+                         k: int,
+                         nprobe: Optional[int],
+                         ef_search: Optional[int],
+                         rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Search normalized query embeddings among the sections in `rows` only.
+
+        Selections of more than filter_exact_max sections are searched inside
+        the index with an ID selector, probing more inverted lists or graph
+        nodes the narrower the selection is. Smaller ones, selections the index
+        cannot search that way, and queries for which that search came back
+        short are answered by scoring the selected sections' vectors directly.
+        Selected sections whose vectors are in the snapshot's delta are always
+        scored directly.
+
+        Returns:
+            Scores and section ids (-1 for no match) per query, as from index.search
+        """
+        ids = snapshot.filters.ids(rows)
+        index, delta = snapshot.index, snapshot.delta
+        main_ids = np.setdiff1d(ids, delta.ids, assume_unique=True)
+        params = None
+        if len(ids) > self.filter_exact_max and len(main_ids):
+            # One row range holds every indexed id between its first and last,
+            # unless the main index still holds stale vectors among them
+            lo, hi = np.searchsorted(delta.stale, [main_ids[0], main_ids[-1] + 1])
+            selector = id_selector(main_ids, whole_range=len(rows) == 1 and lo == hi)
+            params = filtered_search_params(index, selector, len(main_ids) / max(index.ntotal, 1), nprobe, ef_search)
+        if params is None:
+            FILTERED_SEARCHES.labels(path="exact").inc(len(query_embeddings))
+            return self._exact_search(snapshot, query_embeddings, ids, k)
+
+        with time_stage("index_search"):
+            distances, indices = index.search(query_embeddings, k, params=params)
+        delta_ids = np.intersect1d(ids, delta.ids, assume_unique=True)
+        if len(delta_ids):
+            distances, indices = merge_results(
+                distances, indices, *self._exact_search(snapshot, query_embeddings, delta_ids, k), k
+            )
+        # More than k sections are selected, so a missing match means the probed
+        # lists or explored graph held too few of them
+        short = np.flatnonzero((indices < 0).any(axis=1))
+        FILTERED_SEARCHES.labels(path="index").inc(len(query_embeddings) - len(short))
+        if len(short):
+            FILTERED_SEARCHES.labels(path="exact").inc(len(short))
+            distances[short], indices[short] = self._exact_search(snapshot, query_embeddings[short], ids, k)
+        return distances, indices
+
+    @staticmethod
+    def _exact_search(snapshot: IndexSnapshot,
+                      query_embeddings: np.ndarray,
+                      ids: np.ndarray,
+                      k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Best k of `ids` per query by the scores of their current vectors in a
+        snapshot, as from index.search (padded with -1 ids if fewer than k are stored).
+        """
+        n = len(query_embeddings)
+        best_scores = np.full((n, k), -np.inf, dtype=np.float32)
+        best_ids = np.full((n, k), -1, dtype=np.int64)
+        with time_stage("index_search"):
+            for start in range(0, len(ids), FILTER_SCORE_BATCH):
+                batch = ids[start:start + FILTER_SCORE_BATCH]
+                scores = snapshot.delta.vector_scores(snapshot.index, query_embeddings, batch)
+                scores = np.nan_to_num(scores, nan=-np.inf)
+                scores = np.concatenate([best_scores, scores], axis=1)
+                candidates = np.concatenate([best_ids, np.broadcast_to(batch, (n, len(batch)))], axis=1)
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                best_scores = np.take_along_axis(scores, top, axis=1)
+                best_ids = np.take_along_axis(candidates, top, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_ids = np.take_along_axis(best_ids, order, axis=1)
+        best_ids[np.isneginf(best_scores)] = -1
+        return best_scores, best_ids
+
+    def _lexical_search(self,
+                        snapshot: IndexSnapshot,
+                        query: str,
+                        k: int,
+                        rows: Optional[np.ndarray] = None) -> List[Dict]:
+        """
+        Search a snapshot's BM25 index, among the sections in `rows` if given.
+        The "similarity" of these matches is their BM25 score.
+        """
+        if snapshot.lexical is None:
+            return []
+        with time_stage("lexical_search"):
+            ids, scores = snapshot.lexical.search(query, k, row_ranges=rows)
+        return self._matches(snapshot, ids, scores, "lexical")
+
+    def _hybrid_search(self,
+                       snapshot: IndexSnapshot,
+                       query: str,
+                       embedding: np.ndarray,
+                       k: int,
+                       nprobe: Optional[int] = None,
+                       ef_search: Optional[int] = None,
+                       rows: Optional[np.ndarray] = None) -> List[Dict]:
+        """
+        Rerank the query's best BM25 candidates by a weighted sum of their
+        vector similarity and their BM25 score (scaled to the best candidate's).
+        Queries sharing no term with any section fall back to a vector search.
+        Candidates are drawn from the sections in `rows` only, if given.
+        """
+        candidates = np.zeros(0, dtype=np.int64)
+        if snapshot.lexical is not None:
+            with time_stage("lexical_search"):
+                candidates, bm25 = snapshot.lexical.search(query, max(self.hybrid_candidates, k), row_ranges=rows)
+        if not len(candidates):
+            return self._search_embeddings(snapshot, embedding.reshape(1, -1).copy(), k, nprobe, ef_search, rows)[0]
+
+        query_embedding = embedding.reshape(1, -1).copy()
+        faiss.normalize_L2(query_embedding)
+        with time_stage("index_search"):
+            similarity = np.nan_to_num(snapshot.delta.vector_scores(snapshot.index, query_embedding[0], candidates))
+        scores = self.hybrid_weight * similarity + (1 - self.hybrid_weight) * bm25 / bm25[0]
+        top = np.argsort(-scores, kind="stable")[:k]
+        return self._matches(snapshot, candidates[top], scores[top], "hybrid")
+
+    @staticmethod
+    def _matches(snapshot: IndexSnapshot, ids: Iterable[int], scores: Iterable[float], retrieval: str) -> List[Dict]:
+        """
+        Result dicts for section ids and their scores, skipping ids without a section.
+        """
         results = []
-        for dist, idx in zip(distances[0], indices[0]):
-            if 0 <= idx < len(self.sections):
-                section = self.sections[idx]
-                results.append({
+        for idx, score in zip(ids, scores):
+            section = snapshot.sections.get(int(idx))
+            if section is not None:
+                result = {
+                    "section_id": section.section_id,
                     "content": section.content,
-                    "similarity": float(dist),
+                    "similarity": float(score),
                     "title": section.title,
                     "start_idx": section.start_idx,
                     "end_idx": section.end_idx,
-                })
+                    "retrieval": retrieval,
+                }
+                if section.start_ms is not None:
+                    result.update(start_ms=section.start_ms, end_ms=section.end_ms, speaker=section.speaker)
+                if section.document_id is not None:
+                    result["document_id"] = section.document_id
+                results.append(result)
         return results
 
-    def _save_state(self) -> None:
+    def _save_state(self,
+                    index: faiss.Index,
+                    delta: Optional[IndexDelta],
+                    sections: SectionStore,
+                    lexical: LexicalIndex) -> None:
         """
-        Save the FAISS index and sections to local disk.
+        Save a FAISS index, its delta, its sections and their BM25 index to local disk, as a new state version.
         """
-        cache_path = os.path.join(self.cache_dir, "terms_search")
-        faiss.write_index(self.index, f"{cache_path}.index")
+        state_dir = new_version_dir(self._state_root)
+        sections.save(state_dir, meta={
+            "text_length": self._text_length,
+            "text_bytes": self._text_bytes,
+            "next_section_id": self._next_section_id,
+            "manifest": self._manifest(self._source_hash).to_dict(),
+        })
+        self._write_state(state_dir, index, delta, lexical)
 
-        state = {
-            "sections": self.sections,
-            "original_text": self.original_text,
-        }
-        with open(f"{cache_path}.pkl", "wb") as f:
-            pickle.dump(state, f)
+    def _write_state(self,
+                     state_dir: str,
+                     index: faiss.Index,
+                     delta: Optional[IndexDelta],
+                     lexical: LexicalIndex) -> None:
+        """
+        Finish writing a state version whose sections are written (index,
+        delta and BM25 index) and publish it.
+
+        An index unchanged since the last save is hard-linked to that
+        version's file rather than written again, so saving an edit costs
+        about the size of the delta plus the sections.
+        """
+        index_path = os.path.join(state_dir, INDEX_FILE)
+        linked = False
+        if index is not None and index is self._saved_index:
+            try:
+                os.link(os.path.join(self._state_dir, INDEX_FILE), index_path)
+                linked = True
+            except OSError as e:
+                logger.debug("Could not link the saved index, writing it again: %s", e)
+        if not linked:
+            faiss.write_index(index, index_path)
+        if delta is not None:
+            delta.save(state_dir)
+        lexical.save(state_dir)
+        publish_version(self._state_root, state_dir)
+        self._state_dir = state_dir
+        self._saved_index = index
 
-    def _create_index(self, embeddings: np.ndarray) -> faiss.Index:
+    def _create_index(self, embeddings: np.ndarray, ids: List[int]) -> faiss.Index:
         """
-        Create and return a FAISS index from the given embeddings.
-        Normalizes the embeddings and uses a simple Inner Product index.
+        Create and return a FAISS index from the given embeddings, stored under
+        the given section ids. Normalizes the embeddings and builds an Inner
+        Product index of the configured type (see search.index_factory).
         """
         if embeddings.ndim == 1:
             embeddings = embeddings.reshape(1, -1)
-        dim = embeddings.shape[1]
 
-        index = faiss.IndexFlatIP(dim)
         faiss.normalize_L2(embeddings)
-        index.add(embeddings)
-        return index
+        return create_index(embeddings, self.index_type, ids=np.asarray(ids, dtype=np.int64),
+                            nprobe=self.nprobe, ef_search=self.ef_search,
+                            compression=self.compression, rerank=self.rerank)
 
-    def _split_into_sections(self, content: str) -> List[TermSection]:
+    def _split_into_sections(self,
+                             content: str,
+                             first_section_id: int = 0,
+                             initial_title: str = "Introduction",
+                             offset: int = 0,
+                             byte_offset: int = 0) -> List[TermSection]:
         """
-        Naive splitting of content by lines. If a line starts with and ends with '**',
-        we treat it as a new title, otherwise it's appended as content to a section.
-        """
-        sections: List[TermSection] = []
-        current_title = "Introduction"
-        section_id = 0
-        current_position = 0
+        Split an in-memory text into sections (see search.splitter.iter_sections).
 
-        lines = content.split("\n")
-        for line in lines:
-            clean_line = line.strip()
-            if not clean_line:
-                continue
-
-            if clean_line.startswith("**") and clean_line.endswith("**"):
-                current_title = clean_line.replace("**", "")
-                current_position = content.find(line, current_position) + len(line)
-            else:
-                line_start = content.find(line, current_position)
-                if line_start != -1:
-                    line_end = line_start + len(line)
-                    sections.append(
-                        TermSection(
-                            section_id=section_id,
-                            content=clean_line,
-                            title=current_title,
-                            start_idx=line_start,
-                            end_idx=line_end
-                        )
-                    )
-                    section_id += 1
-                    current_position = line_end
-
-        return sections
+        Section ids start at `first_section_id` and positions are shifted by
+        `offset` characters and `byte_offset` bytes, for content appended to
+        an existing document.
+        """
+        with time_stage("split"):
+            return list(iter_sections(
+                io.StringIO(content),
+                first_section_id=first_section_id,
+                initial_title=initial_title,
+                offset=offset,
+                byte_offset=byte_offset
+            ))
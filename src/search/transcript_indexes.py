@@ -0,0 +1,72 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+from search.terms_search_engine import TermsSearchEngine
+
+class TranscriptIndexes:
+    """
+    Search engines over finished transcripts, keyed by transcript id.
+
+    Each transcript is embedded once, when it is added; searches only embed
+    the query. Concurrent requests to add a transcript that is still being
+    indexed wait for that build instead of starting their own. The least recently used transcripts are dropped once more
+    than `max_entries` are held.
+    """
+    def __init__(self,
+                 build: Callable[[List[Dict]], TermsSearchEngine],
+                 max_entries: int = 64):
+        """
+        Args:
+            build: Function that builds a search engine for a list of utterances
+            max_entries: Maximum number of indexed transcripts
+        """
+        self.build = build
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, TermsSearchEngine]" = OrderedDict()
+        self._building: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def add(self, transcript_id: str, utterances: List[Dict]) -> TermsSearchEngine:
+        """
+        Index a transcript under `transcript_id`, unless it is already indexed.
+        """
+        with self._lock:
+            engine = self._entries.get(transcript_id)
+            if engine is not None:
+                self._entries.move_to_end(transcript_id)
+                return engine
+            pending = self._building.get(transcript_id)
+            if pending is None:
+                future: Future = Future()
+                self._building[transcript_id] = future
+        if pending is not None:
+            return pending.result()
+
+        try:
+            engine = self.build(utterances)
+        except BaseException as e:
+            with self._lock:
+                del self._building[transcript_id]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._building[transcript_id]
+            self._entries[transcript_id] = engine
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        future.set_result(engine)
+        return engine
+
+    def get(self, transcript_id: str) -> Optional[TermsSearchEngine]:
+        with self._lock:
+            engine = self._entries.get(transcript_id)
+            if engine is not None:
+                self._entries.move_to_end(transcript_id)
+            return engine
+
+    def __contains__(self, transcript_id: str) -> bool:
+        with self._lock:
+            return transcript_id in self._entries
@@ -1,26 +1,119 @@
 import os
+import time
+import random
+import tempfile
+import asyncio
+import logging
+import functools
+from typing import Optional
 from fastapi import FastAPI, Request, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import Response
 
 from dotenv import load_dotenv
-import assemblyai as aai
 
 from search.terms_search_engine import TermsSearchEngine
+from search.section_filter import SectionFilter
+from search.document_cache import DocumentIndexCache
+from search.transcript_indexes import TranscriptIndexes
+from server.example_store import ExampleStore
+from transcription.base import TranscriberBase
+from transcription.assembly import AssemblyAITranscriber
+from transcription.fake import FakeTranscriber
+from transcription.jobs import TranscriptionJobs, QueueFullError, GENERIC_ERROR
+from observability.logs import setup_logging
+from observability.metrics import HTTP_REQUESTS, HTTP_REQUEST_SECONDS, render_metrics, time_stage
 
 # Load environment variables
 load_dotenv()
-aai.settings.api_key = os.getenv("ASSEMBLYAI_API_KEY", "")
+
+# Logging configuration
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+
+logger = logging.getLogger(__name__)
 
 # Embedding configuration
 EMBEDDING_API_URL = os.getenv("EMBEDDING_API_URL", "http://localhost:8080")
+# Comma-separated llama.cpp servers running the same model; overrides EMBEDDING_API_URL
+EMBEDDING_API_URLS = [url.strip() for url in os.getenv("EMBEDDING_API_URLS", "").split(",") if url.strip()]
+# Requests slower than this latency percentile are duplicated to another server (0 disables)
+EMBEDDING_HEDGE_PERCENTILE = float(os.getenv("EMBEDDING_HEDGE_PERCENTILE", "95"))
+# Servers failing this many requests in a row are ejected, then re-probed after EMBEDDING_EJECT_SECONDS
+EMBEDDING_EJECT_FAILURES = int(os.getenv("EMBEDDING_EJECT_FAILURES", "3"))
+EMBEDDING_EJECT_SECONDS = float(os.getenv("EMBEDDING_EJECT_SECONDS", "10"))
 EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "llama")
 EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", "384"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+EMBEDDING_CACHE = os.getenv("EMBEDDING_CACHE", "true").lower() in ("1", "true", "yes")
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+# Concurrent query embeddings arriving within this window are sent as one batch
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "2"))
+EMBEDDING_BATCH_MAX = int(os.getenv("EMBEDDING_BATCH_MAX", "64"))
+
+# Index configuration
+INDEX_TYPE = os.getenv("INDEX_TYPE", "auto")
+INDEX_NPROBE = int(os.getenv("INDEX_NPROBE", "16"))
+INDEX_EF_SEARCH = int(os.getenv("INDEX_EF_SEARCH", "64"))
+INDEX_COMPRESSION = os.getenv("INDEX_COMPRESSION", "none")
+INDEX_RERANK = int(os.getenv("INDEX_RERANK", "0"))
+INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", "1024"))
+
+# Document indexed on first startup
+DEFAULT_TERMS_FILE = "noterms.md"
+
+# Set for worker processes sharing an index built by another process: they only
+# load it (memory-mapped) and refuse changes to it
+INDEX_READ_ONLY = os.getenv("INDEX_READ_ONLY", "false").lower() in ("1", "true", "yes")
+
+# Threads running blocking embedding and FAISS work off the event loop
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "4"))
+
+# Upload chunk size when streaming files to disk
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_DIR = "uploads"
+
+# Transcription configuration
+TRANSCRIBER = os.getenv("TRANSCRIBER", "assemblyai")
+TRANSCRIPTION_WORKERS = int(os.getenv("TRANSCRIPTION_WORKERS", "2"))
+TRANSCRIPTION_QUEUE_SIZE = int(os.getenv("TRANSCRIPTION_QUEUE_SIZE", "16"))
+TRANSCRIPTION_JOB_TTL = float(os.getenv("TRANSCRIPTION_JOB_TTL", "3600"))
+JOBS_DIR = os.path.join("cache", "jobs")
+
+# Per-document index cache for texts posted to /search
+DOCUMENT_CACHE_ENTRIES = int(os.getenv("DOCUMENT_CACHE_ENTRIES", "32"))
+DOCUMENT_CACHE_MB = int(os.getenv("DOCUMENT_CACHE_MB", "256"))
+
+# Query embedding and result caches, invalidated whenever the index changes
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "300"))
+
+# Search mode: 'vector', 'lexical' (BM25 only, never waits on the embedding provider) or 'hybrid'
+SEARCH_MODE = os.getenv("SEARCH_MODE", "vector")
+# Searches answer from the BM25 index if the query embedding takes longer than this (0 to wait indefinitely)
+SEARCH_EMBEDDING_TIMEOUT_MS = float(os.getenv("SEARCH_EMBEDDING_TIMEOUT_MS", "1000"))
+# Hybrid mode: BM25 candidates reranked with vectors, and the weight of vector similarity in the fused score
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "100"))
+HYBRID_WEIGHT = float(os.getenv("HYBRID_WEIGHT", "0.5"))
+# Filtered searches selecting at most this many sections score them directly instead of searching the index
+FILTER_EXACT_MAX = int(os.getenv("FILTER_EXACT_MAX", "4096"))
+# Largest number of matches a search may ask for, and of queries in one /search/batch call
+SEARCH_MAX_K = int(os.getenv("SEARCH_MAX_K", "100"))
+SEARCH_BATCH_MAX_QUERIES = int(os.getenv("SEARCH_BATCH_MAX_QUERIES", "64"))
+
+# Example dialogs shown in the UI
+EXAMPLES_PATH = "examples/output.json"
+EXAMPLES_MAX_AGE = int(os.getenv("EXAMPLES_MAX_AGE", "300"))
+
+# Finished transcripts kept indexed for /transcripts/{id}/search
+TRANSCRIPT_INDEX_ENTRIES = int(os.getenv("TRANSCRIPT_INDEX_ENTRIES", "64"))
 
 class SecurityHeadersMiddleware(BaseHTTPMiddleware):
     """
@@ -33,25 +126,281 @@ class SecurityHeadersMiddleware(BaseHTTPMiddleware):
         response.headers["Cross-Origin-Resource-Policy"] = "cross-origin"
         return response
 
+class MetricsMiddleware(BaseHTTPMiddleware):
+    """
+    Middleware recording the count and total duration of requests per endpoint.
+    """
+    async def dispatch(self, request, call_next):
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            # Label by route template so path parameters don't create new series
+            route = request.scope.get("route")
+            endpoint = route.path if route is not None else "unmatched"
+            HTTP_REQUESTS.labels(method=request.method, endpoint=endpoint, status=str(status)).inc()
+            HTTP_REQUEST_SECONDS.labels(method=request.method, endpoint=endpoint).observe(
+                time.perf_counter() - start
+            )
+
+class TimedJSONResponse(JSONResponse):
+    """
+    JSONResponse that records the time spent serializing its content.
+    """
+    def render(self, content) -> bytes:
+        with time_stage("serialize"):
+            return super().render(content)
+
+def create_transcriber(name: str) -> TranscriberBase:
+    """
+    Create the transcription provider: 'assemblyai', or 'fake' for a local stand-in.
+    """
+    if name.lower() == "fake":
+        return FakeTranscriber()
+    return AssemblyAITranscriber(os.getenv("ASSEMBLYAI_API_KEY", ""))
+
+def create_terms_engine() -> TermsSearchEngine:
+    """
+    Create the default TermsSearchEngine with configuration from environment variables.
+    """
+    return TermsSearchEngine(
+        embedding_api_url=EMBEDDING_API_URL,
+        embedding_api_urls=EMBEDDING_API_URLS,
+        embedding_hedge_percentile=EMBEDDING_HEDGE_PERCENTILE,
+        embedding_eject_failures=EMBEDDING_EJECT_FAILURES,
+        embedding_eject_seconds=EMBEDDING_EJECT_SECONDS,
+        embedding_provider=EMBEDDING_PROVIDER,
+        embedding_dimension=EMBEDDING_DIMENSION,
+        embedding_batch_size=EMBEDDING_BATCH_SIZE,
+        embedding_concurrency=EMBEDDING_CONCURRENCY,
+        embedding_cache=EMBEDDING_CACHE,
+        embedding_cache_size=EMBEDDING_CACHE_SIZE,
+        embedding_batch_wait=EMBEDDING_BATCH_WAIT_MS / 1000,
+        embedding_batch_max=EMBEDDING_BATCH_MAX,
+        index_type=INDEX_TYPE,
+        nprobe=INDEX_NPROBE,
+        ef_search=INDEX_EF_SEARCH,
+        compression=INDEX_COMPRESSION,
+        rerank=INDEX_RERANK,
+        max_workers=SEARCH_WORKERS,
+        index_batch_size=INDEX_BATCH_SIZE,
+        query_cache_size=QUERY_CACHE_SIZE,
+        query_cache_ttl=QUERY_CACHE_TTL,
+        **search_options()
+    )
+
+def search_options() -> dict:
+    """
+    Search mode and fallback settings shared by all engines.
+    """
+    return {
+        "search_mode": SEARCH_MODE,
+        "embedding_timeout": SEARCH_EMBEDDING_TIMEOUT_MS / 1000,
+        "hybrid_candidates": HYBRID_CANDIDATES,
+        "hybrid_weight": HYBRID_WEIGHT,
+        "filter_exact_max": FILTER_EXACT_MAX,
+    }
+
+def parse_k(value, default: int = 5) -> int:
+    """
+    Read the number of matches a search request asks for.
+
+    Raises:
+        ValueError: If it is not a positive integer up to SEARCH_MAX_K
+    """
+    if value is None:
+        return default
+    try:
+        # Booleans and fractions are not counts, even though int() takes them
+        if isinstance(value, (bool, float)):
+            raise ValueError
+        k = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("k must be a positive integer") from None
+    if k < 1:
+        raise ValueError("k must be a positive integer")
+    if k > SEARCH_MAX_K:
+        raise ValueError(f"k must be at most {SEARCH_MAX_K}")
+    return k
+
+def build_default_index() -> bool:
+    """
+    Make sure the default index exists in the cache directory, building it
+    from the default terms file if needed. Run by the builder process before
+    read-only workers start.
+
+    Returns:
+        True if an index is available
+    """
+    setup_logging(LOG_LEVEL, LOG_FORMAT)
+    engine = create_terms_engine()
+    try:
+        if engine.load_state(DEFAULT_TERMS_FILE):
+            return True
+        if not os.path.exists(DEFAULT_TERMS_FILE):
+            logger.warning("No '%s' file found, skipping index build.", DEFAULT_TERMS_FILE)
+            return False
+        engine.build_index(DEFAULT_TERMS_FILE)
+        return engine.index is not None
+    finally:
+        engine.close()
+
 def create_app() -> FastAPI:
     """
     Creates and configures the FastAPI application.
     """
-    app = FastAPI(title="My Open RAG Project", version="0.1.0")
+    setup_logging(LOG_LEVEL, LOG_FORMAT)
+    app = FastAPI(title="My Open RAG Project", version="0.1.0", default_response_class=TimedJSONResponse)
 
     # Mount static files (CSS, JS, etc.)
     app.mount("/static", StaticFiles(directory="static"), name="static")
     templates = Jinja2Templates(directory="src/templates")
 
-    # Initialize TermsSearchEngine with configuration from environment variables
-    terms_engine = TermsSearchEngine(
-        embedding_api_url=EMBEDDING_API_URL,
-        embedding_provider=EMBEDDING_PROVIDER,
-        embedding_dimension=EMBEDDING_DIMENSION
+    terms_engine = create_terms_engine()
+
+    async def run_blocking(func, *args, **kwargs):
+        """
+        Run a blocking call on the search engine's thread pool.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(terms_engine.executor, functools.partial(func, *args, **kwargs))
+
+    def format_match(match: dict) -> dict:
+        """
+        Convert an engine search result into the /search response format.
+        """
+        formatted = {
+            "section_id": match["section_id"],
+            "text": match["content"],
+            "score": match["similarity"],
+            "start_idx": match["start_idx"],
+            "end_idx": match["end_idx"],
+            "retrieval": match["retrieval"]
+        }
+        # Indexes built with build_corpus span several documents
+        if "document_id" in match:
+            formatted["document_id"] = match["document_id"]
+        return formatted
+
+    def build_document_engine(text: str) -> TermsSearchEngine:
+        """
+        Build an in-memory engine for a posted text, sharing the default engine's embedding model.
+        """
+        engine = TermsSearchEngine(
+            index_type=INDEX_TYPE,
+            nprobe=INDEX_NPROBE,
+            ef_search=INDEX_EF_SEARCH,
+            compression=INDEX_COMPRESSION,
+            rerank=INDEX_RERANK,
+            embedding_model=terms_engine.embedding_model,
+            executor=terms_engine.executor,
+            query_cache_size=QUERY_CACHE_SIZE,
+            query_cache_ttl=QUERY_CACHE_TTL,
+            **search_options()
+        )
+        engine.process_text(text)
+        return engine
+
+    document_indexes = DocumentIndexCache(
+        build_document_engine,
+        max_entries=DOCUMENT_CACHE_ENTRIES,
+        max_bytes=DOCUMENT_CACHE_MB * 1024 * 1024
     )
 
+    def build_transcript_engine(utterances: list) -> TermsSearchEngine:
+        """
+        Build an in-memory engine over a transcript's utterances, sharing the default engine's embedding model.
+        """
+        engine = TermsSearchEngine(
+            index_type=INDEX_TYPE,
+            nprobe=INDEX_NPROBE,
+            ef_search=INDEX_EF_SEARCH,
+            compression=INDEX_COMPRESSION,
+            rerank=INDEX_RERANK,
+            embedding_model=terms_engine.embedding_model,
+            executor=terms_engine.executor,
+            query_cache_size=QUERY_CACHE_SIZE,
+            query_cache_ttl=QUERY_CACHE_TTL,
+            **search_options()
+        )
+        engine.process_utterances(utterances)
+        return engine
+
+    transcript_indexes = TranscriptIndexes(build_transcript_engine, max_entries=TRANSCRIPT_INDEX_ENTRIES)
+    example_store = ExampleStore(EXAMPLES_PATH)
+
+    transcription_jobs = TranscriptionJobs(
+        create_transcriber(TRANSCRIBER),
+        max_workers=TRANSCRIPTION_WORKERS,
+        max_queued=TRANSCRIPTION_QUEUE_SIZE,
+        ttl=TRANSCRIPTION_JOB_TTL,
+        # Index finished transcripts once, so searching them only embeds the query
+        on_transcribed=lambda job_id, transcript: transcript_indexes.add(job_id, transcript.utterances),
+        # Shared, so any worker process can answer /jobs/{id}
+        state_dir=JOBS_DIR
+    )
+
+    async def find_transcript_engine(transcript_id: str) -> Optional[TermsSearchEngine]:
+        """
+        Return the index of a transcript, building it if the transcript is known
+        but was indexed by another worker process (or evicted).
+        """
+        engine = transcript_indexes.get(transcript_id)
+        if engine is not None:
+            return engine
+
+        if transcript_id.startswith("example-"):
+            converted = await run_blocking(example_store.conversion, transcript_id[len("example-"):])
+            utterances = converted[0]["transcript"] if converted else None
+        else:
+            job = await run_blocking(transcription_jobs.get, transcript_id)
+            utterances = job.result.utterances if job is not None and job.result is not None else None
+        if utterances is None:
+            return None
+        return await run_blocking(transcript_indexes.add, transcript_id, utterances)
+
+    async def rebuild_default_index() -> None:
+        """
+        Build the default index from the terms file. Searches keep using the
+        current index (if any) until the new one is swapped in.
+        """
+        try:
+            await terms_engine.abuild_index(DEFAULT_TERMS_FILE)
+            app.state.index_error = None
+        except Exception as e:
+            logger.exception("Index build failed: %s", e)
+            app.state.index_error = str(e)
+
+    def start_index_build() -> bool:
+        """
+        Start building the default index in the background, unless a build is
+        already running. Returns True if a build was started.
+        """
+        task = app.state.index_build
+        if task is not None and not task.done():
+            return False
+        app.state.index_build = asyncio.create_task(rebuild_default_index())
+        return True
+
+    def index_building() -> bool:
+        task = app.state.index_build
+        return task is not None and not task.done()
+
+    app.state.index_build = None
+    app.state.index_error = None
+
+    def read_only_response() -> JSONResponse:
+        return JSONResponse(status_code=409, content={
+            "success": False,
+            "error": "The index is read-only in multi-worker mode; rebuild it and restart instead"
+        })
+
     # Add middlewares
     app.add_middleware(SecurityHeadersMiddleware)
+    app.add_middleware(MetricsMiddleware)
     app.add_middleware(TrustedHostMiddleware, allowed_hosts=["*"])
     app.add_middleware(
         CORSMiddleware,
@@ -65,15 +414,78 @@ def create_app() -> FastAPI:
     @app.on_event("startup")
     async def on_startup():
         """
-        Attempt to load existing search index state on server startup.
-        If not available, build a new index from a default file.
+        Load the examples, then attempt to load existing search index state on
+        server startup. If not available, start building a new index from a
+        default file in the background, so the server accepts requests right
+        away; /readyz reports when the index is ready. Read-only workers never
+        build; the builder process does.
         """
-        if not terms_engine.load_state():
+        try:
+            await run_blocking(example_store.summaries)
+        except Exception as e:
+            logger.warning("Could not load examples from %s: %s", EXAMPLES_PATH, e)
+
+        # Workers sharing the builder's index serve it as is; the builder checked it
+        source = None if INDEX_READ_ONLY else DEFAULT_TERMS_FILE
+        if not await run_blocking(terms_engine.load_state, source):
+            if INDEX_READ_ONLY:
+                logger.error("No index found in the cache directory; searches will fail until one is built.")
             # If no cache, build index from a default file
-            if os.path.exists("noterms.md"):
-                terms_engine.build_index("noterms.md")
+            elif os.path.exists(DEFAULT_TERMS_FILE):
+                start_index_build()
             else:
-                print("No 'noterms.md' file found, skipping index build.")
+                logger.warning("No '%s' file found, skipping index build.", DEFAULT_TERMS_FILE)
+
+    @app.on_event("shutdown")
+    async def on_shutdown():
+        transcription_jobs.shutdown()
+        await terms_engine.aclose()
+
+    @app.get("/healthz")
+    async def healthz():
+        """
+        Liveness probe: the process is up and serving requests.
+        """
+        return {"status": "ok"}
+
+    @app.get("/readyz")
+    async def readyz():
+        """
+        Readiness probe: 200 once the default index can be searched, 503 while
+        it is still being built (or if there is none). A rebuild of an existing
+        index does not make the server unready.
+        """
+        state = {
+            "building": index_building(),
+            "index_version": terms_engine.index_version,
+            "sections": len(terms_engine.sections)
+        }
+        if terms_engine.index is not None:
+            return {"status": "ready", **state}
+        status = "building" if state["building"] else "unavailable"
+        return JSONResponse(status_code=503, content={"status": status, "error": app.state.index_error, **state})
+
+    @app.post("/reindex")
+    async def reindex():
+        """
+        Rebuild the default index from the terms file in the background. Searches
+        are served from the current index until the new one is swapped in.
+        """
+        if INDEX_READ_ONLY:
+            return read_only_response()
+        if not os.path.exists(DEFAULT_TERMS_FILE):
+            return JSONResponse(status_code=404, content={"success": False, "error": f"No '{DEFAULT_TERMS_FILE}' file found"})
+        if not start_index_build():
+            return JSONResponse(status_code=409, content={"success": False, "error": "An index build is already running"})
+        return JSONResponse(status_code=202, content={"success": True, "status": "building"})
+
+    @app.get("/metrics")
+    async def metrics():
+        """
+        Expose counters and latency histograms in Prometheus text format.
+        """
+        body, content_type = render_metrics()
+        return Response(content=body, media_type=content_type)
 
     @app.get("/", response_class=HTMLResponse)
     async def read_root(request: Request):
@@ -85,81 +497,36 @@ def create_app() -> FastAPI:
     @app.get("/examples")
     async def list_examples():
         """
-        Load examples from output.json and randomly select 3 to show.
+        Randomly select 3 examples to show.
         """
-        import json, random
         try:
-            with open("examples/output.json", "r", encoding="utf-8") as f:
-                all_examples = json.load(f)
-
-            selected_examples = random.sample(all_examples, min(3, len(all_examples)))
-            examples = [
-                {
-                    "id": str(example["example_id"]),
-                    "name": f"{example['product_info']['name']} - {example['product_info']['policy_number']}"
-                }
-                for example in selected_examples
-            ]
-            return JSONResponse({"success": True, "examples": examples})
+            summaries = example_store.summaries()
+            examples = random.sample(summaries, min(3, len(summaries)))
+            # A fresh random pick on every call, so never cache it
+            return JSONResponse({"success": True, "examples": examples}, headers={"Cache-Control": "no-store"})
         except Exception as e:
             return JSONResponse({"success": False, "error": str(e)})
 
     @app.get("/convert-example/{example_id}")
-    async def convert_example(example_id: str):
+    async def convert_example(example_id: str, request: Request):
         """
-        Convert a selected example from output.json into transcript format,
-        including an example SRT and VTT output.
+        Convert a selected example into transcript format, including an example
+        SRT and VTT output. Conversions are memoized and served with an ETag.
         """
-        import json
         try:
-            with open("examples/output.json", "r", encoding="utf-8") as f:
-                all_examples = json.load(f)
-
-            example = next((e for e in all_examples if str(e["example_id"]) == example_id), None)
-            if not example:
+            converted = example_store.conversion(example_id)
+            if converted is None:
                 raise ValueError("Example not found")
+            data, body, etag = converted
 
-            transcript_data = []
-            dialog = example["dialog"]
-            for i, entry in enumerate(dialog):
-                minutes, seconds = map(int, entry["time"].split(":"))
-                start_ms = (minutes * 60 + seconds) * 1000
-
-                # get end time from next entry or default +5s
-                if i < len(dialog) - 1:
-                    next_minutes, next_seconds = map(int, dialog[i+1]["time"].split(":"))
-                    end_ms = (next_minutes * 60 + next_seconds) * 1000
-                else:
-                    end_ms = start_ms + 5000
-
-                # speaker label: 1 for Agent, 2 for Customer
-                speaker = 1 if entry["text"].startswith("Agent:") else 2
-
-                transcript_data.append({
-                    "text": entry["text"],
-                    "start": start_ms,
-                    "end": end_ms,
-                    "speaker": speaker
-                })
-
-            # Simple SRT/VTT (just an example for the first line)
-            if len(dialog) > 1:
-                _, next_seconds = map(int, dialog[1]["time"].split(":"))
-            else:
-                next_seconds = 5
-            srt_content = (
-                f"1\n00:00:00,000 --> 00:00:{next_seconds:02d},000\n{dialog[0]['text']}"
-            )
-            vtt_content = (
-                f"WEBVTT\n\n00:00:00.000 --> 00:00:{next_seconds:02d}.000\n{dialog[0]['text']}"
-            )
+            # Index the transcript once so /transcripts/{id}/search only embeds queries
+            if data["transcript_id"] not in transcript_indexes:
+                await run_blocking(transcript_indexes.add, data["transcript_id"], data["transcript"])
 
-            return JSONResponse({
-                "success": True,
-                "transcript": transcript_data,
-                "srt": srt_content,
-                "vtt": vtt_content
-            })
+            headers = {"ETag": etag, "Cache-Control": f"public, max-age={EXAMPLES_MAX_AGE}"}
+            if request.headers.get("if-none-match") == etag:
+                return Response(status_code=304, headers=headers)
+            return Response(content=body, media_type="application/json", headers=headers)
         except Exception as e:
             return JSONResponse(status_code=500, content={"success": False, "error": str(e)})
 
@@ -167,86 +534,214 @@ def create_app() -> FastAPI:
     async def upload_video(file: UploadFile = File(...),
                            speakers_expected: int = Form(0)):
         """
-        Upload an audio/video file and send it to AssemblyAI for transcription,
-        returning transcripts and SRT/VTT subtitles.
+        Upload an audio/video file and queue it for transcription. Returns a
+        job id right away; poll /jobs/{job_id} for the transcript and SRT/VTT subtitles.
         """
-        import shutil
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        # A unique name per upload, so concurrent uploads of the same file don't collide
+        fd, file_path = tempfile.mkstemp(dir=UPLOAD_DIR, suffix=os.path.splitext(file.filename or "")[1])
         try:
-            os.makedirs("uploads", exist_ok=True)
-            file_path = f"uploads/{file.filename}"
-
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-
-            # assemblyai config
-            config = aai.TranscriptionConfig(speaker_labels=True)
-            if speakers_expected and speakers_expected > 0:
-                config.speakers_expected = speakers_expected
-
-            # transcribe using AssemblyAI
-            transcript_obj = aai.Transcriber().transcribe(file_path, config)
-            if not transcript_obj or not transcript_obj.utterances:
-                raise ValueError("未检测到语音或文件音频不清晰")
-
-            formatted_utterances = [
-                {
-                    "text": u.text,
-                    "start": u.start,
-                    "end": u.end,
-                    "speaker": u.speaker
-                }
-                for u in transcript_obj.utterances
-            ]
-
-            srt_content = transcript_obj.export_subtitles_srt() or ""
-            vtt_content = transcript_obj.export_subtitles_vtt() or ""
-
-            # clean up
+            # Stream the upload to disk in chunks instead of buffering it
+            with os.fdopen(fd, "wb") as buffer:
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    await run_in_threadpool(buffer.write, chunk)
+            job = transcription_jobs.submit(file_path, file.filename or "", speakers_expected)
+        except QueueFullError as e:
             os.remove(file_path)
-
-            return JSONResponse({
-                "success": True,
-                "transcript": formatted_utterances,
-                "srt": srt_content,
-                "vtt": vtt_content
-            })
-        except ValueError as ve:
-            return JSONResponse(status_code=400, content={"success": False, "error": str(ve)})
+            return JSONResponse(status_code=429, content={"success": False, "error": str(e)})
         except Exception as e:
-            error_msg = "处理文件失败，请确认文件包含可识别的语音。"
-            if "Unable to create captions" in str(e):
-                error_msg = "未检测到语音，请确认音频内容清晰。"
-            print(f"Error in upload_video: {str(e)}")
-            return JSONResponse(status_code=500, content={"success": False, "error": error_msg})
+            logger.exception("Error in upload_video: %s", e)
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            return JSONResponse(status_code=500, content={"success": False, "error": GENERIC_ERROR})
+
+        return JSONResponse(status_code=202, content={"success": True, **job.to_dict()})
+
+    @app.get("/jobs/{job_id}")
+    async def get_job(job_id: str):
+        """
+        Report a transcription job's status, with its transcript and subtitles once done.
+        """
+        job = transcription_jobs.get(job_id)
+        if job is None:
+            return JSONResponse(status_code=404, content={"success": False, "error": "Job not found"})
+        return {"success": job.status != "failed", **job.to_dict()}
 
     @app.post("/search")
     async def search(request: Request):
         """
         Perform semantic search on a user-provided text, returning the top matches.
+        Without a text, searches the default index. An optional "mode" ('vector',
+        'lexical' or 'hybrid') overrides SEARCH_MODE for this search, and an
+        optional "filter" (title, min_section_id, max_section_id, start_idx,
+        end_idx) restricts it to matching sections.
         """
         data = await request.json()
         query = data.get("query", "")
         text = data.get("text", "")
 
         try:
-            if not terms_engine.index:
-                # Build or process new text on-the-fly
-                terms_engine.process_text(text)
+            # Each distinct text is indexed once and reused by later requests
+            engine = await run_blocking(document_indexes.get, text) if text else terms_engine
+            if not engine.index:
+                raise ValueError("No sections to search")
+
+            matches = await engine.asearch(
+                query,
+                k=5,
+                nprobe=data.get("nprobe"),
+                ef_search=data.get("ef_search"),
+                mode=data.get("mode"),
+                filters=SectionFilter.from_dict(data.get("filter"))
+            )
+            return {"success": True, "matches": [format_match(m) for m in matches]}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
 
-            matches = terms_engine.search(query, k=5)
+    @app.post("/transcripts/{transcript_id}/search")
+    async def search_transcript(transcript_id: str, request: Request):
+        """
+        Search an indexed transcript (from /upload or /convert-example). Matches
+        carry the utterance's start/end milliseconds and speaker.
+        """
+        engine = await find_transcript_engine(transcript_id)
+        if engine is None:
+            return JSONResponse(status_code=404, content={"success": False, "error": "Transcript not found"})
+
+        data = await request.json()
+        try:
+            k = parse_k(data.get("k"))
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"success": False, "error": str(e)})
+        try:
+            if not engine.index:
+                raise ValueError("No sections to search")
+            matches = await engine.asearch(
+                data.get("query", ""),
+                k=k,
+                mode=data.get("mode"),
+                filters=SectionFilter.from_dict(data.get("filter"))
+            )
             return {
                 "success": True,
                 "matches": [
-                    {
-                        "text": m["content"],
-                        "score": m["similarity"],
-                        "start_idx": m["start_idx"],
-                        "end_idx": m["end_idx"]
-                    }
+                    {**format_match(m), "start": m["start_ms"], "end": m["end_ms"], "speaker": m["speaker"]}
                     for m in matches
                 ]
             }
         except Exception as e:
             return {"success": False, "error": str(e)}
 
+    @app.post("/search/batch")
+    async def search_batch(request: Request):
+        """
+        Run several queries against one text (or the default index) in a single call.
+        All queries are embedded together; results come back in request order.
+        """
+        data = await request.json()
+        queries = data.get("queries", [])
+        text = data.get("text", "")
+
+        if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+            return JSONResponse(status_code=400, content={"success": False, "error": "queries must be a list of strings"})
+        if len(queries) > SEARCH_BATCH_MAX_QUERIES:
+            return JSONResponse(status_code=400, content={
+                "success": False,
+                "error": f"At most {SEARCH_BATCH_MAX_QUERIES} queries per batch"
+            })
+        try:
+            k = parse_k(data.get("k"))
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"success": False, "error": str(e)})
+
+        try:
+            engine = await run_blocking(document_indexes.get, text) if text else terms_engine
+            if not engine.index:
+                raise ValueError("No sections to search")
+
+            results = await engine.asearch_many(
+                queries,
+                k=k,
+                nprobe=data.get("nprobe"),
+                ef_search=data.get("ef_search"),
+                mode=data.get("mode"),
+                filters=SectionFilter.from_dict(data.get("filter"))
+            )
+            return {
+                "success": True,
+                "results": [
+                    {"query": query, "matches": [format_match(m) for m in matches]}
+                    for query, matches in zip(queries, results)
+                ]
+            }
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    @app.post("/sections")
+    async def add_sections(request: Request):
+        """
+        Append text to the default index, embedding only the new sections.
+        """
+        if INDEX_READ_ONLY:
+            return read_only_response()
+        data = await request.json()
+        text = data.get("text", "")
+        if not text.strip():
+            return JSONResponse(status_code=400, content={"success": False, "error": "text is required"})
+
+        try:
+            added = await run_blocking(terms_engine.add_text, text, title=data.get("title"))
+            return {
+                "success": True,
+                "sections": [
+                    {"section_id": s.section_id, "title": s.title, "start_idx": s.start_idx, "end_idx": s.end_idx}
+                    for s in added
+                ]
+            }
+        except Exception as e:
+            return JSONResponse(status_code=500, content={"success": False, "error": str(e)})
+
+    @app.put("/sections/{section_id}")
+    async def update_section(section_id: int, request: Request):
+        """
+        Replace the content of one section of the default index and re-embed only that section.
+        """
+        if INDEX_READ_ONLY:
+            return read_only_response()
+        data = await request.json()
+        content = data.get("content", "")
+        if not content.strip():
+            return JSONResponse(status_code=400, content={"success": False, "error": "content is required"})
+        if section_id not in terms_engine.sections:
+            return JSONResponse(status_code=404, content={"success": False, "error": "Section not found"})
+
+        try:
+            section = await run_blocking(terms_engine.update_section, section_id, content, title=data.get("title"))
+            return {
+                "success": True,
+                "section": {
+                    "section_id": section.section_id,
+                    "title": section.title,
+                    "start_idx": section.start_idx,
+                    "end_idx": section.end_idx
+                }
+            }
+        except Exception as e:
+            return JSONResponse(status_code=500, content={"success": False, "error": str(e)})
+
+    @app.delete("/sections")
+    async def remove_sections(request: Request):
+        """
+        Remove sections (by id) and their vectors from the default index.
+        """
+        if INDEX_READ_ONLY:
+            return read_only_response()
+        data = await request.json()
+        section_ids = data.get("section_ids", [])
+        try:
+            removed = await run_blocking(terms_engine.remove_sections, [int(sid) for sid in section_ids])
+            return {"success": True, "removed": removed}
+        except Exception as e:
+            return JSONResponse(status_code=500, content={"success": False, "error": str(e)})
+
     return app
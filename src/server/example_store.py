@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class ExampleStore:
+    """
+    Example dialogs from output.json, loaded once and kept by example id.
+
+    Each example's transcript/SRT/VTT conversion is computed on first use and
+    memoized as a ready-to-send JSON body with an ETag. The file is reloaded
+    (dropping memoized conversions) when its modification time changes,
+    checked at most once every `check_interval` seconds.
+    """
+    def __init__(self, path: str, check_interval: float = 1.0):
+        """
+        Args:
+            path: JSON file holding a list of examples
+            check_interval: Minimum seconds between checks of the file's mtime
+        """
+        self.path = path
+        self.check_interval = check_interval
+        # Bumped on every reload; part of every ETag
+        self.version = 0
+
+        self._examples: Dict[str, Dict] = {}
+        self._summaries: List[Dict] = []
+        self._conversions: Dict[str, Tuple[Dict, bytes, str]] = {}
+        self._mtime: Optional[int] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def summaries(self) -> List[Dict]:
+        """
+        Return {"id", "name"} for every example, in file order.
+        """
+        self._refresh()
+        return self._summaries
+
+    def conversion(self, example_id: str) -> Optional[Tuple[Dict, bytes, str]]:
+        """
+        Return an example's conversion (see convert), the JSON body of its
+        /convert-example response and that body's ETag, or None if there is
+        no such example.
+        """
+        self._refresh()
+        converted = self._conversions.get(example_id)
+        if converted is not None:
+            return converted
+
+        example = self._examples.get(example_id)
+        if example is None:
+            return None
+        data = self.convert(example_id, example)
+        body = json.dumps({"success": True, **data}).encode("utf-8")
+        etag = f'"{self.version}-{hashlib.sha1(body).hexdigest()}"'
+        with self._lock:
+            # Don't memoize a conversion of data replaced by a reload meanwhile
+            if self._examples.get(example_id) is example:
+                self._conversions[example_id] = (data, body, etag)
+        return data, body, etag
+
+    @staticmethod
+    def convert(example_id: str, example: Dict) -> Dict:
+        """
+        Convert an example's dialog into transcript format (start/end in ms and
+        speaker per utterance), with an SRT and VTT cue for the first line.
+        """
+        dialog = example["dialog"]
+        starts = []
+        for entry in dialog:
+            minutes, seconds = map(int, entry["time"].split(":"))
+            starts.append((minutes * 60 + seconds) * 1000)
+
+        transcript_data = []
+        for i, entry in enumerate(dialog):
+            # end time is the next entry's start, or +5s for the last one
+            end_ms = starts[i + 1] if i < len(dialog) - 1 else starts[i] + 5000
+            transcript_data.append({
+                "text": entry["text"],
+                "start": starts[i],
+                "end": end_ms,
+                # speaker label: 1 for Agent, 2 for Customer
+                "speaker": 1 if entry["text"].startswith("Agent:") else 2
+            })
+
+        # Simple SRT/VTT (just an example for the first line)
+        next_seconds = (starts[1] // 1000) % 60 if len(dialog) > 1 else 5
+        srt_content = (
+            f"1\n00:00:00,000 --> 00:00:{next_seconds:02d},000\n{dialog[0]['text']}"
+        )
+        vtt_content = (
+            f"WEBVTT\n\n00:00:00.000 --> 00:00:{next_seconds:02d}.000\n{dialog[0]['text']}"
+        )
+        return {
+            "transcript_id": f"example-{example_id}",
+            "transcript": transcript_data,
+            "srt": srt_content,
+            "vtt": vtt_content
+        }
+
+    def _refresh(self) -> None:
+        """
+        Load the file on first use, and reload it if its mtime changed. If a
+        reload fails (e.g. the file is mid-write), the loaded examples are kept.
+
+        Raises:
+            OSError, ValueError, KeyError: If the file is missing or invalid on first load
+        """
+        now = time.monotonic()
+        if self._mtime is not None and now - self._checked_at < self.check_interval:
+            return
+
+        with self._lock:
+            self._checked_at = now
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+                if mtime == self._mtime:
+                    return
+                with open(self.path, "r", encoding="utf-8") as f:
+                    all_examples = json.load(f)
+                examples = {str(example["example_id"]): example for example in all_examples}
+                summaries = [
+                    {
+                        "id": example_id,
+                        "name": f"{example['product_info']['name']} - {example['product_info']['policy_number']}"
+                    }
+                    for example_id, example in examples.items()
+                ]
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                if self._mtime is None:
+                    raise
+                logger.warning("Could not reload %s, keeping loaded examples: %s", self.path, e)
+                return
+
+            self._examples = examples
+            self._summaries = summaries
+            self._conversions = {}
+            self._mtime = mtime
+            self.version += 1
@@ -0,0 +1,37 @@
+import assemblyai as aai
+
+from .base import TranscriberBase, Transcript
+
+class AssemblyAITranscriber(TranscriberBase):
+    """
+    Transcribes files with the AssemblyAI API, with speaker labels.
+    """
+    def __init__(self, api_key: str):
+        aai.settings.api_key = api_key
+
+    def transcribe(self, path: str, speakers_expected: int = 0) -> Transcript:
+        config = aai.TranscriptionConfig(speaker_labels=True)
+        if speakers_expected and speakers_expected > 0:
+            config.speakers_expected = speakers_expected
+
+        transcript_obj = aai.Transcriber().transcribe(path, config)
+        if not transcript_obj or not transcript_obj.utterances:
+            raise ValueError("未检测到语音或文件音频不清晰")
+
+        utterances = [
+            {
+                "text": u.text,
+                "start": u.start,
+                "end": u.end,
+                "speaker": u.speaker
+            }
+            for u in transcript_obj.utterances
+        ]
+        try:
+            srt_content = transcript_obj.export_subtitles_srt() or ""
+            vtt_content = transcript_obj.export_subtitles_vtt() or ""
+        except Exception as e:
+            if "Unable to create captions" in str(e):
+                raise ValueError("未检测到语音，请确认音频内容清晰。") from e
+            raise
+        return Transcript(utterances=utterances, srt=srt_content, vtt=vtt_content)
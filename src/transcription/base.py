@@ -0,0 +1,53 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+@dataclass
+class Transcript:
+    """
+    A finished transcription: utterances with millisecond timestamps and
+    speaker labels, plus the same content as SRT and VTT subtitles.
+    """
+    utterances: List[Dict] = field(default_factory=list)
+    srt: str = ""
+    vtt: str = ""
+
+class TranscriberBase(ABC):
+    """
+    Abstract base class for transcription providers.
+    """
+    @abstractmethod
+    def transcribe(self, path: str, speakers_expected: int = 0) -> Transcript:
+        """
+        Transcribe the audio/video file at `path`. Blocking.
+
+        Args:
+            path: File to transcribe
+            speakers_expected: Expected number of speakers (0 lets the provider decide)
+
+        Raises:
+            ValueError: With a user-facing message if no speech could be transcribed
+        """
+        pass
+
+def _timestamp(ms: int, separator: str) -> str:
+    hours, rest = divmod(int(ms), 3_600_000)
+    minutes, rest = divmod(rest, 60_000)
+    seconds, millis = divmod(rest, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{millis:03d}"
+
+def to_srt(utterances: List[Dict]) -> str:
+    """
+    Format utterances (text, start, end in ms) as SRT subtitles.
+    """
+    return "\n\n".join(
+        f"{i}\n{_timestamp(u['start'], ',')} --> {_timestamp(u['end'], ',')}\n{u['text']}"
+        for i, u in enumerate(utterances, start=1)
+    )
+
+def to_vtt(utterances: List[Dict]) -> str:
+    """
+    Format utterances (text, start, end in ms) as WebVTT subtitles.
+    """
+    cues = [f"{_timestamp(u['start'], '.')} --> {_timestamp(u['end'], '.')}\n{u['text']}" for u in utterances]
+    return "\n\n".join(["WEBVTT"] + cues)
@@ -0,0 +1,54 @@
+import os
+import time
+from typing import List
+
+from .base import TranscriberBase, Transcript, to_srt, to_vtt
+
+class FakeTranscriber(TranscriberBase):
+    """
+    Local stand-in transcriber for testing, needing no API key or network.
+
+    A UTF-8 text file is "transcribed" one non-empty line per utterance;
+    any other file yields one placeholder utterance per `chunk_bytes` of data.
+    Speakers alternate between A and B (or cycle through `speakers_expected`).
+    """
+    def __init__(self, delay: float = 0.0, utterance_ms: int = 5000, chunk_bytes: int = 64 * 1024):
+        """
+        Args:
+            delay: Seconds to sleep per transcription, to simulate a slow provider
+            utterance_ms: Duration of each utterance
+            chunk_bytes: Bytes of binary input per placeholder utterance
+        """
+        self.delay = delay
+        self.utterance_ms = utterance_ms
+        self.chunk_bytes = chunk_bytes
+
+    def transcribe(self, path: str, speakers_expected: int = 0) -> Transcript:
+        if self.delay:
+            time.sleep(self.delay)
+
+        lines = self._lines(path)
+        if not lines:
+            raise ValueError("未检测到语音或文件音频不清晰")
+
+        speakers = [chr(ord("A") + i) for i in range(max(2, speakers_expected))]
+        utterances = [
+            {
+                "text": text,
+                "start": i * self.utterance_ms,
+                "end": (i + 1) * self.utterance_ms,
+                "speaker": speakers[i % len(speakers)]
+            }
+            for i, text in enumerate(lines)
+        ]
+        return Transcript(utterances=utterances, srt=to_srt(utterances), vtt=to_vtt(utterances))
+
+    def _lines(self, path: str) -> List[str]:
+        with open(path, "rb") as f:
+            data = f.read()
+        try:
+            return [line.strip() for line in data.decode("utf-8").splitlines() if line.strip()]
+        except UnicodeDecodeError:
+            chunks = -(-len(data) // self.chunk_bytes)
+            name = os.path.basename(path)
+            return [f"Utterance {i + 1} of {name}" for i in range(chunks)]
@@ -0,0 +1,253 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+from observability.metrics import TRANSCRIPTION_JOBS, TRANSCRIPTION_QUEUE_DEPTH, TRANSCRIPTION_RUNNING, time_stage
+from .base import TranscriberBase, Transcript
+
+logger = logging.getLogger(__name__)
+
+# Shown when a transcription fails for a reason other than missing speech
+GENERIC_ERROR = "处理文件失败，请确认文件包含可识别的语音。"
+
+class QueueFullError(Exception):
+    """
+    Raised when a job is submitted while the queue is at capacity.
+    """
+
+@dataclass
+class TranscriptionJob:
+    """
+    One transcription request and its outcome.
+    status is "queued", "running", "done" or "failed".
+    """
+    job_id: str
+    filename: str
+    status: str = "queued"
+    created_at: float = 0.0
+    finished_at: Optional[float] = None
+    result: Optional[Transcript] = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict:
+        data = {"job_id": self.job_id, "filename": self.filename, "status": self.status}
+        if self.result is not None:
+            data.update(transcript_id=self.job_id, transcript=self.result.utterances,
+                        srt=self.result.srt, vtt=self.result.vtt)
+        if self.error is not None:
+            data["error"] = self.error
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "TranscriptionJob":
+        result = None
+        if "transcript" in data:
+            result = Transcript(utterances=data["transcript"], srt=data.get("srt", ""), vtt=data.get("vtt", ""))
+        return cls(
+            job_id=data["job_id"],
+            filename=data["filename"],
+            status=data["status"],
+            created_at=data.get("created_at", 0.0),
+            finished_at=data.get("finished_at"),
+            result=result,
+            error=data.get("error")
+        )
+
+class TranscriptionJobs:
+    """
+    Runs transcriptions in the background on a bounded worker pool.
+
+    At most `max_workers` transcriptions run at once and at most `max_queued`
+    more wait for a worker; further submissions raise QueueFullError. Uploaded
+    files are deleted once their job finishes, and finished jobs are forgotten
+    after `ttl` seconds.
+
+    With a `state_dir`, every status change is also written there, so other
+    server processes sharing the directory can report jobs they did not run.
+    """
+    def __init__(self,
+                 transcriber: TranscriberBase,
+                 max_workers: int = 2,
+                 max_queued: int = 16,
+                 ttl: float = 3600.0,
+                 on_transcribed: Optional[Callable[[str, Transcript], None]] = None,
+                 state_dir: Optional[str] = None):
+        """
+        Args:
+            transcriber: Provider doing the actual transcription
+            max_workers: Maximum number of transcriptions running at once
+            max_queued: Maximum number of jobs waiting for a worker
+            ttl: Seconds finished jobs (and their transcripts) are kept
+            on_transcribed: Called with the job id and transcript on the worker
+                            thread before the job is reported done (e.g. to index it)
+            state_dir: Directory to share job state through (None keeps it in memory only)
+        """
+        self.transcriber = transcriber
+        self.on_transcribed = on_transcribed
+        self.state_dir = state_dir
+        self.max_workers = max(1, max_workers)
+        self.max_queued = max(0, max_queued)
+        self.ttl = ttl
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="transcribe")
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+            self._remove_stale_files()
+
+        self._jobs: Dict[str, TranscriptionJob] = {}
+        self._queued = 0
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def submit(self, path: str, filename: str, speakers_expected: int = 0) -> TranscriptionJob:
+        """
+        Queue the file at `path` for transcription. The job takes ownership of
+        the file and deletes it when done.
+
+        Raises:
+            QueueFullError: If the queue is at capacity (the file is left in place)
+            RuntimeError: If the worker pool is shut down (the job is marked
+                          failed and the file deleted)
+        """
+        with self._lock:
+            self._prune()
+            if self._queued + self._running >= self.max_workers + self.max_queued:
+                TRANSCRIPTION_JOBS.labels(status="rejected").inc()
+                raise QueueFullError("Too many transcriptions in progress, try again later")
+            job = TranscriptionJob(job_id=uuid.uuid4().hex, filename=filename, created_at=time.time())
+            self._jobs[job.job_id] = job
+            self._queued += 1
+            TRANSCRIPTION_QUEUE_DEPTH.set(self._queued)
+        self._save(job)
+
+        try:
+            self.executor.submit(self._run, job, path, speakers_expected)
+        except Exception as e:
+            # E.g. the executor was shut down: give the slot back and fail the job
+            logger.error("Could not start transcription job %s: %s", job.job_id, e)
+            with self._lock:
+                self._queued -= 1
+                job.status = "failed"
+                job.error = GENERIC_ERROR
+                job.finished_at = time.time()
+                TRANSCRIPTION_QUEUE_DEPTH.set(self._queued)
+            self._save(job)
+            TRANSCRIPTION_JOBS.labels(status="failed").inc()
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            raise
+        return job
+
+    def get(self, job_id: str) -> Optional[TranscriptionJob]:
+        """
+        Return a job run by this process, or one found in `state_dir`.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None or not self.state_dir:
+            return job
+
+        # Job ids are hex uuids; never let one address a path outside state_dir
+        if not all(c in "0123456789abcdef" for c in job_id):
+            return None
+        try:
+            with open(os.path.join(self.state_dir, f"{job_id}.json"), "r", encoding="utf-8") as f:
+                return TranscriptionJob.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"queued": self._queued, "running": self._running, "jobs": len(self._jobs)}
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job: TranscriptionJob, path: str, speakers_expected: int) -> None:
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            job.status = "running"
+            TRANSCRIPTION_QUEUE_DEPTH.set(self._queued)
+            TRANSCRIPTION_RUNNING.set(self._running)
+        self._save(job)
+
+        result, error = None, None
+        try:
+            with time_stage("transcribe"):
+                result = self.transcriber.transcribe(path, speakers_expected)
+            if self.on_transcribed is not None:
+                try:
+                    self.on_transcribed(job.job_id, result)
+                except Exception as e:
+                    # The transcript itself is still usable
+                    logger.exception("Post-processing of job %s failed: %s", job.job_id, e)
+        except ValueError as e:
+            error = str(e)
+        except Exception as e:
+            logger.exception("Transcription job %s failed: %s", job.job_id, e)
+            error = GENERIC_ERROR
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+        with self._lock:
+            self._running -= 1
+            job.result, job.error = result, error
+            job.status = "done" if error is None else "failed"
+            job.finished_at = time.time()
+            TRANSCRIPTION_RUNNING.set(self._running)
+        self._save(job)
+        TRANSCRIPTION_JOBS.labels(status=job.status).inc()
+
+    def _save(self, job: TranscriptionJob) -> None:
+        """
+        Write a job's current state to `state_dir`, atomically.
+        """
+        if not self.state_dir:
+            return
+        path = os.path.join(self.state_dir, f"{job.job_id}.json")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({**job.to_dict(), "created_at": job.created_at, "finished_at": job.finished_at}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Could not save state of job %s: %s", job.job_id, e)
+
+    def _remove_stale_files(self) -> None:
+        """
+        Delete job files left in `state_dir` for longer than the TTL (e.g. by
+        a process that has since exited).
+        """
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.state_dir):
+            path = os.path.join(self.state_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def _prune(self) -> None:
+        """
+        Forget finished jobs older than the TTL. Caller holds the lock.
+        """
+        cutoff = time.time() - self.ttl
+        expired = [jid for jid, job in self._jobs.items() if job.finished_at is not None and job.finished_at < cutoff]
+        for jid in expired:
+            del self._jobs[jid]
+            if self.state_dir:
+                try:
+                    os.remove(os.path.join(self.state_dir, f"{jid}.json"))
+                except OSError:
+                    pass
@@ -340,7 +340,12 @@ document.addEventListener('DOMContentLoaded', () => {
                 method: 'POST',
                 body: formData
             });
-            const data = await res.json();
+            const job = await res.json();
+            if (!job.success) {
+                throw new Error(job.error || "Failed to process file");
+            }
+            // Transcription runs in the background; poll the job until it finishes
+            const data = await waitForJob(job.job_id);
             if (data.success) {
                 currentTranscript = data;
                 displayTranscript(data.transcript);
@@ -367,6 +372,17 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    async function waitForJob(jobId, intervalMs = 1000) {
+        while (true) {
+            const res = await fetch(`/jobs/${jobId}`);
+            const data = await res.json();
+            if (!res.ok || data.status === 'done' || data.status === 'failed') {
+                return data;
+            }
+            await new Promise(resolve => setTimeout(resolve, intervalMs));
+        }
+    }
+
     // -------------  Function: Setup Media Player  -------------
     function setupMediaPlayer(file) {
         const isVideo = file.type.startsWith('video/');
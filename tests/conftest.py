@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The packages live under src/, as when the server runs from there
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
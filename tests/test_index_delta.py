@@ -0,0 +1,202 @@
+import os
+import random
+
+import faiss
+import numpy as np
+import pytest
+
+import search.index_delta as index_delta
+import search.terms_search_engine as terms_search_engine
+from embeddings.fake import FakeEmbeddings
+from search.index_delta import IndexDelta, merge_results
+from search.section_filter import SectionFilter
+from search.section_store import INDEX_FILE, SectionStore, SpanShift, current_version_dir
+from search.term_section import TermSection
+from search.terms_search_engine import TermsSearchEngine
+
+DIMENSION = 32
+WORDS = "alpha beta gamma delta epsilon zeta eta theta iota kappa lambda mu".split()
+QUERIES = ["alpha beta", "gamma delta theta", "kappa mu", "update 3 zeta", "added 7 iota"]
+# Each filter with the sections it selects
+FILTERS = [
+    (SectionFilter(title="T2"), lambda s: s.title == "T2"),
+    (SectionFilter(min_section_id=20, max_section_id=180), lambda s: 20 <= s.section_id <= 180),
+    (SectionFilter(min_section_id=40, max_section_id=45), lambda s: 40 <= s.section_id <= 45),
+]
+
+def words(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+def make_engine(cache_dir: str, index_type: str = "flat") -> TermsSearchEngine:
+    # filter_exact_max=0 sends filtered searches through the index's ID selector where it has one
+    return TermsSearchEngine(cache_dir=cache_dir, embedding_model=FakeEmbeddings(DIMENSION), index_type=index_type,
+                             embedding_cache=False, query_cache_size=0, filter_exact_max=0)
+
+def build(tmp_path, index_type: str = "flat", sections: int = 200) -> TermsSearchEngine:
+    rng = random.Random(0)
+    path = tmp_path / "doc.md"
+    path.write_text("".join(f"**T{i % 5}**\n{words(rng, 10)} w{i}\n" for i in range(sections)))
+    engine = make_engine(str(tmp_path / "cache"), index_type)
+    engine.build_index(str(path))
+    return engine
+
+def edit(engine: TermsSearchEngine, steps: int = 40) -> None:
+    """
+    A seeded mix of appends, updates and removals.
+    """
+    rng = random.Random(1)
+    for step in range(steps):
+        ids = list(engine.sections)
+        choice = rng.random()
+        if choice < 0.4:
+            engine.update_section(rng.choice(ids), f"update {step} {words(rng, 6)}")
+        elif choice < 0.7:
+            engine.add_text(f"**T{step % 5}**\nadded {step} {words(rng, 8)}")
+        else:
+            engine.remove_sections(rng.sample(ids, 3))
+
+def rebuilt_search(engine: TermsSearchEngine, query: str, k: int, selected=lambda s: True) -> list:
+    """
+    The ids a flat index freshly built over the engine's current (selected) sections returns.
+    """
+    sections = [s for s in engine.sections.values() if selected(s)]
+    index = faiss.IndexIDMap2(faiss.IndexFlatIP(DIMENSION))
+    vectors = engine.embedding_model.encode([s.content for s in sections])
+    faiss.normalize_L2(vectors)
+    index.add_with_ids(vectors, np.array([s.section_id for s in sections], dtype=np.int64))
+    query_vector = engine.embedding_model.encode([query])
+    faiss.normalize_L2(query_vector)
+    _, ids = index.search(query_vector, k)
+    return [int(i) for i in ids[0] if i >= 0]
+
+def assert_matches_rebuild(engine: TermsSearchEngine, k: int = 5) -> None:
+    for query in QUERIES:
+        found = [m["section_id"] for m in engine.search(query, k=k, mode="vector")]
+        assert found == rebuilt_search(engine, query, k), query
+        for section_filter, selected in FILTERS:
+            found = [m["section_id"] for m in engine.search(query, k=k, mode="vector", filters=section_filter)]
+            assert found == rebuilt_search(engine, query, k, selected), (query, section_filter)
+
+@pytest.fixture
+def compact_often(monkeypatch):
+    monkeypatch.setattr(index_delta, "COMPACT_MIN_CHANGES", 8)
+    monkeypatch.setattr(index_delta, "COMPACT_FRACTION", 0.0)
+
+@pytest.fixture
+def no_id_selectors(monkeypatch):
+    """
+    Act like a FAISS build whose indexes cannot skip ids during a search.
+    """
+    monkeypatch.setattr(index_delta, "filtered_search_params", lambda *args, **kwargs: None)
+    monkeypatch.setattr(terms_search_engine, "filtered_search_params", lambda *args, **kwargs: None)
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw"])
+def test_edits_match_full_rebuild(tmp_path, index_type):
+    engine = build(tmp_path, index_type)
+    edit(engine)
+    assert len(engine._snapshot.delta) > 0
+    assert_matches_rebuild(engine)
+
+def test_edits_match_full_rebuild_after_compaction(tmp_path, compact_often):
+    engine = build(tmp_path)
+    edit(engine)
+    assert len(engine._snapshot.delta) < 8
+    delta = engine._snapshot.delta
+    # The main index holds every current section the delta does not, plus the stale ones
+    assert engine.index.ntotal == len(set(engine.sections) - set(delta.ids.tolist())) + len(delta.stale)
+    assert_matches_rebuild(engine)
+
+def test_edits_match_full_rebuild_without_id_selectors(tmp_path, no_id_selectors):
+    engine = build(tmp_path)
+    edit(engine)
+    assert len(engine._snapshot.delta.stale) > 5
+    assert_matches_rebuild(engine)
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_edits_survive_save_and_load(tmp_path, monkeypatch, compact):
+    if compact:
+        monkeypatch.setattr(index_delta, "COMPACT_MIN_CHANGES", 8)
+        monkeypatch.setattr(index_delta, "COMPACT_FRACTION", 0.0)
+    engine = build(tmp_path)
+    edit(engine)
+
+    loaded = make_engine(str(tmp_path / "cache"))
+    assert loaded.load_state()
+    assert list(loaded.sections.values()) == list(engine.sections.values())
+    assert len(loaded._snapshot.delta) == len(engine._snapshot.delta)
+    assert_matches_rebuild(loaded)
+
+def test_unchanged_index_is_linked_not_rewritten(tmp_path):
+    engine = build(tmp_path)
+    first = current_version_dir(engine._state_root)
+    engine.update_section(3, "one small edit")
+    second = current_version_dir(engine._state_root)
+    assert first != second
+    assert os.path.samefile(os.path.join(first, INDEX_FILE), os.path.join(second, INDEX_FILE))
+
+def test_update_shifts_later_offsets(tmp_path):
+    engine = make_engine(str(tmp_path / "cache"))
+    engine.process_text("**A**\nfirst section\n**B**\nsecond section\n**C**\nthird section")
+    before = dict(engine.sections)
+    updated = engine.update_section(0, "a much longer first section")
+    shift = len(updated.content) - len(before[0].content)
+    for section_id, old in before.items():
+        new = engine.sections[section_id]
+        expected = old.start_idx + (shift if section_id > 0 else 0)
+        assert new.start_idx == expected
+        assert engine.original_text[new.start_idx:new.end_idx] == new.content
+
+def test_delta_search_drops_stale_ids_by_overfetching(no_id_selectors):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((50, 8)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    main = faiss.IndexIDMap2(faiss.IndexFlatIP(8))
+    main.add_with_ids(vectors, np.arange(50))
+    query = vectors[:3].copy()
+
+    delta = IndexDelta.empty(8).changed(removed=[0, 1])
+    distances, ids = delta.search(main, query, 5)
+    assert not np.isin(ids, [0, 1]).any()
+    expected = [i for i in main.search(query, 7)[1][0] if i not in (0, 1)][:5]
+    assert ids[0].tolist() == expected
+    assert np.all(np.diff(distances, axis=1) <= 0)
+
+def test_merge_results_pads_and_orders():
+    distances, ids = merge_results(
+        np.array([[0.9, 0.2]], dtype=np.float32), np.array([[4, -1]]),
+        np.array([[0.5]], dtype=np.float32), np.array([[7]]),
+        4
+    )
+    assert ids.tolist() == [[4, 7, -1, -1]]
+    assert distances[0, :2].tolist() == pytest.approx([0.9, 0.5])
+
+def section(section_id: int, content: str, start: int, document_id=None) -> TermSection:
+    return TermSection(section_id=section_id, content=content, title=f"T{section_id % 2}", start_idx=start,
+                       end_idx=start + len(content), start_byte=start, end_byte=start + len(content),
+                       document_id=document_id)
+
+def test_store_splice_matches_store_built_from_scratch():
+    rng = random.Random(2)
+    sections = {i: section(i, words(rng, 3), i * 100, "a" if i < 30 else "b") for i in range(0, 60, 2)}
+    store = SectionStore.from_sections(sections[i] for i in sorted(sections))
+    for step in range(50):
+        ids = list(sections)
+        if step % 3 == 0:
+            upserts = [section(i, words(rng, 2), i * 100, "a") for i in rng.sample(range(60, 200), 3)]
+            removed = []
+        elif step % 3 == 1:
+            upserts = [section(rng.choice(ids), f"new {step}", 0, "b")]
+            removed = rng.sample(ids, 2)
+        else:
+            upserts, removed = [], rng.sample(ids, 1) + [9999]
+        for sid in removed:
+            sections.pop(sid, None)
+        for sec in upserts:
+            sections[sec.section_id] = sec
+        store = store.with_changes(upserts=upserts, removed=removed)
+        assert list(store.values()) == [sections[i] for i in sorted(sections)]
+
+def test_store_shift_moves_only_later_sections_of_the_document():
+    store = SectionStore.from_sections([section(0, "aa", 0, "a"), section(1, "bb", 10, "a"), section(2, "cc", 5, "b")])
+    shifted = store.with_changes(shift=SpanShift("a", 0, 3, 4))
+    assert [(s.start_idx, s.start_byte) for s in shifted.values()] == [(0, 0), (13, 14), (5, 5)]
@@ -0,0 +1,70 @@
+import random
+
+import numpy as np
+import pytest
+
+from search.lexical_index import LexicalIndex
+from search.term_section import TermSection
+
+WORDS = [f"t{i}" for i in range(60)]
+QUERIES = ["t1 t2", "t5", "a b t7 t59", "unknown"]
+
+def section(rng: random.Random, section_id: int, title: str = "A") -> TermSection:
+    content = " ".join(rng.choice(WORDS) for _ in range(rng.randint(0, 9)))
+    return TermSection(section_id=section_id, content=content, title=title, start_idx=0, end_idx=len(content))
+
+def assert_same_ranking(index: LexicalIndex, reference: LexicalIndex) -> None:
+    assert np.array_equal(index.section_ids, reference.section_ids)
+    assert np.array_equal(index.lengths, reference.lengths)
+    for query in QUERIES:
+        for k, row_ranges in [(10, None), (5, np.array([[3, 40], [60, 61]]))]:
+            ids, scores = index.search(query, k, row_ranges)
+            expected_ids, expected_scores = reference.search(query, k, row_ranges)
+            assert ids.tolist() == expected_ids.tolist(), query
+            assert scores == pytest.approx(expected_scores, rel=1e-5), query
+
+def test_incremental_changes_match_full_rebuild(tmp_path):
+    rng = random.Random(3)
+    sections = {i: section(rng, i) for i in range(0, 400, 2)}
+    index = LexicalIndex.from_sections(sections[i] for i in sorted(sections))
+    next_id = 400
+    for step in range(300):
+        upserts, removed = [], []
+        choice = rng.random()
+        if choice < 0.3:
+            # Replace a section, possibly under another title
+            upserts = [section(rng, rng.choice(list(sections)), rng.choice("ABC"))]
+        elif choice < 0.6:
+            upserts = [section(rng, next_id + j) for j in range(rng.randint(1, 3))]
+            next_id += 5
+        elif choice < 0.7:
+            # Fill a gap between existing ids
+            upserts = [section(rng, rng.randrange(0, 400, 2) + 1)]
+        else:
+            removed = rng.sample(list(sections), min(len(sections), rng.randint(1, 4))) + [99999]
+        for sec in upserts:
+            sections[sec.section_id] = sec
+        for section_id in removed:
+            sections.pop(section_id, None)
+
+        index = index.with_changes(upserts, removed)
+        if step % 50 == 49:
+            path = tmp_path / str(step)
+            path.mkdir()
+            index.save(str(path))
+            index = LexicalIndex.load(str(path))
+        assert_same_ranking(index, LexicalIndex.from_sections(sections[i] for i in sorted(sections)))
+
+def test_emptied_index_can_be_refilled(tmp_path):
+    rng = random.Random(4)
+    index = LexicalIndex.from_sections(section(rng, i) for i in range(10))
+    index = index.with_changes(removed=range(10))
+    assert len(index) == 0
+    assert index.search("t1", 3)[0].size == 0
+
+    added = TermSection(section_id=20, content="t1 t2", title="A", start_idx=0, end_idx=5)
+    index = index.with_changes([added])
+    assert index.search("t1", 3)[0].tolist() == [20]
+
+    LexicalIndex.from_sections([]).save(str(tmp_path))
+    assert LexicalIndex.load(str(tmp_path)).terms == []
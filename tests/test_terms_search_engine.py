@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+from embeddings.fake import FakeEmbeddings
+from search.terms_search_engine import TermsSearchEngine
+
+def versions(root: str) -> list:
+    return [name for name in os.listdir(root) if name.startswith("v")] if os.path.isdir(root) else []
+
+def test_empty_or_failed_build_leaves_no_version_behind(tmp_path, monkeypatch):
+    engine = TermsSearchEngine(cache_dir=str(tmp_path / "cache"), embedding_model=FakeEmbeddings(16),
+                               index_type="flat", embedding_cache=False)
+    empty = tmp_path / "empty.md"
+    empty.write_text("")
+    engine.build_index(str(empty))
+    assert engine.index is None
+    assert versions(engine._state_root) == []
+
+    def fail(texts):
+        raise RuntimeError("embedding server down")
+    path = tmp_path / "doc.md"
+    path.write_text("**A**\nsome text\n")
+    monkeypatch.setattr(engine.embedding_model, "encode", fail)
+    with pytest.raises(RuntimeError):
+        engine.build_index(str(path))
+    assert versions(engine._state_root) == []
+
+def test_close_stops_the_threads_the_engine_started(tmp_path):
+    engine = TermsSearchEngine(cache_dir=str(tmp_path / "cache"), embedding_provider="fake", embedding_dimension=16,
+                               index_type="flat", embedding_batch_wait=0.002)
+    cache = engine.embedding_model
+    batcher = cache.provider
+    engine.embedding_model.encode(["warm up"])
+    engine._get_timeout_executor()
+    engine.close()
+    assert not batcher._dispatcher.is_alive()
+    assert cache._db is None
+    with pytest.raises(RuntimeError):
+        engine.executor.submit(print)
+
+def test_close_leaves_shared_model_and_pool_open(tmp_path):
+    owner = TermsSearchEngine(cache_dir=str(tmp_path / "cache"), embedding_provider="fake", embedding_dimension=16,
+                              index_type="flat", embedding_batch_wait=0.002)
+    shared = TermsSearchEngine(cache_dir=str(tmp_path / "cache"), embedding_model=owner.embedding_model,
+                               executor=owner.executor, index_type="flat")
+    shared.close()
+    assert owner.embedding_model.provider._dispatcher.is_alive()
+    owner.executor.submit(print).result()
+    owner.close()
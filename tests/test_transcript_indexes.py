@@ -0,0 +1,38 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from search.transcript_indexes import TranscriptIndexes
+
+def test_concurrent_adds_of_one_transcript_build_it_once():
+    started, release = threading.Event(), threading.Event()
+    builds = []
+
+    def build(utterances):
+        builds.append(utterances)
+        started.set()
+        release.wait(5)
+        return object()
+
+    indexes = TranscriptIndexes(build)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        first = pool.submit(indexes.add, "t1", ["hello"])
+        started.wait(5)
+        others = [pool.submit(indexes.add, "t1", ["hello"]) for _ in range(3)]
+        release.set()
+        engines = {id(future.result()) for future in [first, *others]}
+    assert len(builds) == 1
+    assert len(engines) == 1
+    assert "t1" in indexes
+
+def test_failed_build_is_not_kept():
+    def build(utterances):
+        raise RuntimeError("embedding server down")
+
+    indexes = TranscriptIndexes(build)
+    with pytest.raises(RuntimeError):
+        indexes.add("t1", [])
+    assert "t1" not in indexes
+    indexes.build = lambda utterances: "engine"
+    assert indexes.add("t1", []) == "engine"